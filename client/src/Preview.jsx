@@ -1,10 +1,48 @@
-import React from 'react'
+import React, { useEffect, useRef, useState } from 'react'
 
-export default function Preview({ videoUrl }) {
+const POLL_INTERVAL_MS = 1000
+
+// Browsers which play HLS natively start playing a job's playlist as soon as its first
+// segment is ready. Others play the joined MP4 once the whole job is done
+function canPlayHls() {
+  return document.createElement('video').canPlayType('application/vnd.apple.mpegurl') !== ''
+}
+
+export default function Preview({ job, baseUrl, onError }) {
+
+  const [streaming] = useState(canPlayHls)
+  const [status, setStatus] = useState(job.status)
+  const [resultUrl, setResultUrl] = useState(job.result_url)
+
+  // The latest onError, so polling never calls a stale one, without restarting the poll each render
+  const onErrorRef = useRef(onError)
+  useEffect(() => {
+    onErrorRef.current = onError
+  }, [onError])
+
+  // Poll the job until it is finished, for the download and for browsers which can't stream
+  useEffect(() => {
+    if (status === 'done' || status === 'failed') return
+    const timer = setInterval(() => {
+      fetch(new URL(job.status_url, baseUrl))
+        .then(response => response.json())
+        .then(body => {
+          setStatus(body.status)
+          if (body.result_url) setResultUrl(body.result_url)
+          if (body.status === 'failed') onErrorRef.current(body.error)
+        })
+        .catch(error => onErrorRef.current(error))
+    }, POLL_INTERVAL_MS)
+    return () => clearInterval(timer)
+  }, [job, status, baseUrl])
+
+  // A job already done when submitted was a cache hit, whose segments may have been evicted
+  const videoUrl = streaming && job.status !== 'done' && job.playlist_url ? new URL(job.playlist_url, baseUrl).href
+    : resultUrl ? new URL(resultUrl, baseUrl).href : ''
 
   function downloadAnimation() {
     const link = document.createElement('a');
-    link.href = videoUrl;
+    link.href = new URL(resultUrl, baseUrl).href;
     link.setAttribute('download', 'animation.mp4');
     document.body.appendChild(link);
     link.click();
@@ -13,12 +51,15 @@ export default function Preview({ videoUrl }) {
 
   return (
     <span className='preview-and-button'>
-      <video className='preview' width="480" height="360" controls>
-        <source src={videoUrl} type='video/mp4' />
-        Your browser does not support the video tag.
-      </video>
+      {videoUrl ? (
+        <video className='preview' width="480" height="360" src={videoUrl} controls autoPlay muted>
+          Your browser does not support the video tag.
+        </video>
+      ) : (
+        <div className='preview'>Rendering...</div>
+      )}
 
-      <button className='download-btn' onClick={downloadAnimation}>Download</button>
+      <button className='download-btn' onClick={downloadAnimation} disabled={!resultUrl}>Download</button>
     </span>
   )
 }
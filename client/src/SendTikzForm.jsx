@@ -14,7 +14,7 @@ export default function SendTikzForm() {
 
   const [stylesInput, setStylesInput] = useState('')
   const [inputs, setInputs] = useState({0: { tikz: '', subtitle: '' }})
-  const [videoUrl, setVideoUrl] = useState('')
+  const [job, setJob] = useState(null)
   const [errorMessage, setErrorMessage] = useState(false)
 
   function addInput() {
@@ -47,27 +47,19 @@ export default function SendTikzForm() {
   function handleSubmit(event) {
     event.preventDefault()
     setErrorMessage(false)
-    setVideoUrl('')
+    setJob(null)
 
-    fetch(BASE_URL + 'test/', {
+    // Queue the render as a job, so the preview can play its segments as they finish
+    fetch(BASE_URL + 'jobs/', {
       method: 'POST',
       body: JSON.stringify({stylesInput, 'diagrams': inputs}),
       headers: {'Content-type': 'application/json; charset=UTF-8'}
     })
-    .then(response => {
-      console.log(response.status)
-      // return response.json()
-      for (var pair of response.headers.entries()) {
-        if (pair[0] === 'content-type' && !pair[1]) setErrorMessage(true)
-      }
-      return response.blob()
-    })
-    // .then(data => console.log(data))
-    .then(videoBlob => {
-      // Create a link and click it to download the video
-      const url = window.URL.createObjectURL(new Blob([videoBlob]));
-      setVideoUrl(url)
-    })
+    .then(response => response.json().then(body => {
+      if (!response.ok) throw new Error(body.error)
+      return body
+    }))
+    .then(body => setJob(body))
     .catch(error => setErrorMessage(error))
   } 
 
@@ -130,8 +122,8 @@ export default function SendTikzForm() {
           <button className='submit-btn' onClick={handleSubmit}>Create animation</button>
         </fieldset>
 
-        {videoUrl && !errorMessage && (
-          <Preview videoUrl={videoUrl} />
+        {job && !errorMessage && (
+          <Preview key={job.id} job={job} baseUrl={BASE_URL} onError={error => setErrorMessage(error || true)} />
         )}
 
       </div>
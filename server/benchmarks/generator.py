@@ -0,0 +1,97 @@
+import random
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+"""
+Generate synthetic TikZiT sequences for benchmarking
+
+A sequence starts from a random diagram, and each later diagram moves some nodes and
+rewires some edges of the one before, like a series of lecture steps. Parameters:
+- num_nodes & num_edges - size of each diagram; edges may be parallel
+- compass_ratio - fraction of edge ends attached at a compass anchor such as (3.north east)
+- label_variety - fraction of nodes with a distinct label; the rest reuse labels
+- num_diagrams - length of the sequence
+- change_ratio - fraction of nodes moved & edges rewired between diagrams
+"""
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]
+\tikzstyle{red dot}=[fill=red, draw=black, shape=circle]
+\tikzstyle{green box}=[fill=green, draw=black, shape=rectangle, minimum width=1.5, minimum height=0.75]
+\tikzstyle{map}=[fill=white, draw=black, shape=morphism]
+\tikzstyle{small dot}=[fill=black, shape=dot]"""
+
+NODE_STYLES = ['white square', 'red dot', 'green box', 'map', 'small dot', 'none']
+
+COMPASS_ANCHORS = ['north', 'south', 'east', 'west', 'north east', 'north west', 'south east', 'south west']
+
+EDGE_OPTIONS = ['', '[in=180, out=0]', '[bend left=30]', '[bend right=45, looseness=1.25]', '[in=-90, out=90, looseness=0.75]']
+
+
+@dataclass
+class GeneratedDiagram:
+  # (id, style, x, y, label)
+  nodes: List[Tuple[int, str, float, float, str]] = field(default_factory=list)
+  # (start id, start anchor, end id, end anchor, options)
+  edges: List[Tuple[int, str, int, str, str]] = field(default_factory=list)
+
+
+def random_edge(rng: random.Random, num_nodes: int, compass_ratio: float):
+  def endpoint():
+    anchor = rng.choice(COMPASS_ANCHORS) if rng.random() < compass_ratio else ''
+    return rng.randrange(num_nodes), anchor
+  (start, start_anchor), (end, end_anchor) = endpoint(), endpoint()
+  return start, start_anchor, end, end_anchor, rng.choice(EDGE_OPTIONS)
+
+
+def random_position(rng: random.Random, width: int):
+  return round(rng.uniform(0, width) * 1.5, 2), round(-rng.uniform(0, width) * 1.5, 2)
+
+
+def generate_first_diagram(rng: random.Random, num_nodes: int, num_edges: int, compass_ratio: float, label_variety: float):
+  width = max(1, int(num_nodes ** 0.5))
+  num_labels = max(1, round(label_variety * num_nodes))
+  diagram = GeneratedDiagram()
+  for id in range(num_nodes):
+    style = NODE_STYLES[id % len(NODE_STYLES)]
+    label = '' if style in ('none', 'small dot') else f"$x_{{{id % num_labels}}}$"
+    diagram.nodes.append((id, style, *random_position(rng, width), label))
+  diagram.edges = [random_edge(rng, num_nodes, compass_ratio) for _ in range(num_edges)]
+  return diagram
+
+
+def next_diagram(rng: random.Random, diagram: GeneratedDiagram, compass_ratio: float, change_ratio: float):
+  """Move some nodes and rewire some edges of a diagram"""
+  num_nodes = len(diagram.nodes)
+  width = max(1, int(num_nodes ** 0.5))
+  nodes = list(diagram.nodes)
+  for index in rng.sample(range(num_nodes), int(num_nodes * change_ratio)):
+    id, style, _, _, label = nodes[index]
+    nodes[index] = (id, style, *random_position(rng, width), label)
+  edges = list(diagram.edges)
+  for index in rng.sample(range(len(edges)), int(len(edges) * change_ratio)):
+    edges[index] = random_edge(rng, num_nodes, compass_ratio)
+  return GeneratedDiagram(nodes, edges)
+
+
+def to_tikz(diagram: GeneratedDiagram) -> str:
+  def location(id, anchor):
+    return f"({id}.{anchor})" if anchor else f"({id})"
+
+  node_lines = [f"\t\t\\node [style={style}] ({id}) at ({x}, {y}) {{{label}}};" for id, style, x, y, label in diagram.nodes]
+  edge_lines = [f"\t\t\\draw {options} {location(start, start_anchor)} to {location(end, end_anchor)};".replace('  ', ' ')
+                for start, start_anchor, end, end_anchor, options in diagram.edges]
+  return ("\\begin{tikzpicture}\n\t\\begin{pgfonlayer}{nodelayer}\n" + "\n".join(node_lines) + "\n\t\\end{pgfonlayer}\n"
+          + "\t\\begin{pgfonlayer}{edgelayer}\n" + "\n".join(edge_lines) + "\n\t\\end{pgfonlayer}\n\\end{tikzpicture}\n")
+
+
+def generate_sequence(num_nodes: int, num_edges: int, compass_ratio: float = 0.25, label_variety: float = 0.5,
+                      num_diagrams: int = 5, change_ratio: float = 0.1, seed: int = 0):
+  """Return (styles, TikZ of each diagram) for a reproducible random sequence"""
+  rng = random.Random(seed)
+  diagram = generate_first_diagram(rng, num_nodes, num_edges, compass_ratio, label_variety)
+  diagrams = [diagram]
+  for _ in range(num_diagrams - 1):
+    diagram = next_diagram(rng, diagram, compass_ratio, change_ratio)
+    diagrams.append(diagram)
+  return STYLES, [to_tikz(diagram) for diagram in diagrams]
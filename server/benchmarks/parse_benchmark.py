@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ebdjango.source.TikzParser import TikzParser
+
+"""
+Time TikzParser on large generated diagrams and on input which used to make the
+old regular expressions backtrack
+
+Run from the server directory:
+  python benchmarks/parse_benchmark.py [number of nodes ...]
+"""
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]
+\tikzstyle{red dot}=[fill=red, draw=black, shape=circle]"""
+
+
+def generate_diagram(num_nodes: int) -> str:
+  """A grid of nodes, each joined to its right & lower neighbour"""
+  width = max(1, int(num_nodes ** 0.5))
+  node_lines = []
+  edge_lines = []
+  for i in range(num_nodes):
+    x, y = i % width, i // width
+    style = 'white square' if i % 2 else 'red dot'
+    node_lines.append(f"\t\t\\node [style={style}] ({i}) at ({x * 1.5}, {-y * 1.5}) {{${i}$}};")
+    if x + 1 < width and i + 1 < num_nodes:
+      edge_lines.append(f"\t\t\\draw [in=180, out=0, looseness=0.75] ({i}) to ({i + 1});")
+    if i + width < num_nodes:
+      edge_lines.append(f"\t\t\\draw [bend left=30] ({i}.south) to ({i + width}.center);")
+  return ("\\begin{pgfonlayer}{nodelayer}\n" + "\n".join(node_lines) + "\n\t\\end{pgfonlayer}\n"
+          + "\\begin{pgfonlayer}{edgelayer}\n" + "\n".join(edge_lines) + "\n\t\\end{pgfonlayer}")
+
+
+def generate_pathological(length: int) -> str:
+  """A nearly valid draw and node, each repeating a fragment length times
+
+  The old greedy regular expressions backtracked for minutes on these at length 500"""
+  return ("\\draw (" + "a) to (" * length + "b) x;\n"
+          + "\\node [" + "a] (b) at (c) {" * length + "\n")
+
+
+def time_parse(tikz: str, repeats: int = 3) -> float:
+  """Best of several runs, in seconds"""
+  best = float('inf')
+  for _ in range(repeats):
+    start = time.perf_counter()
+    TikzParser.parse_tikz_diagram(tikz, STYLES)
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+if __name__ == '__main__':
+  sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000]
+  for num_nodes in sizes:
+    tikz = generate_diagram(num_nodes)
+    diagram = TikzParser.parse_tikz_diagram(tikz, STYLES)
+    seconds = time_parse(tikz)
+    print(f"{num_nodes:>7} nodes {len(diagram.lines):>7} lines {len(tikz) / 1e6:7.2f} MB  {seconds * 1000:9.1f} ms")
+  for length in sizes:
+    seconds = time_parse(generate_pathological(length))
+    print(f"{length:>7} pathological repeats              {seconds * 1000:9.1f} ms")
@@ -0,0 +1,196 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generator import generate_sequence
+from ebdjango.source.TikzParser import TikzParser
+from ebdjango.source.TransitionPlanner import line_keys, plan_line_transitions, plan_node_transitions
+
+"""
+Benchmark each stage of turning TikZ into an animation, on generated sequences
+
+Benchmarks, each run on every size:
+- parse       - TikzParser.parse_tikz_diagram on every diagram
+- plan        - TransitionPlanner matching nodes & lines between every pair of diagrams
+- convert     - TikzToManimConverter on every diagram                       (needs Manim)
+- diagram     - Diagram construction, i.e. mobjects & labels                (needs Manim)
+- transitions - DiagramScene.get_transitions_between_lines & _nodes         (needs Manim)
+- render      - render_animation at draft quality, small sequences only    (needs Manim, LaTeX & ffmpeg)
+Benchmarks whose dependencies are missing are reported as skipped.
+
+Results are written as JSON. Given a baseline from an earlier run, any benchmark whose
+median time grew by more than the tolerance is reported, and the exit code is 1.
+
+Run from the server directory:
+  python benchmarks/run_benchmarks.py [--sizes small,medium] [--output results.json] [--baseline baseline.json]
+"""
+
+SIZES = {
+  'small': dict(num_nodes=20, num_edges=30, num_diagrams=5),
+  'medium': dict(num_nodes=200, num_edges=300, num_diagrams=10),
+  'large': dict(num_nodes=2000, num_edges=3000, num_diagrams=10),
+}
+
+# Rendering takes seconds per diagram, so only small sequences are rendered
+RENDER_SIZES = {'small'}
+
+
+def measure(benchmark, repeats: int):
+  """Median & best of several runs of benchmark(), in seconds"""
+  times = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    benchmark()
+    times.append(time.perf_counter() - start)
+  return {'median': statistics.median(times), 'min': min(times), 'repeats': repeats}
+
+
+def parse_benchmark(styles, tikz_list):
+  return lambda: [TikzParser.parse_tikz_diagram(tikz, styles) for tikz in tikz_list]
+
+
+def location_id(location):
+  """The endpoint id TikzToManimConverter gives a parsed line end"""
+  if location.type == 'compass':
+    return f"{location.location['id']}.{location.location['direction']}"
+  return str(location.location)
+
+
+def plan_benchmark(styles, tikz_list):
+  diagrams = [TikzParser.parse_tikz_diagram(tikz, styles) for tikz in tikz_list]
+  node_ids = [[node.id for node in diagram.nodes] for diagram in diagrams]
+  keys = [line_keys((location_id(line.start_loc), location_id(line.end_loc)) for line in diagram.lines) for diagram in diagrams]
+
+  def benchmark():
+    for i in range(1, len(diagrams)):
+      plan_node_transitions(node_ids[i - 1], node_ids[i])
+      plan_line_transitions(keys[i - 1], keys[i])
+  return benchmark
+
+
+def convert_benchmark(styles, tikz_list):
+  from ebdjango.source.DiagramAnim import convert_diagrams
+  pairs = [(tikz, styles) for tikz in tikz_list]
+  return lambda: convert_diagrams(pairs, False)
+
+
+def diagram_benchmark(styles, tikz_list):
+  from ebdjango.source.DiagramAnim import Diagram, convert_diagrams
+  converters = convert_diagrams([(tikz, styles) for tikz in tikz_list], False)
+  return lambda: [Diagram(converter, {'subtitle': ''}) for converter in converters]
+
+
+def transitions_benchmark(styles, tikz_list):
+  from ebdjango.source.DiagramAnim import Diagram, DiagramScene, convert_diagrams
+  converters = convert_diagrams([(tikz, styles) for tikz in tikz_list], False)
+  diagrams = [Diagram(converter, {'subtitle': ''}) for converter in converters]
+  scene = DiagramScene([])
+
+  def benchmark():
+    for i in range(1, len(diagrams)):
+      scene.get_transitions_between_lines(diagrams[i - 1], diagrams[i])
+      scene.get_transitions_between_nodes(diagrams[i - 1], diagrams[i])
+  return benchmark
+
+
+def render_benchmark(styles, tikz_list):
+  from ebdjango.source.RunDiagramAnim import render_animation
+  from ebdjango.source.Workspace import render_workspace
+  extra_info = {id: {'subtitle': ''} for id in range(len(tikz_list))}
+
+  def benchmark():
+    with render_workspace() as workspace:
+      render_animation('tikzit', styles, tikz_list, extra_info, media_dir=workspace, quality='draft')
+  return benchmark
+
+
+BENCHMARKS = [
+  ('parse', parse_benchmark, None),
+  ('plan', plan_benchmark, None),
+  ('convert', convert_benchmark, None),
+  ('diagram', diagram_benchmark, None),
+  ('transitions', transitions_benchmark, None),
+  ('render', render_benchmark, RENDER_SIZES),
+]
+
+
+def run(sizes, repeats: int, only=None):
+  results = {}
+  skipped = {}
+  for size in sizes:
+    styles, tikz_list = generate_sequence(**SIZES[size])
+    for name, create_benchmark, benchmark_sizes in BENCHMARKS:
+      if only and name not in only: continue
+      if benchmark_sizes is not None and size not in benchmark_sizes: continue
+      key = f"{name}/{size}"
+      try:
+        benchmark = create_benchmark(styles, tikz_list)
+        results[key] = measure(benchmark, repeats if name != 'render' else 1)
+      except ImportError as error:
+        skipped[key] = str(error)
+        continue
+      print(f"{key:<22} {results[key]['median'] * 1000:10.2f} ms median  {results[key]['min'] * 1000:10.2f} ms best")
+  for key, reason in skipped.items():
+    print(f"{key:<22} skipped: {reason}")
+  return results, skipped
+
+
+def compare(results, baseline, tolerance: float):
+  """Return the benchmarks which got slower than the baseline by more than tolerance"""
+  regressions = []
+  for key, result in sorted(results.items()):
+    if key not in baseline: continue
+    ratio = result['median'] / baseline[key]['median'] if baseline[key]['median'] > 0 else 1
+    flag = 'REGRESSION' if ratio > 1 + tolerance else ''
+    print(f"{key:<22} {ratio:6.2f}x baseline {flag}")
+    if flag: regressions.append(key)
+  return regressions
+
+
+def main(args):
+  parser = argparse.ArgumentParser(description="Benchmark TikZ to animation stages on generated sequences")
+  parser.add_argument('--sizes', default='small,medium', help=f"comma separated, from: {', '.join(SIZES)}")
+  parser.add_argument('--only', help="comma separated benchmark names to run")
+  parser.add_argument('--repeats', type=int, default=5)
+  parser.add_argument('--output', help="write results to this JSON file")
+  parser.add_argument('--baseline', help="compare against results from an earlier run")
+  parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before flagging, as a fraction")
+  options = parser.parse_args(args)
+
+  sizes = options.sizes.split(',')
+  unknown_sizes = [size for size in sizes if size not in SIZES]
+  if unknown_sizes:
+    parser.error(f"unknown sizes: {', '.join(unknown_sizes)}")
+  only = set(options.only.split(',')) if options.only else None
+
+  results, skipped = run(sizes, options.repeats, only)
+  if options.output:
+    with open(options.output, 'w') as output_file:
+      json.dump({
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+        'skipped': skipped,
+      }, output_file, indent=2, sort_keys=True)
+
+  if options.baseline:
+    with open(options.baseline, 'r') as baseline_file:
+      baseline = json.load(baseline_file)['results']
+    regressions = compare(results, baseline, options.tolerance)
+    if regressions:
+      print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+      return 1
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,37 @@
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ebdjango.source.TransitionPlanner import line_keys, plan_line_transitions
+
+"""
+Time line transition planning between two large diagrams which share most of their lines
+
+Run from the server directory:
+  python benchmarks/transition_benchmark.py [number of lines ...]
+"""
+
+
+def generate_line_pairs(num_lines: int, num_nodes: int, seed: int):
+  """Random (start id, end id) pairs, including parallel lines"""
+  rng = random.Random(seed)
+  return [(str(rng.randrange(num_nodes)), str(rng.randrange(num_nodes))) for _ in range(num_lines)]
+
+
+if __name__ == '__main__':
+  sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+  for num_lines in sizes:
+    num_nodes = max(2, num_lines // 4)
+    old_pairs = generate_line_pairs(num_lines, num_nodes, seed=1)
+    # Rewire a tenth of the lines
+    new_pairs = old_pairs[:num_lines - num_lines // 10] + generate_line_pairs(num_lines // 10, num_nodes, seed=2)
+    old_keys, new_keys = line_keys(old_pairs), line_keys(new_pairs)
+
+    start = time.perf_counter()
+    plan = plan_line_transitions(old_keys, new_keys)
+    seconds = time.perf_counter() - start
+    print(f"{num_lines:>7} lines  kept {len(plan.kept):>7}  matched {len(plan.matched):>6}  "
+          f"removed {len(plan.removed):>6}  added {len(plan.added):>6}  {seconds * 1000:8.1f} ms")
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -135,3 +136,99 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Render workspaces
+# Each render writes into its own temporary directory under this root
+
+RENDER_WORKSPACE_ROOT = BASE_DIR / 'media' / 'workspaces'
+
+# Compiled Tex label and subtitle SVGs, shared by every render so each label is compiled once
+
+LABEL_CACHE_DIR = BASE_DIR / 'media' / 'labels'
+
+
+# Render cache
+# Finished animations are stored by request hash and evicted least recently used first
+
+RENDER_CACHE_DIR = BASE_DIR / 'render_cache'
+
+RENDER_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+RENDER_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+
+# Segment cache
+# Each hold and transition of an animation is cached separately, so editing one diagram
+# only re-renders the segments which show it
+
+RENDER_SEGMENT_CACHE_DIR = BASE_DIR / 'segment_cache'
+
+RENDER_SEGMENT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+
+RENDER_SEGMENT_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Segments remuxed to MPEG-TS for HLS streaming are kept alongside them, up to this many bytes
+
+RENDER_STREAM_CACHE_MAX_BYTES = 1024 ** 3
+
+
+# Render jobs
+# Asynchronous renders run on a pool of RENDER_WORKERS warm processes; at most RENDER_QUEUE_LIMIT
+# jobs, including renders which /test/ requests wait on, may be queued or running per web process
+# before new ones are refused.
+# A worker is replaced after RENDER_WORKER_MAX_JOBS jobs or once it uses RENDER_WORKER_MAX_MEMORY bytes
+# Every web process starts its own pool (see wsgi.py), so the host's CPUs are divided between the
+# RENDER_WEB_PROCESSES web processes - gunicorn's worker count, which it reads from WEB_CONCURRENCY.
+# Set WEB_CONCURRENCY to match gunicorn's --workers, or the host runs that many times too many renders
+
+RENDER_JOBS_DIR = BASE_DIR / 'media' / 'jobs'
+
+RENDER_WEB_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+RENDER_WORKERS = max(1, (os.cpu_count() or 1) // RENDER_WEB_PROCESSES)
+
+RENDER_QUEUE_LIMIT = 64
+
+RENDER_WORKER_MAX_JOBS = 50
+
+RENDER_WORKER_MAX_MEMORY = 1024 ** 3
+
+# Render the segments of each animation as separate tasks on the worker pool, so one animation
+# uses every worker, rather than rendering each animation on a single worker
+
+RENDER_PARALLEL = True
+
+
+# Addresses of the load balancers and proxies in front of the server. X-Forwarded-For is only
+# used to tell clients apart when a request comes from one of these, as clients can forge it
+
+TRUSTED_PROXIES = []
+
+
+# Render limits
+# Each request's cost is estimated from its parsed diagrams before anything is rendered, and a
+# request over any of these limits is refused with 413; None turns a limit off.
+# Nodes and frames are totals over every diagram of a request, and frames are of the finished
+# video. Cost is in RenderCost's units: roughly one mobject drawn once at the default quality
+
+RENDER_MAX_DIAGRAMS = 100
+
+RENDER_MAX_NODES = 20000
+
+RENDER_MAX_FRAMES = 5 * 60 * 60
+
+RENDER_MAX_LABELS = 2000
+
+RENDER_MAX_COST = 20_000_000
+
+# Bytes of a request's style sheet and TikZ, checked along with RENDER_MAX_DIAGRAMS before any
+# diagram is parsed
+
+RENDER_MAX_INPUT_BYTES = 4 * 1024 ** 2
+
+
+# Render batches
+# A batch renders many sequences which share one style sheet, up to RENDER_BATCH_LIMIT per batch
+
+RENDER_BATCHES_DIR = BASE_DIR / 'media' / 'batches'
+
+RENDER_BATCH_LIMIT = 1000
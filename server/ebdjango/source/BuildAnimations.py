@@ -0,0 +1,210 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Dict, List
+
+from .RenderCache import RenderCache, request_key
+from .RenderQuality import DEFAULT_QUALITY, QUALITY_TIERS
+
+"""
+BuildAnimations renders a whole set of animation sequences, like a build tool
+
+Sequences come from either:
+- a JSON manifest:
+    {"styles": "course.tikzstyles", "quality": "low",
+     "sequences": [{"name": "lecture-1", "tikz": ["a.tikz", "b.tikz"], "subtitles": ["", "Step 2"]}, ...]}
+  where each sequence may also set its own "styles" and "quality", and paths are relative to the manifest
+- a directory, where each subdirectory is a sequence of its .tikz files in name order, using
+  the .tikzstyles file in the subdirectory or else the one in the directory itself
+
+Each output is <output>/<name>.mp4. The content hash of a sequence's inputs (TikZ, styles,
+subtitles and quality) is recorded in <output>/.build-state.json when it is built, and the
+sequence is skipped next time unless that hash changes. Holds and transitions are cached in
+<output>/.segments, so after editing one diagram only the segments showing it are rendered.
+
+Run from the server directory:
+  python -m ebdjango.source.RunDiagramAnim build MANIFEST_OR_DIRECTORY [-o OUTPUT] [-j N] [--quality Q] [--force]
+"""
+
+BUILD_STATE_FILE = '.build-state.json'
+SEGMENT_CACHE_DIR = '.segments'
+LABEL_CACHE_DIR = '.labels'
+
+# Segments of a build are kept until the cache passes this size, however old they are
+SEGMENT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+SEGMENT_CACHE_MAX_AGE = float('inf')
+
+
+@dataclass
+class Sequence:
+  name: str
+  style_content: str
+  tikz_contents_list: List[str]
+  extra_info: Dict[int, Dict]
+  quality: str
+
+  def key(self) -> str:
+    return request_key(self.style_content, self.tikz_contents_list, self.extra_info, self.quality)
+
+
+def read_file(path: str) -> str:
+  with open(path, 'r') as file:
+    return file.read()
+
+
+def create_sequence(name: str, style_path: str, tikz_paths: List[str], subtitles: List[str], quality: str) -> Sequence:
+  if not tikz_paths:
+    raise Exception("Sequence has no TikZ files:", name)
+  subtitles = list(subtitles) + [''] * (len(tikz_paths) - len(subtitles))
+  extra_info = {id: {'subtitle': subtitle} for id, subtitle in enumerate(subtitles[:len(tikz_paths)])}
+  return Sequence(name, read_file(style_path), [read_file(path) for path in tikz_paths], extra_info, quality)
+
+
+def read_manifest(manifest_path: str, default_quality: str) -> List[Sequence]:
+  root = os.path.dirname(os.path.abspath(manifest_path))
+  with open(manifest_path, 'r') as manifest_file:
+    manifest = json.load(manifest_file)
+
+  sequences = []
+  for number, entry in enumerate(manifest['sequences']):
+    style_path = entry.get('styles', manifest.get('styles'))
+    if style_path is None:
+      raise Exception("Sequence has no style file:", entry.get('name', number))
+    sequences.append(create_sequence(
+      str(entry.get('name', number)),
+      os.path.join(root, style_path),
+      [os.path.join(root, tikz_path) for tikz_path in entry['tikz']],
+      entry.get('subtitles', []),
+      entry.get('quality', manifest.get('quality', default_quality)),
+    ))
+  return sequences
+
+
+def find_style_file(directory: str):
+  style_paths = sorted(glob.glob(os.path.join(directory, '*.tikzstyles')))
+  return style_paths[0] if style_paths else None
+
+
+def read_directory(directory: str, quality: str) -> List[Sequence]:
+  shared_style_path = find_style_file(directory)
+  sequences = []
+  for name in sorted(os.listdir(directory)):
+    sequence_dir = os.path.join(directory, name)
+    if not os.path.isdir(sequence_dir) or name.startswith('.'): continue
+    tikz_paths = sorted(glob.glob(os.path.join(sequence_dir, '*.tikz')))
+    if not tikz_paths: continue
+    style_path = find_style_file(sequence_dir) or shared_style_path
+    if style_path is None:
+      raise Exception("Sequence has no style file:", name)
+    sequences.append(create_sequence(name, style_path, tikz_paths, [], quality))
+  return sequences
+
+
+def read_build_state(output_dir: str) -> Dict[str, str]:
+  try:
+    with open(os.path.join(output_dir, BUILD_STATE_FILE), 'r') as state_file:
+      return json.load(state_file)
+  except FileNotFoundError:
+    return {}
+
+
+def write_build_state(output_dir: str, state: Dict[str, str]):
+  fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+  with os.fdopen(fd, 'w') as tmp_file:
+    json.dump(state, tmp_file, indent=2, sort_keys=True)
+  os.replace(tmp_path, os.path.join(output_dir, BUILD_STATE_FILE))
+
+
+def output_path(output_dir: str, sequence: Sequence) -> str:
+  return os.path.join(output_dir, sequence.name + '.mp4')
+
+
+def build_sequence(sequence: Sequence, output_dir: str) -> str:
+  """Render one sequence into the output directory, in a build worker process"""
+  from .RunDiagramAnim import render_animation_segmented
+  from .Workspace import render_workspace
+
+  segment_cache = RenderCache(os.path.join(output_dir, SEGMENT_CACHE_DIR), SEGMENT_CACHE_MAX_BYTES, SEGMENT_CACHE_MAX_AGE)
+  with render_workspace() as workspace:
+    video_path = render_animation_segmented('tikzit', sequence.style_content, sequence.tikz_contents_list, sequence.extra_info,
+                                            segment_cache, media_dir=workspace, label_dir=os.path.join(output_dir, LABEL_CACHE_DIR),
+                                            quality=sequence.quality)
+    destination = output_path(output_dir, sequence)
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    # Copied beside the destination first, so an interrupted build never leaves a partial video
+    tmp_path = destination + '.tmp'
+    shutil.copyfile(video_path, tmp_path)
+    os.replace(tmp_path, destination)
+  return destination
+
+
+def build(sequences: List[Sequence], output_dir: str, jobs: int, force: bool = False) -> int:
+  """Render every sequence whose inputs changed since the last build, returning the number which failed"""
+  os.makedirs(output_dir, exist_ok=True)
+  state = read_build_state(output_dir)
+
+  names = [sequence.name for sequence in sequences]
+  duplicates = sorted({name for name in names if names.count(name) > 1})
+  if duplicates:
+    raise Exception("Sequence names must be unique:", duplicates)
+
+  to_build = []
+  for sequence in sequences:
+    if not force and state.get(sequence.name) == sequence.key() and os.path.exists(output_path(output_dir, sequence)):
+      print(f"up to date  {sequence.name}")
+    else:
+      to_build.append(sequence)
+  if not to_build:
+    return 0
+
+  failures = 0
+  start = time.perf_counter()
+  # Spawned, as Manim's global state must not be shared between renders
+  with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+    futures = {executor.submit(build_sequence, sequence, output_dir): sequence for sequence in to_build}
+    for future in as_completed(futures):
+      sequence = futures[future]
+      try:
+        future.result()
+      except Exception as error:
+        failures += 1
+        state.pop(sequence.name, None)
+        print(f"failed      {sequence.name}: {error}")
+      else:
+        state[sequence.name] = sequence.key()
+        print(f"built       {sequence.name}")
+      # Saved after every sequence, so an interrupted build keeps what it finished
+      write_build_state(output_dir, state)
+
+  print(f"{len(to_build) - failures} built, {failures} failed, {len(sequences) - len(to_build)} up to date "
+        f"in {time.perf_counter() - start:.1f}s")
+  return failures
+
+
+def main(args: List[str]) -> int:
+  parser = argparse.ArgumentParser(prog='RunDiagramAnim build', description="Render every changed animation sequence")
+  parser.add_argument('source', help="JSON manifest, or directory with one subdirectory per sequence")
+  parser.add_argument('-o', '--output', default='build', help="directory for the rendered videos (default: build)")
+  parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="sequences to render at once")
+  parser.add_argument('--quality', choices=list(QUALITY_TIERS), default=DEFAULT_QUALITY,
+                      help="quality tier, unless a manifest sets one")
+  parser.add_argument('--force', action='store_true', help="rebuild sequences even if they are up to date")
+  options = parser.parse_args(args)
+
+  if os.path.isdir(options.source):
+    sequences = read_directory(options.source, options.quality)
+  else:
+    sequences = read_manifest(options.source, options.quality)
+  return 1 if build(sequences, options.output, max(1, options.jobs), options.force) else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
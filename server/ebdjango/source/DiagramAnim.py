@@ -1,16 +1,67 @@
 import math
-from typing import Dict, List, Sequence, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from manim import *
 from manim.camera.camera import Camera
 
 from .TikzParser import TikzParser
-from .TikzToManim import ManimInputLine, ManimInputNode, TikzToManimConverter
+from .TikzToManim import ManimInputLine, ManimInputNode, TikzToManimConverter, compile_style_sheet
 from .Nodes import create_shape, Node
+from .LabelCache import cached_text, precompile_tex
+from .TransitionPlanner import LineKey, line_keys
+from .DiagramDiff import DiagramDiff, ElementDiff, diff_lines, diff_nodes
+from .DiagramCache import diagram_key, load_diagram, store_diagram
+from .Timing import span
 
 
 MANIM_X_LIMIT = 6
 MANIM_Y_LIMIT = 3
 
+# Manim units around where an animated mobject can be, covering stroke width & antialiasing
+ANIMATED_REGION_MARGIN = 0.1
+
+
+def convert_diagrams(tikz_and_style_pairs, reserve_subtitle_space: bool) -> List[TikzToManimConverter]:
+  """Convert each TikZ diagram into Manim coordinates & props, all fitted into the same frame"""
+  manim_x_limits = [-MANIM_X_LIMIT, MANIM_X_LIMIT]
+  manim_y_limits = [-MANIM_Y_LIMIT, MANIM_Y_LIMIT]
+  if reserve_subtitle_space:
+    manim_y_limits[0] += 1
+
+  converters = []
+  for test_tikz, test_styles in tikz_and_style_pairs:
+    # Compiled once per style sheet and shared by every diagram using it
+    with span('parse'):
+      style_sheet = compile_style_sheet(test_styles)
+    # Converted once, then shared through the diagram cache if there is one
+    key = diagram_key(test_tikz, test_styles, manim_x_limits, manim_y_limits)
+    packed = load_diagram(key)
+    if packed is not None:
+      with span('convert'):
+        converters.append(TikzToManimConverter.from_packed(packed, style_sheet))
+      continue
+    with span('parse'):
+      tikz_diagram = TikzParser.parse_tikz_diagram(test_tikz, style_sheet.styles)
+    with span('convert'):
+      converter = TikzToManimConverter(tikz_diagram, manim_x_limits, manim_y_limits, style_sheet)
+    store_diagram(key, converter.pack())
+    converters.append(converter)
+  return converters
+
+
+def node_labels(converters: List[TikzToManimConverter]) -> List[Tuple[str, str]]:
+  """(tex, color) of every node label, as Node compiles them"""
+  return [(node.label, node.props.get('tex_color', BLACK)) for converter in converters for node in converter.nodes]
+
+
+def precompile_labels(tikz_and_style_pairs):
+  """Compile every distinct label of some diagrams at once, before any scene needs them"""
+  precompile_tex(node_labels(convert_diagrams(tikz_and_style_pairs, False)))
+
+
+def bounding_boxes(point_arrays: List[np.ndarray]) -> np.ndarray:
+  """[min x, min y, max x, max y] of each array of points"""
+  return np.array([[*points[:, :2].min(axis=0), *points[:, :2].max(axis=0)] for points in point_arrays]).reshape(-1, 4)
+
 
 class Diagram(VGroup):
   def __init__(self, tikz_to_manim_converter: TikzToManimConverter, diagram_info, **kwargs):
@@ -18,8 +69,13 @@ class Diagram(VGroup):
     self.LINE_LAYER = 0
     self.NODE_LAYER = 1
     self.node_ids: Dict[str, Node] = {}
-    self.line_ids: Dict[Tuple[str, str], CubicBezier] = {}
+    # Keyed by (start id, end id, k) so parallel lines between two nodes are all kept
+    self.line_ids: Dict[LineKey, CubicBezier] = {}
+    # What each element was created from, for diffing against other diagrams
+    self.node_data: Dict[str, ManimInputNode] = {}
+    self.line_points: Dict[LineKey, np.ndarray] = {}
     self.subtitle = None
+    self.subtitle_text = diagram_info['subtitle']
     self.create_lines(tikz_to_manim_converter.lines)
     self.create_nodes(tikz_to_manim_converter.nodes)
     self.create_subtitle(diagram_info['subtitle'])
@@ -31,20 +87,23 @@ class Diagram(VGroup):
       shape.move_to(node.position)
       shape.set_z_index(self.NODE_LAYER)
       self.node_ids[node.id] = shape
+      self.node_data[node.id] = node
       self.add(shape)
 
 
   def create_lines(self, lines: List[ManimInputLine]):
-    for line in lines:
+    keys = line_keys((line.start_id, line.end_id) for line in lines)
+    for key, line in zip(keys, lines):
       bezier = CubicBezier(*line.curve_points, color=BLACK)
       bezier.set_z_index(self.LINE_LAYER)
-      self.line_ids[(line.start_id, line.end_id)] = bezier
+      self.line_ids[key] = bezier
+      self.line_points[key] = line.curve_points
       self.add(bezier)
 
 
   def create_subtitle(self, subtitle_text):
     if len(subtitle_text) > 0:
-      subtitle = Text(subtitle_text, color=BLACK)
+      subtitle = cached_text(subtitle_text, color=BLACK)
       subtitle.move_to(DOWN * MANIM_Y_LIMIT)
       self.subtitle = subtitle
       self.add(subtitle)
@@ -52,119 +111,204 @@ class Diagram(VGroup):
 
 
 class DiagramScene(Scene):
-  def __init__(self, tikz_and_style_pairs, extra_info=[{}], **kwargs):
+  def __init__(self, tikz_and_style_pairs, extra_info=[{}], hold_time=1, transition_time=1, reserve_subtitle_space=None, **kwargs):
     super().__init__(**kwargs)
     self.tikz_and_style_pairs = tikz_and_style_pairs
     self.extra_info = extra_info
+    # Whether to make space at the bottom for subtitles - if None, only when some diagram has one
+    self.reserve_subtitle_space = reserve_subtitle_space
+    # Seconds each diagram is shown for, and each transition takes
+    self.hold_time = hold_time
+    self.transition_time = transition_time
+    self.diagrams: Optional[List[Diagram]] = None
 
 
-  def get_transitions_between_nodes(self, diagram1: Diagram, diagram2: Diagram):
+  def diff_diagrams(self, diagram1: Diagram, diagram2: Diagram) -> DiagramDiff:
+    return DiagramDiff(
+      diff_nodes(diagram1.node_data, diagram2.node_data),
+      diff_lines(diagram1.line_points, diagram2.line_points),
+      diagram1.subtitle_text == diagram2.subtitle_text,
+    )
+
+
+  def get_transitions_between_nodes(self, diagram1: Diagram, diagram2: Diagram, diff: ElementDiff = None):
     """Create transitions between nodes of two diagrams
     
+    Nodes which moved or were restyled transform into their new selves.
     Any nodes in first but not second will fade out.
-    Any nodes in second but not in first will fade in."""
-    transitions = []
-    for node1_id, node1 in diagram1.node_ids.items():
-      node2 = diagram2.node_ids.get(node1_id, 0)
-      # Nodes which are in both diagrams
-      if node2 != 0:
-        transitions.append(ReplacementTransform(node1, node2))
-      # Nodes which are only in diagram 1
-      else:
-        transitions.append(FadeOut(node1))
-
-    # Nodes which are only in diagram 2
-    remaining_node_ids = set(diagram2.node_ids) - set(diagram1.node_ids)
-    for node_id in remaining_node_ids:
-      node = diagram2.node_ids[node_id]
-      transitions.append(FadeIn(node))
-
+    Any nodes in second but not in first will fade in.
+    Unchanged nodes are not animated."""
+    if diff is None: diff = diff_nodes(diagram1.node_data, diagram2.node_data)
+    transitions = [ReplacementTransform(diagram1.node_ids[id1], diagram2.node_ids[id2]) for id1, id2 in diff.changed]
+    transitions += [FadeOut(diagram1.node_ids[id]) for id in diff.removed]
+    transitions += [FadeIn(diagram2.node_ids[id]) for id in diff.added]
     return transitions
-  
 
-  def find_line_with_shared_point(self, line_id, end_index, other_line_ids):
-    """Find another line which shares an endpoint with the first line
-    
-    end_index of 0 looks for shared start point
-    end_index of 1 looks for shared end point"""
-    for other_line_id in other_line_ids:
-      if other_line_id[end_index] == line_id[end_index]:
-        return other_line_id
-    return None
-  
 
-  def get_transitions_between_lines(self, diagram1: Diagram, diagram2: Diagram):
-    transitions = []
-    line_ids_to_remove = []
-    for line1_id, line1 in diagram1.line_ids.items():
-      line2 = diagram2.line_ids.get(line1_id, 0)
-      # Lines which are in both diagrams
-      if line2 != 0:
-        transitions.append(ReplacementTransform(line1, line2))
-      # Lines which are only in diagram 1
-      else:
-        line_ids_to_remove.append(line1_id)
-
-    # Lines which are only in diagram 2
-    line_ids_to_add = set(diagram2.line_ids) - set(diagram1.line_ids)
-
-    # Look for lines with same start point to transition to - if none, those with same endpoint
-    for endpoint_index in [0, 1]:
-      for line_id_to_remove in line_ids_to_remove:
-        line_id_to_add = self.find_line_with_shared_point(line_id_to_remove, endpoint_index, line_ids_to_add)
-        if line_id_to_add:
-          transitions.append(ReplacementTransform(diagram1.line_ids[line_id_to_remove], diagram2.line_ids[line_id_to_add]))
-          line_ids_to_add.remove(line_id_to_add)
-          line_ids_to_remove.remove(line_id_to_remove)
-    
-    transitions += [FadeOut(diagram1.line_ids[line_id]) for line_id in line_ids_to_remove]
-    transitions += [Create(diagram2.line_ids[line_id]) for line_id in line_ids_to_add]
+  def get_transitions_between_lines(self, diagram1: Diagram, diagram2: Diagram, diff: ElementDiff = None):
+    """Create transitions between lines of two diagrams
 
+    Lines in both diagrams transform into each other. Other lines in the first diagram
+    transform into a new line sharing their start point, or failing that their end point.
+    Unmatched lines fade out or are created. Lines whose curve is unchanged are not animated."""
+    if diff is None: diff = diff_lines(diagram1.line_points, diagram2.line_points)
+    transitions = [ReplacementTransform(diagram1.line_ids[key1], diagram2.line_ids[key2]) for key1, key2 in diff.changed]
+    transitions += [FadeOut(diagram1.line_ids[key]) for key in diff.removed]
+    transitions += [Create(diagram2.line_ids[key]) for key in diff.added]
     return transitions
   
   
-  def get_subtitle_transitions(self, diagram1: Diagram, diagram2: Diagram):
+  def get_subtitle_transitions(self, diagram1: Diagram, diagram2: Diagram, subtitle_unchanged: bool = False):
     """Get fade out & fade in transitions for subtitles between diagrams"""
     transitions = []
+    if subtitle_unchanged: return transitions
     if diagram1.subtitle: transitions.append(FadeOut(diagram1.subtitle))
     if diagram2.subtitle: transitions.append(FadeIn(diagram2.subtitle))
     return transitions
 
 
+  def get_all_transitions(self, diagram1: Diagram, diagram2: Diagram, diff: DiagramDiff = None):
+    if diff is None: diff = self.diff_diagrams(diagram1, diagram2)
+    line_transitions = self.get_transitions_between_lines(diagram1, diagram2, diff.lines)
+    node_transitions = self.get_transitions_between_nodes(diagram1, diagram2, diff.nodes)
+    subtitle_transitions = self.get_subtitle_transitions(diagram1, diagram2, diff.subtitle_unchanged)
+    return [*line_transitions, *node_transitions, *subtitle_transitions]
+
+
+  def get_unchanged_pairs(self, diagram1: Diagram, diagram2: Diagram, diff: DiagramDiff) -> List[Tuple[Mobject, Mobject]]:
+    """Mobjects of the first diagram which look exactly like ones of the second"""
+    pairs = [(diagram1.line_ids[key1], diagram2.line_ids[key2]) for key1, key2 in diff.lines.unchanged]
+    pairs += [(diagram1.node_ids[id1], diagram2.node_ids[id2]) for id1, id2 in diff.nodes.unchanged]
+    if diff.subtitle_unchanged and diagram1.subtitle:
+      pairs.append((diagram1.subtitle, diagram2.subtitle))
+    return pairs
+
+
+  def play_transition(self, diagram1: Diagram, diagram2: Diagram):
+    """Animate only what changes between two diagrams
+
+    Unchanged elements are swapped for the second diagram's instantly, so they are
+    part of the static background while the rest animates."""
+    diff = self.diff_diagrams(diagram1, diagram2)
+    unchanged_pairs = self.get_unchanged_pairs(diagram1, diagram2, diff)
+    if unchanged_pairs:
+      self.remove(*[old for old, _ in unchanged_pairs])
+      self.add(*[new for _, new in unchanged_pairs])
+    transitions = self.get_all_transitions(diagram1, diagram2, diff)
+    if transitions:
+      self.play(*transitions, run_time=self.transition_time)
+    else:
+      self.wait(self.transition_time)
+
+
+  def get_moving_mobjects(self, *animations: Animation):
+    """Mobjects to redraw on every frame of an animation
+
+    Manim draws everything else once into a static background for the animation, but
+    counts every mobject after the first animated one in z-order as moving. Here only
+    animated mobjects count, plus those drawn after one (so above it - nodes above lines)
+    which overlap where it can be, so big diagrams with small changes draw little per frame.
+
+    A mobject redrawn for overlapping is painted over whatever the background holds there,
+    so anything drawn after it which overlaps it is redrawn too, and so on until nothing
+    more overlaps. Otherwise a node's shape touched by a moving wire would be repainted
+    over its label, which is already in the background, hiding it for the whole transition."""
+    mobjects = self.get_mobject_family_members()
+    order = {id(mobject): index for index, mobject in enumerate(mobjects)}
+    animated = [(animation.mobject, getattr(animation, 'target_mobject', None)) for animation in animations]
+    animated += [(mobject, None) for mobject in mobjects if mobject.updaters or mobject in self.foreground_mobjects]
+
+    moving_ids = set()
+    region_point_arrays, region_starts = [], []
+    for mobject, target in animated:
+      family = mobject.get_family()
+      moving_ids.update(id(member) for member in family)
+      # A transform stays within the points of its start & target
+      points = [member.points for member in [*family, *(target.get_family() if target else [])] if len(member.points)]
+      if points:
+        region_point_arrays.append(np.concatenate(points))
+        region_starts.append(min(order.get(id(member), len(mobjects)) for member in family))
+
+    static = [mobject for mobject in mobjects if id(mobject) not in moving_ids and len(mobject.points)]
+    covering_ids = set()
+    if static and region_point_arrays:
+      margin = np.array([-ANIMATED_REGION_MARGIN, -ANIMATED_REGION_MARGIN, ANIMATED_REGION_MARGIN, ANIMATED_REGION_MARGIN])
+      regions = bounding_boxes(region_point_arrays) + margin
+      region_starts = np.array(region_starts)
+      boxes = bounding_boxes([mobject.points for mobject in static])
+      indices = np.array([order[id(mobject)] for mobject in static])
+      remaining = np.ones(len(static), dtype=bool)
+      # Each round's newly covering mobjects are the next round's regions, until none are found
+      while True:
+        covering = remaining & ((indices[:, None] > region_starts[None, :])
+                                & (boxes[:, None, 0] <= regions[None, :, 2]) & (boxes[:, None, 2] >= regions[None, :, 0])
+                                & (boxes[:, None, 1] <= regions[None, :, 3]) & (boxes[:, None, 3] >= regions[None, :, 1])).any(axis=1)
+        if not covering.any(): break
+        remaining &= ~covering
+        covering_ids.update(id(static[index]) for index in np.flatnonzero(covering))
+        regions = boxes[covering] + margin
+        region_starts = indices[covering]
+    return [mobject for mobject in mobjects if id(mobject) in moving_ids or id(mobject) in covering_ids]
+
+
   def transition_between_all_diagrams(self, diagrams: List[Diagram]):
     self.add(diagrams[0])
-    self.wait(1)
+    self.wait(self.hold_time)
 
     for i in range(1, len(diagrams)):
-      line_transitions = self.get_transitions_between_lines(diagrams[i-1], diagrams[i])
-      node_transitions = self.get_transitions_between_nodes(diagrams[i-1], diagrams[i])
-      subtitle_transitions = self.get_subtitle_transitions(diagrams[i-1], diagrams[i])
-      all_transitions = [*line_transitions, *node_transitions, *subtitle_transitions]
+      self.play_transition(diagrams[i-1], diagrams[i])
+      self.wait(self.hold_time)
 
-      self.play(*all_transitions)
-      self.wait(1)
+
+  def create_diagrams(self) -> List[Diagram]:
+    # Make space at bottom if any subtitles in animation
+    reserve_subtitle_space = self.reserve_subtitle_space
+    if reserve_subtitle_space is None:
+      subtitles = [diagram_info['subtitle'] for diagram_info in self.extra_info.values() if len(diagram_info['subtitle']) > 0]
+      reserve_subtitle_space = len(subtitles) > 0
+
+    converters = convert_diagrams(self.tikz_and_style_pairs, reserve_subtitle_space)
+    precompile_tex(node_labels(converters))
+    diagrams = []
+    for id, tikz_to_manim_converter in enumerate(converters):
+      with span('build'):
+        diagrams.append(Diagram(tikz_to_manim_converter, self.extra_info[id]))
+    return diagrams
+
+
+  def prepare(self) -> List[Diagram]:
+    """Create the diagrams, if not already created, so this can happen before render() and its span"""
+    if self.diagrams is None:
+      self.diagrams = self.create_diagrams()
+    return self.diagrams
 
 
   def construct(self):
+    self.camera.background_color = WHITE
+    self.transition_between_all_diagrams(self.prepare())
 
+
+
+class DiagramSegmentScene(DiagramScene):
+  """One segment of a DiagramScene - a hold of one diagram, or the transition between two"""
+
+  def construct(self):
     self.camera.background_color = WHITE
+    diagrams = self.prepare()
+    self.add(diagrams[0])
+    if len(diagrams) == 1:
+      self.wait(self.hold_time)
+    else:
+      self.play_transition(diagrams[0], diagrams[1])
 
-    diagrams = []
-    manim_x_limits = [-MANIM_X_LIMIT, MANIM_X_LIMIT]
-    manim_y_limits = [-MANIM_Y_LIMIT, MANIM_Y_LIMIT]
 
-    # Make space at bottom if any subtitles in animation
-    subtitles = [diagram_info['subtitle'] for diagram_info in self.extra_info.values() if len(diagram_info['subtitle']) > 0]
-    if len(subtitles) > 0:
-      manim_y_limits[0] += 1
 
-    for id, tikz_and_style_pair in enumerate(self.tikz_and_style_pairs):
-      test_tikz, test_styles = tikz_and_style_pair
-      tikz_diagram = TikzParser.parse_tikz_diagram(test_tikz, test_styles)
-      tikz_to_manim_converter = TikzToManimConverter(tikz_diagram, manim_x_limits, manim_y_limits)
-      diagrams.append(Diagram(tikz_to_manim_converter, self.extra_info[id]))
+class DiagramFrameScene(DiagramScene):
+  """A single still frame of one diagram, which a hold repeats for its whole length"""
 
-    self.transition_between_all_diagrams(diagrams)
+  def construct(self):
+    self.camera.background_color = WHITE
+    self.add(self.prepare()[0])
 
 
 
@@ -0,0 +1,75 @@
+import contextvars
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+from .PackedDiagram import PackedManimDiagram
+from .RenderCache import canonical_hash
+
+"""
+DiagramCache shares converted diagrams between renders & processes, as packed binary files
+
+A diagram of a parallel render is shown by its hold and the transitions either side of it,
+which usually run on different workers, and a batch or keyframe export may show it again,
+so without this each would parse & convert it again. The first to convert it stores
+PackedManimDiagram.to_bytes() under a hash of its TikZ, style sheet and Manim frame limits.
+The rest load it with from_bytes, which only wraps the file's bytes, and rebuild a converter
+with TikzToManimConverter.from_packed.
+
+Files are written atomically, so a reader sees a whole diagram or none, and two renders
+converting the same diagram at once just write the same file twice. Nothing is cached
+outside a diagram_directory block; scoped_config opens one inside the shared label directory.
+
+This module must not import Manim.
+"""
+
+SUFFIX = '.pkdg'
+
+_directory: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('diagram_directory', default=None)
+
+
+@contextmanager
+def diagram_directory(directory):
+  """Cache converted diagrams in directory within the enclosed block"""
+  os.makedirs(directory, exist_ok=True)
+  token = _directory.set(os.fspath(directory))
+  try:
+    yield
+  finally:
+    _directory.reset(token)
+
+
+def diagram_key(tikz_content: str, style_content: str, manim_x_limits: Tuple[float, float], manim_y_limits: Tuple[float, float]) -> str:
+  return canonical_hash({
+    'tikz': tikz_content,
+    'styles': style_content,
+    'limits': [list(manim_x_limits), list(manim_y_limits)],
+  })
+
+
+def load_diagram(key: str) -> Optional[PackedManimDiagram]:
+  """Return a cached diagram, or None if there is none or no cache directory"""
+  directory = _directory.get()
+  if directory is None:
+    return None
+  try:
+    with open(os.path.join(directory, key + SUFFIX), 'rb') as diagram_file:
+      # A bytearray, so the arrays viewing it are writable like a fresh converter's
+      return PackedManimDiagram.from_bytes(bytearray(diagram_file.read()))
+  except FileNotFoundError:
+    return None
+
+
+def store_diagram(key: str, packed: PackedManimDiagram):
+  directory = _directory.get()
+  if directory is None:
+    return
+  fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as tmp_file:
+      tmp_file.write(packed.to_bytes())
+    os.replace(tmp_path, os.path.join(directory, key + SUFFIX))
+  except BaseException:
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    raise
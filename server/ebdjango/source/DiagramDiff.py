@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Tuple
+
+import numpy as np
+
+from .TransitionPlanner import LineKey, plan_line_transitions, plan_node_transitions
+
+"""
+DiagramDiff classifies how each element of a diagram changes in the next one
+
+Elements are paired up by TransitionPlanner, then each pair is:
+- unchanged - looks exactly the same in both diagrams
+- moved     - same label & props, different position (or, for a line, curve)
+- restyled  - different label or props, and maybe position
+Unpaired elements are removed (first diagram only) or added (second diagram only).
+Lines have no style of their own, so are never restyled.
+
+Only moved, restyled, removed & added elements need animating. Unchanged elements are
+swapped for their counterpart in the next diagram without an animation, so Manim draws
+them into the static background once rather than on every frame.
+
+Positions are compared with POSITION_TOLERANCE, since each diagram is converted into
+Manim coordinates separately. This module must not import Manim.
+"""
+
+# Manim units - far below a pixel at any quality
+POSITION_TOLERANCE = 1e-6
+
+
+@dataclass
+class ElementDiff:
+  unchanged: List[Tuple[Hashable, Hashable]] = field(default_factory=list)
+  moved: List[Tuple[Hashable, Hashable]] = field(default_factory=list)
+  restyled: List[Tuple[Hashable, Hashable]] = field(default_factory=list)
+  removed: List[Hashable] = field(default_factory=list)
+  added: List[Hashable] = field(default_factory=list)
+
+  @property
+  def changed(self) -> List[Tuple[Hashable, Hashable]]:
+    """Pairs which transform into each other"""
+    return [*self.moved, *self.restyled]
+
+
+@dataclass
+class DiagramDiff:
+  nodes: ElementDiff
+  lines: ElementDiff
+  subtitle_unchanged: bool
+
+
+def same_position(points1, points2) -> bool:
+  points1 = np.asarray(points1, dtype=float)
+  points2 = np.asarray(points2, dtype=float)
+  return points1.shape == points2.shape and np.allclose(points1, points2, rtol=0, atol=POSITION_TOLERANCE)
+
+
+def diff_nodes(nodes1: Dict[str, object], nodes2: Dict[str, object]) -> ElementDiff:
+  """Diff nodes given by id, each with a position, label & props, like ManimInputNode"""
+  plan = plan_node_transitions(nodes1, nodes2)
+  diff = ElementDiff(removed=plan.removed, added=plan.added)
+  for id1, id2 in plan.kept:
+    node1, node2 = nodes1[id1], nodes2[id2]
+    if node1.label != node2.label or (node1.props is not node2.props and node1.props != node2.props):
+      diff.restyled.append((id1, id2))
+    elif not same_position(node1.position, node2.position):
+      diff.moved.append((id1, id2))
+    else:
+      diff.unchanged.append((id1, id2))
+  return diff
+
+
+def diff_lines(lines1: Dict[LineKey, np.ndarray], lines2: Dict[LineKey, np.ndarray]) -> ElementDiff:
+  """Diff lines given by key, each with its curve points"""
+  plan = plan_line_transitions(lines1, lines2)
+  diff = ElementDiff(removed=plan.removed, added=plan.added)
+  for key1, key2 in [*plan.kept, *plan.matched]:
+    if same_position(lines1[key1], lines2[key2]):
+      diff.unchanged.append((key1, key2))
+    else:
+      diff.moved.append((key1, key2))
+  return diff
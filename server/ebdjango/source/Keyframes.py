@@ -0,0 +1,124 @@
+from contextlib import nullcontext
+from typing import Dict, List
+
+import numpy as np
+
+from manim import config
+from manim.utils.color.core import ManimColor
+
+from .DiagramAnim import MANIM_X_LIMIT, MANIM_Y_LIMIT, convert_diagrams
+from .DiagramCache import diagram_directory
+from .DiagramDiff import diff_lines, diff_nodes
+from .RenderQuality import DEFAULT_QUALITY, get_quality
+from .RenderSegments import has_subtitles
+from .TikzToManim import TikzToManimConverter
+from .TransitionPlanner import LineKey, line_keys
+
+"""
+Keyframes exports an animation as a keyframe document a browser can play itself
+
+Nothing is rendered - diagrams are only parsed & converted, so no LaTeX, Cairo or ffmpeg runs.
+
+Document:
+- frame - size of the Manim frame, centred on the origin with y pointing up
+- timing - seconds each diagram is held for, and each transition takes
+- diagrams - for each diagram:
+  - nodes - id, [x, y] position, TeX label, shape and other Manim props (colors as hex)
+  - lines - [start id, end id, k] key and four [x, y] cubic Bezier points
+  - subtitle
+- transitions - between each diagram and the next, with elements given by their index
+  in the diagrams' node & line lists:
+  - nodes - unchanged & morph [from, to] pairs, fade_out and fade_in
+  - lines - unchanged & morph [from, to] pairs, fade_out and create
+  - subtitle_unchanged - whether the subtitle stays, rather than fading out and in
+  Unchanged elements are swapped for the next diagram's without animating.
+
+Elements are classified by DiagramDiff, exactly as for rendered animations.
+"""
+
+KEYFRAME_VERSION = 2
+
+# Decimal places kept in coordinates & sizes - far finer than a pixel
+PRECISION = 4
+
+
+def export_value(value):
+  if isinstance(value, ManimColor): return value.to_hex()
+  if isinstance(value, float): return round(value, PRECISION)
+  return value
+
+
+def export_point(point) -> List[float]:
+  return [round(float(coordinate), PRECISION) for coordinate in point[:2]]
+
+
+def line_curves(converter: TikzToManimConverter) -> Dict[LineKey, np.ndarray]:
+  """Curve points of each line by its key, in the converter's order"""
+  keys = line_keys((line.start_id, line.end_id) for line in converter.lines)
+  return {key: line.curve_points for key, line in zip(keys, converter.lines)}
+
+
+def export_diagram(converter: TikzToManimConverter, diagram_info: Dict) -> Dict:
+  nodes = [{
+    'id': node.id,
+    'position': export_point(node.position),
+    'label': node.label,
+    **{prop: export_value(value) for prop, value in node.props.items()},
+  } for node in converter.nodes]
+  lines = [{
+    'key': list(key),
+    'points': [export_point(point) for point in curve_points],
+  } for key, curve_points in line_curves(converter).items()]
+  return {'nodes': nodes, 'lines': lines, 'subtitle': diagram_info.get('subtitle', '')}
+
+
+def export_transition(converter1: TikzToManimConverter, converter2: TikzToManimConverter, subtitle1: str, subtitle2: str) -> Dict:
+  nodes1 = {node.id: node for node in converter1.nodes}
+  nodes2 = {node.id: node for node in converter2.nodes}
+  lines1, lines2 = line_curves(converter1), line_curves(converter2)
+  # Index of each element in the exported diagrams' lists, which are in the same order
+  node_index1, node_index2 = ({id: index for index, id in enumerate(nodes)} for nodes in [nodes1, nodes2])
+  line_index1, line_index2 = ({key: index for index, key in enumerate(lines)} for lines in [lines1, lines2])
+
+  node_diff = diff_nodes(nodes1, nodes2)
+  line_diff = diff_lines(lines1, lines2)
+  return {
+    'nodes': {
+      'unchanged': [[node_index1[id1], node_index2[id2]] for id1, id2 in node_diff.unchanged],
+      'morph': [[node_index1[id1], node_index2[id2]] for id1, id2 in node_diff.changed],
+      'fade_out': [node_index1[id] for id in node_diff.removed],
+      'fade_in': [node_index2[id] for id in node_diff.added],
+    },
+    'lines': {
+      'unchanged': [[line_index1[key1], line_index2[key2]] for key1, key2 in line_diff.unchanged],
+      'morph': [[line_index1[key1], line_index2[key2]] for key1, key2 in line_diff.changed],
+      'fade_out': [line_index1[key] for key in line_diff.removed],
+      'create': [line_index2[key] for key in line_diff.added],
+    },
+    'subtitle_unchanged': subtitle1 == subtitle2,
+  }
+
+
+def export_keyframes(style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY,
+                     diagram_dir=None) -> Dict:
+  """Build the keyframe document for an animation, with the timing of a quality tier
+
+  Converted diagrams are shared with renders through the diagram cache in diagram_dir, if given"""
+  render_quality = get_quality(quality)
+  tikz_and_style_pairs = [(tikz_content, style_content) for tikz_content in tikz_contents_list]
+  with diagram_directory(diagram_dir) if diagram_dir is not None else nullcontext():
+    converters = convert_diagrams(tikz_and_style_pairs, has_subtitles(extra_info))
+  diagrams = [export_diagram(converter, extra_info.get(id, {})) for id, converter in enumerate(converters)]
+  return {
+    'version': KEYFRAME_VERSION,
+    'frame': {
+      'width': round(config.frame_width, PRECISION),
+      'height': round(config.frame_height, PRECISION),
+      'x_limits': [-MANIM_X_LIMIT, MANIM_X_LIMIT],
+      'y_limits': [-MANIM_Y_LIMIT, MANIM_Y_LIMIT],
+    },
+    'timing': {'hold': render_quality.hold_time, 'transition': render_quality.transition_time},
+    'diagrams': diagrams,
+    'transitions': [export_transition(converters[i - 1], converters[i], diagrams[i - 1]['subtitle'], diagrams[i]['subtitle'])
+                    for i in range(1, len(converters))],
+  }
@@ -0,0 +1,120 @@
+import collections
+import contextvars
+import fcntl
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Tuple
+from manim import *
+from .Timing import span
+
+"""
+LabelCache hands out copies of node labels (Tex) and subtitles (Text)
+
+- compiled mobjects are kept per process, keyed by (string, color, TeX template),
+  so a repeated label costs one copy instead of a LaTeX and dvisvgm run
+- the SVG files behind them live in Manim's tex_dir and text_dir, which
+  scoped_config can point at a directory shared by every render worker
+- compiling a label holds a file lock on its key, so two workers never write
+  the same SVG at once; the second finds the first one's file instead
+- precompile_tex compiles every label a render needs before its scenes are built,
+  several at once, since each is a LaTeX & dvisvgm subprocess which leaves the core idle
+- each compile removes only its own intermediate files, as Manim's cleanup would
+  delete those of compiles running alongside it in the same directory
+"""
+
+MAX_CACHED_LABELS = 4096
+
+# LaTeX runs in subprocesses, so threads compile labels in parallel
+MAX_COMPILE_THREADS = os.cpu_count() or 1
+
+_labels = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+def template_hash() -> str:
+  return hashlib.sha256(config.tex_template.body.encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def store_lock(store_dir, name: str):
+  """Hold an exclusive lock on one entry of the shared on-disk store"""
+  # Beside the store rather than in it, so nothing cleaning the store trips over the locks
+  lock_dir = os.fspath(store_dir).rstrip(os.sep) + '.locks'
+  os.makedirs(lock_dir, exist_ok=True)
+  lock_name = hashlib.sha256(name.encode('utf-8')).hexdigest()
+  with open(os.path.join(lock_dir, lock_name + '.lock'), 'w') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    try:
+      yield
+    finally:
+      fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cached_original(key, store_dir, create):
+  """Return the cached mobject for key, creating it on first use"""
+  with _lock:
+    label = _labels.get(key)
+    if label is not None:
+      _labels.move_to_end(key)
+      return label
+
+  with store_lock(store_dir, repr(key[:-1])), span('tex'):
+    label = create()
+
+  with _lock:
+    _labels[key] = label
+    if len(_labels) > MAX_CACHED_LABELS:
+      _labels.popitem(last=False)
+  return label
+
+
+def cached_label(key, store_dir, create):
+  """Return a copy of the mobject for key, creating it on first use"""
+  return cached_original(key, store_dir, create).copy()
+
+
+def tex_key(tex: str, color):
+  return ('tex', tex, template_hash(), ManimColor(color).to_hex())
+
+
+def create_tex(tex: str, color) -> Tex:
+  """Compile a Tex label, then remove LaTeX's files for it but the .tex & .svg Manim looks for"""
+  label = Tex(tex, color=color)
+  svg_path = Path(label.file_name)
+  for path in svg_path.parent.glob(svg_path.stem + '.*'):
+    if path.suffix not in ('.svg', '.tex'):
+      path.unlink(missing_ok=True)
+  return label
+
+
+def cached_tex(tex: str, color=BLACK) -> Tex:
+  return cached_label(tex_key(tex, color), config.get_dir('tex_dir'), lambda: create_tex(tex, color))
+
+
+def cached_text(text: str, color=BLACK) -> Text:
+  key = ('text', text, ManimColor(color).to_hex())
+  return cached_label(key, config.get_dir('text_dir'), lambda: Text(text, color=color))
+
+
+def precompile_tex(labels: Iterable[Tuple[str, object]]):
+  """Compile every distinct (tex, color) label not already cached, several at a time
+
+  Later cached_tex calls for them only copy the compiled mobject"""
+  distinct = dict.fromkeys((tex, ManimColor(color).to_hex()) for tex, color in labels)
+  keys = {label: tex_key(*label) for label in distinct}
+  with _lock:
+    missing = [label for label, key in keys.items() if key not in _labels]
+  if not missing: return
+
+  tex_dir = config.get_dir('tex_dir')
+  with ThreadPoolExecutor(max_workers=min(len(missing), MAX_COMPILE_THREADS)) as executor:
+    # Each compile runs in a copy of this context, so its span reaches the current request
+    futures = [executor.submit(contextvars.copy_context().run, cached_original, keys[(tex, color)], tex_dir,
+                               lambda tex=tex, color=color: create_tex(tex, color))
+               for tex, color in missing]
+    for future in futures:
+      future.result()
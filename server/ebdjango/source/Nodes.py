@@ -1,4 +1,5 @@
 from manim import *
+from .LabelCache import cached_tex
 
   
 
@@ -8,7 +9,7 @@ class Node(VGroup):
     self.line_nums = {}
     self.available_line_nums = {}
     self.shape = shape
-    tex = Tex(tex, color=tex_color).move_to(shape)
+    tex = cached_tex(tex, color=tex_color).move_to(shape)
     self.add(shape, tex)
     
 
@@ -22,7 +23,6 @@ class ManimSquare(Node):
 
 class ManimRectangle(Node):
   def __init__(self, tex='', height=1, width=1, fill_opacity=1, fill_color=BLUE, stroke_color=BLACK, **kwargs):
-    print("fill_opacity", fill_opacity)
     rectangle = Rectangle(fill_color=fill_color, height=height, width=width, fill_opacity=fill_opacity, stroke_color=stroke_color, **kwargs)
     super().__init__(shape=rectangle, tex=tex, **kwargs)
 
@@ -45,14 +45,66 @@ class ManimMorphism(Node):
   def __init__(self, tex='', size=1, fill_color=BLUE, stroke_color=BLACK, fill_opacity=1, **kwargs):
     size = kwargs.pop('height', size)
     size = kwargs.pop('width', size)
-    vertices = [[-0.5, 0.35, 0], [0.5, 0.35, 0], [0.8, -0.35, 0], [-0.5, -0.35, 0]]
-    vertices = [np.array(vertex) * size for vertex in vertices]
+    vertices = [np.array(vertex) * size for vertex in MORPHISM_VERTICES]
     polygon = Polygon(*vertices, fill_color=fill_color, fill_opacity=fill_opacity, stroke_color=stroke_color, **kwargs)
     super().__init__(shape=polygon, tex=tex, **kwargs)
 
 
 
 
+# Outline vertices of a morphism of size 1, before it is centred
+MORPHISM_VERTICES = [[-0.5, 0.35, 0], [0.5, 0.35, 0], [0.8, -0.35, 0], [-0.5, -0.35, 0]]
+
+
+def outline_radius(shape='square', **props):
+  """Radius of a round shape, with the same defaults as its Node class, or None if not round"""
+  if shape == 'none':
+    return DEFAULT_DOT_RADIUS
+  if shape == 'circle':
+    return props.get('width', props.get('height', 0.5))
+  if shape == 'dot':
+    return props.get('width', props.get('height', 0.1))
+  return None
+
+
+def outline_vertices(shape='square', **props):
+  """Outline of a polygonal shape centred on the origin, with the same defaults as its Node class"""
+  if shape == 'square':
+    half = props.get('width', props.get('height', 1)) / 2
+    return np.array([[-half, half], [half, half], [half, -half], [-half, -half]])
+  if shape == 'rectangle':
+    half_width, half_height = props.get('width', 1) / 2, props.get('height', 1) / 2
+    return np.array([[-half_width, half_height], [half_width, half_height], [half_width, -half_height], [-half_width, -half_height]])
+  if shape == 'morphism':
+    vertices = np.array(MORPHISM_VERTICES)[:, :2] * props.get('width', props.get('height', 1))
+    # move_to centres the bounding box, not the origin
+    return vertices - (vertices.min(axis=0) + vertices.max(axis=0)) / 2
+  raise Exception("Unknown shape:", shape)
+
+
+def ray_polygon_intersection(direction, vertices):
+  """Find where a ray from the origin crosses a polygon, testing every edge at once"""
+  edges = np.roll(vertices, -1, axis=0) - vertices
+  # Solve t * direction = vertex + s * edge for every edge, using 2D cross products
+  denominators = direction[0] * edges[:, 1] - direction[1] * edges[:, 0]
+  with np.errstate(divide='ignore', invalid='ignore'):
+    t = (vertices[:, 0] * edges[:, 1] - vertices[:, 1] * edges[:, 0]) / denominators
+    s = (vertices[:, 0] * direction[1] - vertices[:, 1] * direction[0]) / denominators
+  hits = (denominators != 0) & (t >= 0) & (s >= 0) & (s <= 1)
+  if not hits.any():
+    return None
+  return direction[:2] * t[hits].min()
+
+
+def shape_anchor_offset(direction, shape='square', **props):
+  """Offset from a node's center to where a ray in direction leaves its shape, without creating the node"""
+  direction = np.asarray(direction, dtype=float)
+  radius = outline_radius(shape, **props)
+  if radius is not None:
+    return direction[:2] * radius / np.linalg.norm(direction[:2])
+  return ray_polygon_intersection(direction, outline_vertices(shape, **props))
+
+
 def create_and_position_node(node):
   shape = create_shape(node.label, **node.props)
   shape.move_to(node.position)
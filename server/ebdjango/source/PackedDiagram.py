@@ -0,0 +1,226 @@
+import json
+import struct
+from dataclasses import dataclass, fields
+from functools import cached_property
+from typing import Dict, List
+
+import numpy as np
+
+from .TikzParser import Location, TikzDiagram, TikzLine, TikzNode
+
+"""
+PackedDiagram stores a diagram as a few NumPy arrays instead of an object per node & line
+
+Strings (ids, styles, labels & compass directions) are interned in one table, and
+everything else refers to them by index, with NO_STRING for none.
+
+PackedTikzDiagram - a parsed TikzDiagram:
+- node_ids, node_styles, node_labels - string indices
+- node_positions - N x 2 TikZ coordinates
+- line_endpoints - M x 2 string indices of the start & end node ids, NO_STRING for a coordinate
+- line_anchors - M x 2 string indices of the start & end compass directions, if any
+- line_coords - M x 2 x 2 start & end coordinates, NaN unless the end is a coordinate
+- line_angles - M x 2 in & out angles, NaN if not given
+- line_looseness - M looseness, NaN if not given
+
+PackedManimDiagram - a converted diagram, as TikzToManimConverter.pack() gives & from_packed() takes,
+and as DiagramCache shares between render processes:
+- node_ids, node_styles, node_labels - string indices
+- node_positions - N x 3 Manim coordinates
+- line_ids - M x 2 string indices of the start & end ids
+- curve_points - M x 4 x 3 Bezier points of each line
+Node props are not stored, since they come from the style sheet & scale factor.
+
+Binary form: MAGIC, a little-endian uint32 header length, a JSON header with the string
+table, other values and each array's dtype, shape & offset, then the array data, each
+aligned to ALIGNMENT bytes. Loading only wraps the buffer with np.frombuffer, so the
+arrays share its memory, and pickling sends the binary form as one buffer.
+
+This module must not import Manim.
+"""
+
+MAGIC = b'PKDG'
+FORMAT_VERSION = 1
+ALIGNMENT = 16
+NO_STRING = -1
+
+_header_length = struct.Struct('<I')
+
+
+class StringTable():
+
+  def __init__(self) -> None:
+    self.strings: List[str] = []
+    self.indices: Dict[str, int] = {}
+
+
+  def intern(self, string) -> int:
+    if string is None: return NO_STRING
+    index = self.indices.get(string)
+    if index is None:
+      index = self.indices[string] = len(self.strings)
+      self.strings.append(string)
+    return index
+
+
+def padding(length: int) -> int:
+  return -length % ALIGNMENT
+
+
+@dataclass(eq=False)
+class PackedArrays():
+  """Base of the packed diagrams: each field is either an array or a JSON value"""
+
+  KIND = None
+  ARRAY_DTYPES = {}
+
+  def to_bytes(self) -> bytes:
+    arrays = {name: np.ascontiguousarray(getattr(self, name), dtype=dtype) for name, dtype in self.ARRAY_DTYPES.items()}
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+      layout[name] = [array.dtype.str, list(array.shape), offset]
+      offset += array.nbytes + padding(array.nbytes)
+    header = json.dumps({
+      'kind': self.KIND,
+      'version': FORMAT_VERSION,
+      'values': {item.name: getattr(self, item.name) for item in fields(self) if item.name not in self.ARRAY_DTYPES},
+      'arrays': layout,
+    }).encode('utf-8')
+
+    prefix_length = len(MAGIC) + _header_length.size + len(header)
+    parts = [MAGIC, _header_length.pack(len(header)), header, bytes(padding(prefix_length))]
+    for array in arrays.values():
+      parts.extend([array.tobytes(), bytes(padding(array.nbytes))])
+    return b''.join(parts)
+
+
+  @classmethod
+  def from_bytes(cls, buffer):
+    """Load from a binary form, with arrays viewing the buffer rather than copying it"""
+    buffer = memoryview(buffer)
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+      raise Exception("Not a packed diagram:", bytes(buffer[:len(MAGIC)]))
+    (header_length,) = _header_length.unpack_from(buffer, len(MAGIC))
+    header_start = len(MAGIC) + _header_length.size
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+    if header['kind'] != cls.KIND or header['version'] != FORMAT_VERSION:
+      raise Exception("Unsupported packed diagram:", header['kind'], header['version'])
+
+    data_start = header_start + header_length
+    data_start += padding(data_start)
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+      count = int(np.prod(shape, dtype=np.int64))
+      arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+    return cls(**header['values'], **arrays)
+
+
+  def __reduce__(self):
+    return (self.__class__.from_bytes, (self.to_bytes(),))
+
+
+@dataclass(eq=False)
+class PackedTikzDiagram(PackedArrays):
+  strings: List[str]
+  styles: Dict[str, Dict[str, str]]
+  node_ids: np.ndarray
+  node_styles: np.ndarray
+  node_labels: np.ndarray
+  node_positions: np.ndarray
+  line_endpoints: np.ndarray
+  line_anchors: np.ndarray
+  line_coords: np.ndarray
+  line_angles: np.ndarray
+  line_looseness: np.ndarray
+
+  KIND = 'tikz'
+  ARRAY_DTYPES = {
+    'node_ids': '<i4', 'node_styles': '<i4', 'node_labels': '<i4', 'node_positions': '<f8',
+    'line_endpoints': '<i4', 'line_anchors': '<i4', 'line_coords': '<f8', 'line_angles': '<f8', 'line_looseness': '<f8',
+  }
+
+  @classmethod
+  def from_tikz_diagram(cls, diagram: TikzDiagram):
+    table = StringTable()
+    num_lines = len(diagram.lines)
+    line_endpoints = np.full((num_lines, 2), NO_STRING, dtype='<i4')
+    line_anchors = np.full((num_lines, 2), NO_STRING, dtype='<i4')
+    line_coords = np.full((num_lines, 2, 2), np.nan)
+    for row, line in enumerate(diagram.lines):
+      for end, loc in enumerate((line.start_loc, line.end_loc)):
+        if loc.type == 'id':
+          line_endpoints[row, end] = table.intern(loc.location)
+        elif loc.type == 'compass':
+          line_endpoints[row, end] = table.intern(loc.location['id'])
+          line_anchors[row, end] = table.intern(loc.location['direction'])
+        elif loc.type == 'coordinate':
+          line_coords[row, end] = loc.location
+        else:
+          raise Exception("Unknown TikZ location type:", loc.type)
+
+    return cls(
+      strings=table.strings,
+      styles=diagram.styles,
+      node_ids=np.array([table.intern(node.id) for node in diagram.nodes], dtype='<i4'),
+      node_styles=np.array([table.intern(node.style) for node in diagram.nodes], dtype='<i4'),
+      node_labels=np.array([table.intern(node.label) for node in diagram.nodes], dtype='<i4'),
+      node_positions=np.array([node.position for node in diagram.nodes], dtype='<f8').reshape(-1, 2),
+      line_endpoints=line_endpoints,
+      line_anchors=line_anchors,
+      line_coords=line_coords,
+      line_angles=np.array([(line.in_angle, line.out_angle) for line in diagram.lines], dtype='<f8').reshape(-1, 2),
+      line_looseness=np.array([line.looseness for line in diagram.lines], dtype='<f8'),
+    )
+
+
+  def string(self, index):
+    return None if index == NO_STRING else self.strings[index]
+
+
+  def location(self, line: int, end: int) -> Location:
+    id = self.string(self.line_endpoints[line, end])
+    if id is None:
+      x, y = self.line_coords[line, end]
+      return Location(f"{float(x)!r}, {float(y)!r}")
+    direction = self.string(self.line_anchors[line, end])
+    # Location drops '.center', and it stops an id containing '.' or ',' reading as an anchor or coordinate
+    return Location(f"{id}.center" if direction is None else f"{id}.{direction}")
+
+
+  @cached_property
+  def nodes(self) -> List[TikzNode]:
+    """TikzNode views, whose positions are rows of node_positions"""
+    strings = self.strings
+    return [TikzNode(strings[style], strings[id], position, strings[label])
+            for id, style, label, position in zip(self.node_ids, self.node_styles, self.node_labels, self.node_positions)]
+
+
+  @cached_property
+  def lines(self) -> List[TikzLine]:
+    def optional(value):
+      return None if np.isnan(value) else float(value)
+    return [TikzLine(self.location(row, 0), self.location(row, 1), optional(in_angle), optional(out_angle), optional(looseness))
+            for row, ((in_angle, out_angle), looseness) in enumerate(zip(self.line_angles, self.line_looseness))]
+
+
+  def to_tikz_diagram(self) -> TikzDiagram:
+    return TikzDiagram(self.nodes, self.lines, self.styles)
+
+
+@dataclass(eq=False)
+class PackedManimDiagram(PackedArrays):
+  strings: List[str]
+  scale_factor: float
+  node_ids: np.ndarray
+  node_styles: np.ndarray
+  node_labels: np.ndarray
+  node_positions: np.ndarray
+  line_ids: np.ndarray
+  curve_points: np.ndarray
+
+  KIND = 'manim'
+  ARRAY_DTYPES = {
+    'node_ids': '<i4', 'node_styles': '<i4', 'node_labels': '<i4', 'node_positions': '<f8',
+    'line_ids': '<i4', 'curve_points': '<f8',
+  }
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+"""
+RenderCache stores finished animations on disk, keyed by a hash of the request
+
+Key:
+- sha256 of the canonical JSON of styles, TikZ inputs, extra info and quality tier
+- identical requests always produce the same key
+
+Storage:
+- one file per key, sharded into subdirectories by the first two hex characters
+- a file's modification time is its last access time, so eviction is LRU
+- entries older than max_age seconds are removed
+- least recently used entries are removed until the cache is under max_bytes
+- an entry still needed after it might be evicted is pinned: hard linked into the
+  caller's workspace, so removing it from the cache leaves the caller's copy intact
+
+This module must not import Manim, so that cache hits stay cheap.
+"""
+
+
+def canonical_hash(payload) -> str:
+  """sha256 of a JSON-serialisable payload, independent of dictionary order"""
+  canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+  return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def request_key(style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = 'low') -> str:
+  """Return a canonical hash of everything which affects a rendered animation"""
+  return canonical_hash({
+    'styles': style_content,
+    'tikz': list(tikz_contents_list),
+    'extra_info': [[str(id), extra_info[id]] for id in sorted(extra_info)],
+    'quality': quality,
+  })
+
+
+def link_or_copy(source_path: str, destination: str) -> str:
+  """Hard link source_path to destination, or copy it if they are on different file systems"""
+  try:
+    os.link(source_path, destination)
+  except FileNotFoundError:
+    raise
+  except OSError:
+    shutil.copyfile(source_path, destination)
+  return destination
+
+
+class RenderCache():
+
+  def __init__(self, directory, max_bytes: int, max_age: float, suffix: str = '.mp4') -> None:
+    self.directory = str(directory)
+    self.max_bytes = max_bytes
+    self.max_age = max_age
+    self.suffix = suffix
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    os.makedirs(self.directory, exist_ok=True)
+
+
+  def __getstate__(self):
+    # Locks can't be pickled - worker processes get their own lock and counters
+    state = self.__dict__.copy()
+    del state['_lock']
+    return state
+
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
+
+
+  def path_for_key(self, key: str) -> str:
+    return os.path.join(self.directory, key[:2], key + self.suffix)
+
+
+  def get(self, key: str) -> Optional[str]:
+    """Return the path of a cached file, or None if the key is missing or expired"""
+    path = self.path_for_key(key)
+    try:
+      modified = os.path.getmtime(path)
+      if time.time() - modified > self.max_age:
+        os.remove(path)
+        raise FileNotFoundError(path)
+      # Touch the entry so it is the most recently used
+      os.utime(path)
+    except FileNotFoundError:
+      with self._lock: self.misses += 1
+      return None
+    with self._lock: self.hits += 1
+    return path
+
+
+  def contains(self, key: str) -> bool:
+    """Whether a key is cached and unexpired, without counting as a get or touching the entry"""
+    try:
+      return time.time() - os.path.getmtime(self.path_for_key(key)) <= self.max_age
+    except FileNotFoundError:
+      return False
+
+
+  def pin(self, key: str, destination: str) -> Optional[str]:
+    """Link a cached file to destination so eviction can't remove it, returning None if it is not cached
+
+    Counts as a get, for LRU order and hit rates"""
+    if self.get(key) is None:
+      return None
+    try:
+      return link_or_copy(self.path_for_key(key), destination)
+    except FileNotFoundError:
+      # Evicted since the get
+      return None
+
+
+  def put(self, key: str, source_path: str) -> str:
+    """Copy a finished file into the cache and return its cached path"""
+    path = self.path_for_key(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Copy to a temporary file first so readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+      shutil.copyfile(source_path, tmp_path)
+      os.replace(tmp_path, path)
+    except BaseException:
+      if os.path.exists(tmp_path): os.remove(tmp_path)
+      raise
+    self.evict()
+    return path
+
+
+  def entries(self):
+    """Return (modified time, size, path) for every cached file"""
+    entries = []
+    for root, _, file_names in os.walk(self.directory):
+      for file_name in file_names:
+        if not file_name.endswith(self.suffix): continue
+        path = os.path.join(root, file_name)
+        try:
+          stat = os.stat(path)
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+  def evict(self):
+    """Remove expired entries, then least recently used ones until under max_bytes"""
+    now = time.time()
+    entries = []
+    for modified, size, path in self.entries():
+      if now - modified > self.max_age:
+        self._remove(path)
+      else:
+        entries.append((modified, size, path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total_bytes <= self.max_bytes: break
+      self._remove(path)
+      total_bytes -= size
+
+
+  def _remove(self, path: str):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+
+  def stats(self) -> Dict[str, int]:
+    entries = self.entries()
+    return {
+      'hits': self.hits,
+      'misses': self.misses,
+      'entries': len(entries),
+      'bytes': sum(size for _, size, _ in entries),
+    }
@@ -0,0 +1,180 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .RenderQuality import DEFAULT_QUALITY, RenderQuality, get_quality
+from .RenderSegments import HOLD, TRANSITION, has_subtitles
+from .TikzParser import TikzParser
+
+"""
+RenderCost estimates how much work a request is before any of it is rendered
+
+Only TikzParser runs, so an estimate takes a tiny fraction of the time rendering would:
+around a second for ten diagrams of 2000 nodes, which would take many minutes to render.
+TikzToManimConverter is not run, as it needs Manim, and the parsed diagram already gives
+every count the estimate uses. For each diagram:
+- mobjects - a shape & a label per node, a curve per line, and a subtitle if any
+- labels   - distinct label texts across the request, each a LaTeX compile if not cached
+A hold is drawn once (ffmpeg repeats the frame), and a transition draws every frame of
+the quality tier. A segment's cost is
+  frames drawn x mobjects shown x pixels relative to the default tier + SEGMENT_COST
+and a request's cost is that of its segments plus LABEL_COST for each distinct label.
+Costs are in rough units of one mobject drawn once at the default tier, and are only
+compared with each other: against RenderLimits, and by the worker pool's fair scheduler.
+
+A request over any RenderLimits raises RequestTooCostlyError; None limits aren't checked.
+The diagram count and input size are checked before anything is parsed, and parsing
+stops once the nodes so far are over the limit, so a huge request is cheap to refuse.
+A style sheet or diagram which can't be parsed raises InvalidDiagramError.
+
+This module must not import Manim.
+"""
+
+# Mobjects of each node - its shape and its label
+MOBJECTS_PER_NODE = 2
+# Scene setup, encoding & caching of one segment
+SEGMENT_COST = 500
+# Compiling one label with LaTeX
+LABEL_COST = 2000
+
+
+class RequestTooCostlyError(Exception):
+  """Raised when a request's estimated cost is over a render limit
+
+  cost is None if the request was refused before it was all parsed"""
+
+  def __init__(self, cost: Optional['RenderCost'], exceeded: Dict[str, Tuple[float, float]]) -> None:
+    self.cost = cost
+    # (estimate, limit) of each limit which was exceeded
+    self.exceeded = exceeded
+    details = ', '.join(f"{name} {value:.0f} > {limit:.0f}" for name, (value, limit) in exceeded.items())
+    super().__init__(f"Request is too large to render: {details}")
+
+
+class InvalidDiagramError(Exception):
+  """Raised when a request's style sheet or one of its diagrams can't be parsed"""
+
+
+def frames_drawn(kind: str, render_quality: RenderQuality) -> int:
+  if kind == HOLD: return 1
+  return max(1, round(render_quality.transition_time * render_quality.frame_rate))
+
+
+def segment_cost(kind: str, mobjects: int, render_quality: RenderQuality) -> float:
+  default_quality = get_quality(DEFAULT_QUALITY)
+  pixel_scale = (render_quality.pixel_width * render_quality.pixel_height) / (default_quality.pixel_width * default_quality.pixel_height)
+  return frames_drawn(kind, render_quality) * mobjects * pixel_scale + SEGMENT_COST
+
+
+@dataclass(frozen=True)
+class RenderCost:
+  quality: str
+  diagrams: int
+  # Totals over every diagram
+  nodes: int
+  lines: int
+  mobjects: int
+  labels: int
+  # Frames of the finished video
+  frames: int
+  cost: float
+  diagram_mobjects: Tuple[int, ...]
+
+  def segment_cost(self, kind: str, indices: Tuple[int, ...]) -> float:
+    """Cost of one hold or transition, showing the diagrams at indices"""
+    mobjects = max(self.diagram_mobjects[index] for index in indices)
+    return segment_cost(kind, mobjects, get_quality(self.quality))
+
+
+  def summary(self) -> Dict:
+    """The estimate as JSON, for job records & error responses"""
+    return {'diagrams': self.diagrams, 'nodes': self.nodes, 'lines': self.lines, 'mobjects': self.mobjects,
+            'labels': self.labels, 'frames': self.frames, 'cost': round(self.cost)}
+
+
+def input_bytes(style_content: str, tikz_contents_list: List[str]) -> int:
+  return len(style_content.encode('utf-8')) + sum(len(tikz_content.encode('utf-8')) for tikz_content in tikz_contents_list)
+
+
+def estimate_cost(style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY,
+                  styles: Optional[Dict[str, Dict[str, str]]] = None, limits: Optional['RenderLimits'] = None) -> RenderCost:
+  """Estimate the cost of rendering an animation from its parsed diagrams
+
+  styles are those parsed from style_content, if the caller has already parsed them. If limits
+  are given, raises RequestTooCostlyError as soon as the request is known to be over them"""
+  if limits is not None:
+    limits.check_input(style_content, tikz_contents_list)
+  render_quality = get_quality(quality)
+  subtitle_mobjects = 1 if has_subtitles(extra_info) else 0
+  if styles is None:
+    try:
+      styles = TikzParser.parse_styles(style_content)
+    except Exception as error:
+      raise InvalidDiagramError(f"Invalid style sheet: {error}") from error
+  parsed = {}
+  labels = set()
+  nodes = lines = 0
+  diagram_mobjects = []
+  for index, tikz_content in enumerate(tikz_contents_list):
+    # A diagram repeated later on is only parsed once
+    if tikz_content not in parsed:
+      try:
+        parsed[tikz_content] = TikzParser.parse_tikz_diagram(tikz_content, styles)
+      except Exception as error:
+        raise InvalidDiagramError(f"Invalid diagram {index}: {error}") from error
+    diagram = parsed[tikz_content]
+    labels.update(node.label for node in diagram.nodes)
+    nodes += len(diagram.nodes)
+    lines += len(diagram.lines)
+    diagram_mobjects.append(MOBJECTS_PER_NODE * len(diagram.nodes) + len(diagram.lines) + subtitle_mobjects)
+    if limits is not None and limits.max_nodes is not None and nodes > limits.max_nodes:
+      # The rest can only add nodes
+      raise RequestTooCostlyError(None, {'nodes': (nodes, limits.max_nodes)})
+
+  cost = LABEL_COST * len(labels)
+  for index, mobjects in enumerate(diagram_mobjects):
+    if index > 0:
+      cost += segment_cost(TRANSITION, max(diagram_mobjects[index - 1], mobjects), render_quality)
+    cost += segment_cost(HOLD, mobjects, render_quality)
+
+  num_diagrams = len(tikz_contents_list)
+  frames = (num_diagrams * round(render_quality.hold_time * render_quality.frame_rate)
+            + max(0, num_diagrams - 1) * round(render_quality.transition_time * render_quality.frame_rate))
+  estimate = RenderCost(quality, num_diagrams, nodes, lines, sum(diagram_mobjects), len(labels), frames, cost, tuple(diagram_mobjects))
+  if limits is not None:
+    limits.check(estimate)
+  return estimate
+
+
+@dataclass(frozen=True)
+class RenderLimits:
+  max_diagrams: Optional[int] = None
+  max_nodes: Optional[int] = None
+  max_frames: Optional[int] = None
+  max_labels: Optional[int] = None
+  max_cost: Optional[float] = None
+  # Bytes of the style sheet and every diagram's TikZ
+  max_input_bytes: Optional[int] = None
+
+  def check_input(self, style_content: str, tikz_contents_list: List[str]):
+    """Raise RequestTooCostlyError if a request has too many diagrams or bytes, before any is parsed"""
+    exceeded = {}
+    if self.max_diagrams is not None and len(tikz_contents_list) > self.max_diagrams:
+      exceeded['diagrams'] = (len(tikz_contents_list), self.max_diagrams)
+    if self.max_input_bytes is not None:
+      size = input_bytes(style_content, tikz_contents_list)
+      if size > self.max_input_bytes:
+        exceeded['input_bytes'] = (size, self.max_input_bytes)
+    if exceeded:
+      raise RequestTooCostlyError(None, exceeded)
+
+
+  def check(self, cost: RenderCost):
+    """Raise RequestTooCostlyError if cost is over any limit"""
+    exceeded = {}
+    for name in ['diagrams', 'nodes', 'frames', 'labels', 'cost']:
+      limit = getattr(self, f"max_{name}")
+      value = getattr(cost, name)
+      if limit is not None and value > limit:
+        exceeded[name] = (value, limit)
+    if exceeded:
+      raise RequestTooCostlyError(cost, exceeded)
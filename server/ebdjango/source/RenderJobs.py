@@ -0,0 +1,419 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .RenderCache import RenderCache, link_or_copy, request_key
+from .RenderCost import SEGMENT_COST, InvalidDiagramError, RenderCost, RenderLimits, estimate_cost
+from .RenderQuality import DEFAULT_QUALITY
+from .RenderSegments import Segment, has_subtitles, join_segments, plan_segments, segment_duration
+from .RenderWorkers import RenderWorkerPool
+from .TikzParser import TikzParser
+
+"""
+RenderJobs runs renders asynchronously on a bounded pool of warm worker processes
+
+Job lifecycle:
+- queued  - accepted and waiting for a worker
+- running - a worker has started rendering
+- done    - the video is in the render cache under the job's key
+- failed  - rendering raised an error, which is stored with the job
+
+Job records are JSON files in a shared directory, so any web process can answer
+status polls, not just the one which accepted the job. Web and worker processes
+both update records, each holding a record's lock while it reads & replaces it.
+Each record lists the job's segments as [key, duration] pairs, so finished
+segments can be streamed before the whole job is done.
+
+A batch groups many jobs which share one style sheet, and its manifest reports each
+job's result as it completes. The style sheet is parsed once when the batch is
+submitted, to estimate every sequence, then once more by each worker which renders
+part of the batch, as workers cache compiled style sheets per process. Compiled labels
+are shared on disk, so the jobs of a batch reuse each other's labels.
+
+In parallel mode a job is split up: each segment which is not already cached is
+its own task, so one long animation is rendered on every worker at once, and a
+final task joins the segments in order. Each segment task pins its segment into a
+directory for the job, which the join reads, so the segment cache can evict a segment
+between it finishing and the join without breaking the job.
+
+Every request's cost is estimated from its parsed diagrams before it is queued, unless
+its video is already cached, and one over the queue's RenderLimits is refused. Each task
+is submitted on behalf of the request's client, weighed by its estimated cost, so the
+worker pool shares workers fairly between clients.
+
+This module must not import Manim; only the worker processes do.
+"""
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+  """Raised when the render queue already holds its maximum number of jobs"""
+
+
+class BatchTooLargeError(Exception):
+  """Raised when a batch has more sequences than a batch may hold"""
+
+
+class JobStore():
+
+  def __init__(self, directory) -> None:
+    self.directory = str(directory)
+    os.makedirs(self.directory, exist_ok=True)
+
+
+  def path(self, job_id: str) -> str:
+    return os.path.join(self.directory, f"{job_id}.json")
+
+
+  def read(self, job_id: str) -> Optional[Dict]:
+    try:
+      with open(self.path(job_id), 'r') as job_file:
+        return json.load(job_file)
+    except FileNotFoundError:
+      return None
+
+
+  @contextmanager
+  def locked(self, job_id: str):
+    """Hold an exclusive lock on one job record, against other threads and processes"""
+    # Beside the store rather than in it, so nothing listing the records trips over the locks
+    lock_dir = self.directory.rstrip(os.sep) + '.locks'
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f"{job_id}.lock"), 'w') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+  def write(self, job_id: str, **fields) -> Dict:
+    """Update fields of a job record, writing atomically so readers never see partial JSON"""
+    with self.locked(job_id):
+      return self._update(job_id, self.read(job_id), fields)
+
+
+  def start(self, job_id: str) -> bool:
+    """Mark a queued job as running, returning False and leaving the job as it is if it is not queued
+
+    A job can fail, or finish, while some of its tasks are still waiting for a worker"""
+    with self.locked(job_id):
+      job = self.read(job_id)
+      if job is None or job['status'] != QUEUED:
+        return False
+      self._update(job_id, job, {'status': RUNNING})
+      return True
+
+
+  def _update(self, job_id: str, job: Optional[Dict], fields: Dict) -> Dict:
+    # Only called holding the job's lock, so no update between the read & replace is lost
+    job = job or {'id': job_id, 'created': time.time()}
+    job.update(fields)
+    job['updated'] = time.time()
+    fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as tmp_file:
+      json.dump(job, tmp_file)
+    os.replace(tmp_path, self.path(job_id))
+    return job
+
+
+def render_job(job_store: JobStore, job_id: str, key: str, render_cache: RenderCache, segment_cache: RenderCache, workspace_root, label_dir,
+               style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY) -> str:
+  """Render one animation inside a worker process and store it in the render cache"""
+  from .RunDiagramAnim import render_animation_segmented
+  from .Workspace import render_workspace
+
+  job_store.start(job_id)
+  with render_workspace(workspace_root) as workspace:
+    output_path = render_animation_segmented('tikzit', style_content, tikz_contents_list, extra_info, segment_cache,
+                                             media_dir=workspace, label_dir=label_dir, quality=quality)
+    return render_cache.put(key, output_path)
+
+
+def render_segment_job(job_store: Optional[JobStore], job_id: Optional[str], segment_cache: RenderCache, workspace_root, label_dir,
+                       pin_dir: str, style_content: str, segment: Segment, reserve_subtitle_space: bool, quality: str) -> str:
+  """Render one segment inside a worker process, store it in the segment cache, and return its path pinned in pin_dir"""
+  pinned_path = os.path.join(pin_dir, segment.key + segment_cache.suffix)
+  if segment_cache.pin(segment.key, pinned_path) is not None:
+    return pinned_path
+
+  from .RunDiagramAnim import render_segment
+  from .Workspace import render_workspace
+
+  if job_store is not None:
+    job_store.start(job_id)
+  with render_workspace(workspace_root) as workspace:
+    output_path = render_segment(style_content, segment, reserve_subtitle_space, media_dir=workspace, label_dir=label_dir, quality=quality)
+    segment_cache.put(segment.key, output_path)
+    return link_or_copy(output_path, pinned_path)
+
+
+def join_segments_job(key: str, render_cache: RenderCache, workspace_root, segment_paths: List[str]) -> str:
+  """Join finished segments inside a worker process and store the animation in the render cache"""
+  from .Workspace import render_workspace
+
+  with render_workspace(workspace_root) as workspace:
+    output_path = join_segments(segment_paths, os.path.join(workspace, 'animation.mp4'))
+    return render_cache.put(key, output_path)
+
+
+def render_in_parallel(worker_pool: RenderWorkerPool, key: str, render_cache: RenderCache, segment_cache: RenderCache, workspace_root, label_dir,
+                       style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY,
+                       job_store: Optional[JobStore] = None, job_id: Optional[str] = None, client: Hashable = None,
+                       cost: Optional[RenderCost] = None) -> Future:
+  """Render the segments of an animation as separate tasks and join them in order
+
+  Tasks are scheduled on behalf of client, each weighed by its share of the estimated cost.
+  Returns a Future of the animation's path in the render cache, with the timing spans of every task as its spans"""
+  segments = plan_segments(style_content, tikz_contents_list, extra_info, quality)
+  reserve_subtitle_space = has_subtitles(extra_info)
+  result = Future()
+  if workspace_root is not None:
+    os.makedirs(workspace_root, exist_ok=True)
+  # Shared by the worker processes, and removed once nothing reads or writes it
+  pin_dir = tempfile.mkdtemp(prefix='join-', dir=workspace_root)
+
+  # Identical segments, such as a diagram repeated later on, are rendered once
+  segment_futures: Dict[str, Future] = {}
+  for segment in segments:
+    if segment.key not in segment_futures:
+      task_cost = cost.segment_cost(segment.kind, segment.indices) if cost is not None else 1
+      segment_futures[segment.key] = worker_pool.submit_for(client, task_cost, render_segment_job, job_store, job_id, segment_cache,
+                                                            workspace_root, label_dir, pin_dir, style_content, segment,
+                                                            reserve_subtitle_space, quality)
+
+  lock = threading.Lock()
+  remaining = [len(segment_futures)]
+
+  def finish_join(join_future: Future):
+    shutil.rmtree(pin_dir, ignore_errors=True)
+    error = join_future.exception() if not join_future.cancelled() else Exception("Joining segments was cancelled")
+    result.spans = [span for future in [*segment_futures.values(), join_future] for span in getattr(future, 'spans', [])]
+    if error is None:
+      result.set_result(join_future.result())
+    else:
+      result.set_exception(error)
+
+  def finish_segment(segment_future: Future):
+    failed_first = False
+    with lock:
+      remaining[0] -= 1
+      error = segment_future.exception() if not segment_future.cancelled() else Exception("Segment render was cancelled")
+      if error is not None and not result.done():
+        result.set_exception(error)
+        failed_first = True
+      last = remaining[0] == 0
+    if failed_first:
+      # The job has failed, so segment tasks still waiting for a worker are skipped.
+      # Cancelling runs their callbacks, so this is done outside the lock
+      for other_future in segment_futures.values():
+        other_future.cancel()
+    if not last: return
+    if result.done():
+      # A segment failed, and now every other segment task has finished with the pinned directory
+      shutil.rmtree(pin_dir, ignore_errors=True)
+      return
+    segment_paths = [segment_futures[segment.key].result() for segment in segments]
+    # Joining only copies streams, so costs about as much as a segment's setup
+    join_future = worker_pool.submit_for(client, SEGMENT_COST if cost is not None else 1, join_segments_job, key, render_cache,
+                                         workspace_root, segment_paths)
+    join_future.add_done_callback(finish_join)
+
+  if not segment_futures:
+    shutil.rmtree(pin_dir, ignore_errors=True)
+    result.set_exception(Exception("No diagrams to render"))
+  for segment_future in segment_futures.values():
+    segment_future.add_done_callback(finish_segment)
+  return result
+
+
+class RenderJobQueue():
+
+  def __init__(self, job_store: JobStore, render_cache: RenderCache, segment_cache: RenderCache, workspace_root, label_dir,
+               worker_pool: RenderWorkerPool, max_queued: int, parallel: bool = True, limits: Optional[RenderLimits] = None) -> None:
+    self.job_store = job_store
+    self.render_cache = render_cache
+    self.segment_cache = segment_cache
+    self.workspace_root = workspace_root
+    self.label_dir = label_dir
+    self.worker_pool = worker_pool
+    self.max_queued = max_queued
+    # Whether to render each job's segments as separate tasks, or each job as one task
+    self.parallel = parallel
+    self.limits = limits or RenderLimits()
+    self._lock = threading.Lock()
+    # Jobs accepted by this process which have not finished, by request key
+    self._in_flight: Dict[str, str] = {}
+    # Renders which requests are waiting on, outside the queue, which still count towards max_queued
+    self._reserved = 0
+
+
+  def start(self):
+    """Start warming the render workers; otherwise they start on the first submitted job"""
+    self.worker_pool.start()
+
+
+  def estimate(self, style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY,
+               styles: Optional[Dict[str, Dict[str, str]]] = None) -> RenderCost:
+    """Estimate the cost of a render, raising RequestTooCostlyError if it is over the limits,
+    or InvalidDiagramError if it can't be parsed"""
+    return estimate_cost(style_content, tikz_contents_list, extra_info, quality, styles, self.limits)
+
+
+  def submit(self, style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str = DEFAULT_QUALITY,
+             bounded: bool = True, client: Hashable = None, cost: Optional[RenderCost] = None) -> Dict:
+    """Queue a render for a client and return its job record without waiting for it
+
+    Raises estimate()'s errors, unless cost is given, when it has already been checked.
+    If bounded, raises QueueFullError when max_queued jobs are already queued or running"""
+    if cost is None:
+      # Before hashing or parsing anything of a request which is too big
+      self.limits.check_input(style_content, tikz_contents_list)
+    key = request_key(style_content, tikz_contents_list, extra_info, quality)
+    job_id = str(uuid.uuid4())
+    segments = [[segment.key, segment_duration(segment, quality)]
+                for segment in plan_segments(style_content, tikz_contents_list, extra_info, quality)]
+
+    # Finished before - no work to do
+    if self.render_cache.get(key):
+      return self.job_store.write(job_id, status=DONE, key=key, quality=quality, segments=segments)
+    if cost is None:
+      cost = self.estimate(style_content, tikz_contents_list, extra_info, quality)
+
+    with self._lock:
+      # Identical request already queued or running in this process
+      if key in self._in_flight:
+        return self.job_store.read(self._in_flight[key])
+      if bounded and len(self._in_flight) + self._reserved >= self.max_queued:
+        raise QueueFullError("Render queue is full")
+      job = self.job_store.write(job_id, status=QUEUED, key=key, quality=quality, segments=segments, cost=cost.summary())
+      self._in_flight[key] = job_id
+
+    if self.parallel:
+      future = render_in_parallel(self.worker_pool, key, self.render_cache, self.segment_cache, self.workspace_root, self.label_dir,
+                                  style_content, tikz_contents_list, extra_info, quality, job_store=self.job_store, job_id=job_id,
+                                  client=client, cost=cost)
+    else:
+      future = self.worker_pool.submit_for(client, cost.cost, render_job, self.job_store, job_id, key, self.render_cache, self.segment_cache,
+                                           self.workspace_root, self.label_dir, style_content, tikz_contents_list, extra_info, quality)
+    future.add_done_callback(lambda future: self._finish(job_id, key, future))
+    return job
+
+
+  @contextmanager
+  def reserve(self):
+    """Count a render a request waits on, outside the queue, towards max_queued while it runs
+
+    Raises QueueFullError if max_queued jobs & renders are already queued or running"""
+    with self._lock:
+      if len(self._in_flight) + self._reserved >= self.max_queued:
+        raise QueueFullError("Render queue is full")
+      self._reserved += 1
+    try:
+      yield
+    finally:
+      with self._lock:
+        self._reserved -= 1
+
+
+  def _finish(self, job_id: str, key: str, future):
+    with self._lock:
+      self._in_flight.pop(key, None)
+    error = future.exception()
+    if error is None:
+      self.job_store.write(job_id, status=DONE)
+    else:
+      print("Error:", error)
+      self.job_store.write(job_id, status=FAILED, error=str(error))
+
+
+  def status(self, job_id: str) -> Optional[Dict]:
+    return self.job_store.read(job_id)
+
+
+  def ready_segments(self, job: Dict) -> int:
+    """Number of segments at the start of a job which are finished, and so can be streamed
+
+    Playlists are polled, so this doesn't count as using the segments, for LRU order or hit rates"""
+    ready_count = 0
+    for segment_key, _ in job.get('segments', []):
+      if not self.segment_cache.contains(segment_key): break
+      ready_count += 1
+    return ready_count
+
+
+  def segment_path(self, job: Dict, number: int) -> Optional[str]:
+    """Return a finished segment of a job, or None if it is not available"""
+    segments = job.get('segments', [])
+    if not 0 <= number < len(segments):
+      return None
+    return self.segment_cache.get(segments[number][0])
+
+
+  def result_path(self, job_id: str) -> Optional[str]:
+    """Return the finished video of a job, or None if it is not available"""
+    job = self.job_store.read(job_id)
+    if job is None or job['status'] != DONE:
+      return None
+    return self.render_cache.get(job['key'])
+
+
+class RenderBatches():
+
+  def __init__(self, batch_store: JobStore, job_queue: RenderJobQueue, max_sequences: int) -> None:
+    self.batch_store = batch_store
+    self.job_queue = job_queue
+    self.max_sequences = max_sequences
+
+
+  def submit(self, style_content: str, sequences: List[Tuple[str, List[str], Dict]], quality: str = DEFAULT_QUALITY,
+             client: Hashable = None) -> Dict:
+    """Queue a job for each (name, TikZ inputs, extra info) sequence and return the batch record
+
+    A batch is accepted whole, so its jobs don't count towards the job queue's limit, but each
+    sequence must be within the job queue's render limits, or RequestTooCostlyError is raised
+    before any job is queued. The jobs are all the client's, so a batch takes its fair share of
+    the workers rather than holding up every request after it"""
+    if len(sequences) > self.max_sequences:
+      raise BatchTooLargeError(f"Batches may have at most {self.max_sequences} sequences")
+    # Every sequence's size is checked before any is parsed
+    for _, tikz_contents_list, _ in sequences:
+      self.job_queue.limits.check_input(style_content, tikz_contents_list)
+    # Parsed once for every sequence's estimate
+    try:
+      styles = TikzParser.parse_styles(style_content)
+    except Exception as error:
+      raise InvalidDiagramError(f"Invalid style sheet: {error}") from error
+    costs = [self.job_queue.estimate(style_content, tikz_contents_list, extra_info, quality, styles)
+             for _, tikz_contents_list, extra_info in sequences]
+    jobs = []
+    for (name, tikz_contents_list, extra_info), cost in zip(sequences, costs):
+      job = self.job_queue.submit(style_content, tikz_contents_list, extra_info, quality, bounded=False, client=client, cost=cost)
+      jobs.append({'name': name, 'job_id': job['id']})
+    return self.batch_store.write(str(uuid.uuid4()), quality=quality, jobs=jobs)
+
+
+  def status(self, batch_id: str) -> Optional[Dict]:
+    """Return a batch record with the current record of each of its jobs, and counts by status"""
+    batch = self.batch_store.read(batch_id)
+    if batch is None:
+      return None
+    counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+    for entry in batch['jobs']:
+      entry['job'] = self.job_queue.status(entry['job_id']) or {'id': entry['job_id'], 'status': FAILED, 'error': "Job record is missing"}
+      counts[entry['job']['status']] += 1
+    batch['counts'] = counts
+    batch['status'] = DONE if counts[DONE] + counts[FAILED] == len(batch['jobs']) else RUNNING
+    return batch
@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from typing import Dict
+
+"""
+RenderQuality lists the quality tiers a render can ask for
+
+- draft  - 240p at 10 fps with short holds, for previews while editing
+- low    - 480p at 15 fps, the default, matching Manim's low_quality
+- medium - 720p at 30 fps
+- high   - 1080p at 60 fps, for final export
+
+The tier is part of a render's cache key, and Manim names its output
+directory after the resolution & frame rate, so tiers never share files.
+
+This module must not import Manim, so the web processes can validate requests cheaply.
+"""
+
+
+class UnknownQualityError(Exception):
+  """Raised when a request asks for a quality tier which does not exist"""
+
+
+@dataclass(frozen=True)
+class RenderQuality:
+  name: str
+  pixel_width: int
+  pixel_height: int
+  frame_rate: int
+  # Seconds each diagram is shown for, and each transition between diagrams takes
+  hold_time: float
+  transition_time: float
+
+
+QUALITY_TIERS: Dict[str, RenderQuality] = {
+  'draft': RenderQuality('draft', 426, 240, 10, hold_time=0.25, transition_time=0.5),
+  'low': RenderQuality('low', 854, 480, 15, hold_time=1, transition_time=1),
+  'medium': RenderQuality('medium', 1280, 720, 30, hold_time=1, transition_time=1),
+  'high': RenderQuality('high', 1920, 1080, 60, hold_time=1, transition_time=1),
+}
+
+DEFAULT_QUALITY = 'low'
+
+
+def get_quality(name=None) -> RenderQuality:
+  """Look up a quality tier by name, using the default tier if name is None"""
+  if name is None: name = DEFAULT_QUALITY
+  try:
+    return QUALITY_TIERS[name]
+  except (KeyError, TypeError):
+    raise UnknownQualityError(f"Unknown render quality {name!r}, expected one of: {', '.join(QUALITY_TIERS)}")
@@ -0,0 +1,144 @@
+import math
+import os
+import subprocess
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+from .RenderCache import canonical_hash
+from .RenderQuality import get_quality
+from .Timing import span
+
+"""
+RenderSegments splits an animation into segments which can be rendered & cached separately
+
+For diagrams 0..n-1 the segments are, in order:
+  hold 0, transition 0 -> 1, hold 1, transition 1 -> 2, ..., hold n-1
+which is exactly the sequence DiagramScene plays in one go.
+
+A segment's key hashes only what it shows: the styles, its one or two diagrams and their
+extra info, the quality tier, and whether space is reserved for subtitles (which moves every
+diagram). Editing one diagram therefore changes its hold and the transitions either side of it.
+
+Finished segments are joined by ffmpeg's concat demuxer with stream copy, so nothing is
+re-encoded. This works because every segment of a request shares one codec configuration.
+
+A hold shows one unchanging frame, so it is rendered as a single image and encoded by
+ffmpeg looping that image, rather than rasterising and piping the same frame many times.
+The encoder settings match Manim's own (H.264, yuv420p), so holds join with transitions.
+
+Segments can also be streamed before the whole animation is finished: each is remuxed
+(again without re-encoding) to an MPEG-TS file and listed in an HLS playlist as soon as
+it and every segment before it are ready.
+
+This module must not import Manim.
+"""
+
+HOLD = 'hold'
+TRANSITION = 'transition'
+
+FFMPEG = 'ffmpeg'
+
+
+@dataclass(frozen=True)
+class Segment:
+  kind: str
+  # Indices of the diagrams shown, one for a hold and two for a transition
+  indices: Tuple[int, ...]
+  tikz_contents: Tuple[str, ...]
+  extra_info: Tuple[Dict, ...]
+  key: str
+
+
+def has_subtitles(extra_info: Dict) -> bool:
+  return any(len(diagram_info.get('subtitle', '')) > 0 for diagram_info in extra_info.values())
+
+
+def segment_key(style_content: str, tikz_contents: Tuple[str, ...], extra_info: Tuple[Dict, ...], quality: str,
+                reserve_subtitle_space: bool) -> str:
+  return canonical_hash({
+    'styles': style_content,
+    'tikz': list(tikz_contents),
+    'extra_info': list(extra_info),
+    'quality': quality,
+    'subtitle_space': reserve_subtitle_space,
+  })
+
+
+def plan_segments(style_content: str, tikz_contents_list: List[str], extra_info: Dict, quality: str) -> List[Segment]:
+  """List the holds & transitions of an animation in playing order"""
+  reserve_subtitle_space = has_subtitles(extra_info)
+
+  def create_segment(kind, indices):
+    tikz_contents = tuple(tikz_contents_list[index] for index in indices)
+    segment_info = tuple(extra_info[index] for index in indices)
+    key = segment_key(style_content, tikz_contents, segment_info, quality, reserve_subtitle_space)
+    return Segment(kind, indices, tikz_contents, segment_info, key)
+
+  segments = []
+  for i in range(len(tikz_contents_list)):
+    if i > 0:
+      segments.append(create_segment(TRANSITION, (i - 1, i)))
+    segments.append(create_segment(HOLD, (i,)))
+  return segments
+
+
+def segment_duration(segment: Segment, quality: str) -> float:
+  """Length of a segment in seconds"""
+  render_quality = get_quality(quality)
+  return render_quality.hold_time if segment.kind == HOLD else render_quality.transition_time
+
+
+def run_ffmpeg(arguments: List[str], error_message: str):
+  command = [FFMPEG, '-y', '-loglevel', 'error', *arguments]
+  with span('encode'):
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+  if result.returncode != 0:
+    raise Exception(error_message, result.stderr.strip())
+
+
+def join_segments(segment_paths: List[str], output_path: str) -> str:
+  """Concatenate video segments into output_path without re-encoding them"""
+  list_path = output_path + '.txt'
+  with open(list_path, 'w') as list_file:
+    for segment_path in segment_paths:
+      # The concat demuxer reads single-quoted paths, with quotes escaped as '\''
+      escaped_path = os.path.abspath(segment_path).replace("'", "'\\''")
+      list_file.write(f"file '{escaped_path}'\n")
+
+  run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy', '-movflags', '+faststart', output_path],
+             "Unable to join animation segments:")
+  return output_path
+
+
+def encode_still(image_path: str, output_path: str, duration: float, frame_rate: int) -> str:
+  """Encode an image held for duration seconds, with the same codec settings as Manim's videos"""
+  num_frames = max(1, round(duration * frame_rate))
+  run_ffmpeg(['-loop', '1', '-framerate', str(frame_rate), '-i', image_path, '-frames:v', str(num_frames),
+              '-an', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', output_path],
+             "Unable to encode held frame:")
+  return output_path
+
+
+def transport_stream(segment_path: str, output_path: str) -> str:
+  """Remux an MP4 segment into an MPEG-TS file for HLS, without re-encoding it"""
+  run_ffmpeg(['-i', segment_path, '-c', 'copy', '-bsf:v', 'h264_mp4toannexb', '-f', 'mpegts', output_path],
+             "Unable to remux animation segment:")
+  return output_path
+
+
+def hls_playlist(durations: List[float], ready_count: int, segment_uri: Callable[[int], str], complete: bool) -> str:
+  """An HLS playlist of the first ready_count segments, out of segments with the given durations
+
+  Players reload the playlist until it ends with EXT-X-ENDLIST, which is only added once complete.
+  Every segment starts its timestamps from zero, so each is marked as a discontinuity"""
+  # Must not change between reloads, so it covers segments which aren't ready yet
+  target_duration = math.ceil(max(durations, default=1))
+  lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{target_duration}',
+           '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT']
+  for number, duration in enumerate(durations[:ready_count]):
+    if number > 0: lines.append('#EXT-X-DISCONTINUITY')
+    lines.append(f'#EXTINF:{duration:.3f},')
+    lines.append(segment_uri(number))
+  if complete:
+    lines.append('#EXT-X-ENDLIST')
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,265 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import pickle
+import resource
+import threading
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Dict, Hashable, List, Optional
+
+from .Timing import collect_spans, observe_spans
+
+"""
+RenderWorkers keeps a pool of long-lived render processes which import Manim once
+
+Each worker:
+- imports Manim and the animation modules, then renders a throwaway label and subtitle
+  so LaTeX, Cairo and Pango are warm before the first real job arrives
+- is sent one task at a time over its own pipe, so the pool always knows which
+  task a worker was running if it dies
+- exits after max_jobs jobs, or once its memory use passes max_memory bytes,
+  and is replaced by a fresh warm worker
+
+Queued tasks are scheduled fairly between clients, weighed by each task's estimated
+cost (see RenderCost), rather than first come first served. Each task gets a finish tag:
+  start = max(virtual time, finish tag of the client's previous task)
+  finish = start + cost
+and idle workers take the task with the smallest finish tag, moving the virtual time up
+to its start. A client's tasks still run in the order submitted, but a client with a few
+small tasks is served between the tasks of one with many large ones, rather than after
+them, and a client's unused share is not saved up while it has nothing queued.
+
+submit() returns a concurrent.futures.Future, like an Executor. The timing spans
+measured while running a task are sent back with its result, recorded in this
+process's histograms, and left on the future as future.spans.
+"""
+
+# Messages sent from workers back to the pool
+_READY = 'ready'
+_FINISHED = 'finished'
+_FAILED = 'failed'
+
+
+def memory_usage() -> int:
+  """Resident memory of this process in bytes"""
+  try:
+    with open('/proc/self/statm', 'r') as statm:
+      return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+  except (OSError, ValueError):
+    # ru_maxrss is peak usage, in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def warm_up():
+  """Do the expensive one-off setup of a render process"""
+  try:
+    from manim import Tex, Text, BLACK
+    from .RunDiagramAnim import scoped_config
+    from .Workspace import render_workspace
+
+    with render_workspace() as workspace, scoped_config(workspace):
+      Tex('$x$', color=BLACK)
+      Text('x', color=BLACK)
+  except Exception as error:
+    # A worker which can't warm up can still try real jobs
+    print("Render worker warm up failed:", error)
+
+
+def picklable_error(error: BaseException) -> BaseException:
+  try:
+    pickle.dumps(error)
+    return error
+  except Exception:
+    return Exception(f"{type(error).__name__}: {error}")
+
+
+def worker_main(conn, max_jobs: int, max_memory: int):
+  warm_up()
+  conn.send((_READY, None, None, False, []))
+  jobs_done = 0
+  retiring = False
+  while not retiring:
+    task = conn.recv()
+    if task is None: break
+    task_id, fn, args, kwargs = task
+    with collect_spans() as spans:
+      try:
+        message, value = _FINISHED, fn(*args, **kwargs)
+      except BaseException as error:
+        message, value = _FAILED, picklable_error(error)
+    # Recycle the worker to release memory Manim and Cairo hold on to.
+    # This is sent with the result so the pool never hands a retiring worker another task
+    jobs_done += 1
+    retiring = jobs_done >= max_jobs or memory_usage() > max_memory
+    conn.send((message, task_id, value, retiring, spans))
+
+
+class _Worker():
+
+  def __init__(self, process, conn) -> None:
+    self.process = process
+    self.conn = conn
+    self.ready = False
+    self.retiring = False
+    self.task_id: Optional[int] = None
+
+
+class RenderWorkerPool():
+
+  def __init__(self, max_workers: int, max_jobs: int, max_memory: int) -> None:
+    self.max_workers = max_workers
+    self.max_jobs = max_jobs
+    self.max_memory = max_memory
+    self._context = multiprocessing.get_context('spawn')
+    self._task_ids = itertools.count()
+    # Heap of (finish tag, task id, start tag, task)
+    self._pending: List = []
+    # Virtual time of the fair scheduler, and the finish tag of each client's latest task
+    self._virtual_time = 0.0
+    self._client_finish: Dict[Hashable, float] = {}
+    self._futures: Dict[int, Future] = {}
+    self._workers: List[_Worker] = []
+    self._lock = threading.Lock()
+    # Wakes the supervisor when a task is submitted
+    self._wakeup_reader, self._wakeup_writer = multiprocessing.Pipe(duplex=False)
+    self._shutdown = False
+    self._supervisor: Optional[threading.Thread] = None
+
+
+  def start(self):
+    """Spawn and warm all workers, if they have not been started already"""
+    with self._lock:
+      if self._supervisor is not None: return
+      for _ in range(self.max_workers):
+        self._spawn_worker()
+      self._supervisor = threading.Thread(target=self._supervise, name='render-worker-supervisor', daemon=True)
+      self._supervisor.start()
+
+
+  def _spawn_worker(self):
+    parent_conn, child_conn = self._context.Pipe()
+    process = self._context.Process(target=worker_main, name='render-worker', daemon=True,
+                                    args=(child_conn, self.max_jobs, self.max_memory))
+    process.start()
+    child_conn.close()
+    self._workers.append(_Worker(process, parent_conn))
+
+
+  def submit(self, fn, *args, **kwargs) -> Future:
+    return self.submit_for(None, 1, fn, *args, **kwargs)
+
+
+  def submit_for(self, client: Hashable, cost: float, fn, *args, **kwargs) -> Future:
+    """Submit a task on behalf of a client, scheduled fairly against other clients' tasks by its cost"""
+    self.start()
+    future = Future()
+    task_id = next(self._task_ids)
+    with self._lock:
+      if self._shutdown: raise RuntimeError("Cannot submit to a pool which has been shut down")
+      self._futures[task_id] = future
+      start_tag = max(self._virtual_time, self._client_finish.get(client, 0))
+      finish_tag = self._client_finish[client] = start_tag + cost
+      heapq.heappush(self._pending, (finish_tag, task_id, start_tag, (task_id, fn, args, kwargs)))
+    self._wakeup_writer.send_bytes(b'')
+    return future
+
+
+  def _supervise(self):
+    while not self._shutdown:
+      self._dispatch()
+      workers = list(self._workers)
+      waitables = [self._wakeup_reader]
+      for worker in workers:
+        waitables += [worker.conn, worker.process.sentinel]
+      ready = wait(waitables, timeout=1)
+
+      while self._wakeup_reader.poll():
+        self._wakeup_reader.recv_bytes()
+      for worker in workers:
+        if worker.conn in ready:
+          self._receive(worker)
+        if worker.process.sentinel in ready:
+          self._replace(worker)
+
+
+  def _dispatch(self):
+    """Send pending tasks to idle workers"""
+    for worker in self._workers:
+      if not worker.ready or worker.retiring or worker.task_id is not None: continue
+      with self._lock:
+        if not self._pending: return
+        _, _, start_tag, task = heapq.heappop(self._pending)
+        self._virtual_time = max(self._virtual_time, start_tag)
+        if not self._pending:
+          # Every client is caught up, so finish tags no longer matter
+          self._client_finish.clear()
+        task_id = task[0]
+        future = self._futures[task_id]
+      if not future.set_running_or_notify_cancel():
+        with self._lock: del self._futures[task_id]
+        continue
+      worker.task_id = task_id
+      worker.conn.send(task)
+
+
+  def _receive(self, worker: _Worker):
+    try:
+      while worker.conn.poll():
+        message, task_id, value, retiring, spans = worker.conn.recv()
+        if message == _READY:
+          worker.ready = True
+          continue
+        worker.task_id = None
+        worker.retiring = retiring
+        observe_spans(spans)
+        with self._lock:
+          future = self._futures.pop(task_id, None)
+        if future is None: continue
+        future.spans = spans
+        if message == _FINISHED:
+          future.set_result(value)
+        else:
+          future.set_exception(value)
+    except (EOFError, OSError):
+      # The worker has exited; its sentinel handles the rest
+      pass
+
+
+  def _replace(self, worker: _Worker):
+    """Clean up an exited worker, failing any task it was running, and start a new one"""
+    self._receive(worker)
+    worker.process.join()
+    worker.conn.close()
+    with self._lock:
+      self._workers.remove(worker)
+      future = self._futures.pop(worker.task_id, None) if worker.task_id is not None else None
+      if not self._shutdown: self._spawn_worker()
+    if future is not None:
+      future.set_exception(Exception(f"Render worker exited unexpectedly with code {worker.process.exitcode}"))
+
+
+  def shutdown(self):
+    """Stop the workers after their current tasks; queued tasks are cancelled"""
+    with self._lock:
+      self._shutdown = True
+      pending = list(self._pending)
+      self._pending.clear()
+      self._client_finish.clear()
+    for _, task_id, _, _ in pending:
+      future = self._futures.pop(task_id, None)
+      if future: future.cancel()
+    if self._supervisor is not None:
+      self._supervisor.join()
+    for worker in list(self._workers):
+      # Collect results of tasks which were still running
+      if worker.task_id is not None:
+        worker.conn.poll(None)
+        self._receive(worker)
+      if not worker.retiring:
+        try:
+          worker.conn.send(None)
+        except OSError:
+          pass
+      worker.process.join()
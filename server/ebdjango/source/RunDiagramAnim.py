@@ -1,6 +1,40 @@
+import os
 import sys
+import threading
+from contextlib import ExitStack, contextmanager
 from manim import *
-from .DiagramAnim import DiagramScene
+from .DiagramAnim import DiagramFrameScene, DiagramScene, DiagramSegmentScene, precompile_labels
+from .DiagramCache import diagram_directory
+from .RenderCache import RenderCache
+from .RenderQuality import DEFAULT_QUALITY, get_quality
+from .RenderSegments import HOLD, Segment, encode_still, has_subtitles, join_segments, plan_segments
+from .Timing import span
+
+
+# Manim's config is process-global, so only one scene may use it at a time per process
+_config_lock = threading.RLock()
+
+
+@contextmanager
+def scoped_config(media_dir=None, label_dir=None, quality=DEFAULT_QUALITY):
+  """Give one render its own copy of the Manim config, writing into media_dir at the given quality tier
+
+  Compiled Tex and Text SVGs go in label_dir instead, if given, so they can be shared between renders,
+  along with converted diagrams"""
+  render_quality = get_quality(quality)
+  with _config_lock, tempconfig({}), ExitStack() as stack:
+    config.pixel_width = render_quality.pixel_width
+    config.pixel_height = render_quality.pixel_height
+    config.frame_rate = render_quality.frame_rate
+    # LabelCache removes each label's own LaTeX files - Manim's cleanup would delete other compiles' files too
+    config.no_latex_cleanup = True
+    if media_dir is not None:
+      config.media_dir = str(media_dir)
+    if label_dir is not None:
+      config.tex_dir = os.path.join(label_dir, 'Tex')
+      config.text_dir = os.path.join(label_dir, 'texts')
+      stack.enter_context(diagram_directory(os.path.join(label_dir, 'diagrams')))
+    yield config
 
 
 def split_list(input_list, length):
@@ -18,28 +52,106 @@ def render_animation_from_files(tikz_type, style_file_path, tikz_file_paths):
 
   else: raise Exception("Freetikz not ready yet")
 
-  config.quality = "low_quality"
-  scene = DiagramScene(tikz_and_style_pairs)
-  scene.render()
+  with scoped_config():
+    scene = DiagramScene(tikz_and_style_pairs)
+    scene.prepare()
+    with span('render'):
+      scene.render()
+
 
+def render_animation(tikz_type, style_content, tikz_contents_list, extra_info, media_dir=None, label_dir=None, quality=DEFAULT_QUALITY):
+  """Render an animation at a quality tier and return the path of the finished video
 
-def render_animation(tikz_type, style_content, tikz_contents_list, extra_info):
+  Output is written inside media_dir, so each caller should pass its own workspace.
+  Compiled labels are stored in label_dir, which can be shared by every caller"""
   if tikz_type == 'tikzit':
     tikz_and_style_pairs = [(tikz_content, style_content) for tikz_content in tikz_contents_list]
 
   else: raise Exception("Freetikz not ready yet")
 
-  config.quality = "low_quality"
-  scene = DiagramScene(tikz_and_style_pairs, extra_info=extra_info)
-  scene.render()
+  render_quality = get_quality(quality)
+  with scoped_config(media_dir, label_dir, quality):
+    scene = DiagramScene(tikz_and_style_pairs, extra_info=extra_info,
+                         hold_time=render_quality.hold_time, transition_time=render_quality.transition_time)
+    # Diagrams are built first, so their parse, convert, build & tex spans aren't inside the render span
+    scene.prepare()
+    with span('render'):
+      scene.render()
+    return str(scene.renderer.file_writer.movie_file_path)
+
+
+def render_segment(style_content, segment: Segment, reserve_subtitle_space: bool, media_dir=None, label_dir=None, quality=DEFAULT_QUALITY):
+  """Render one hold or transition of an animation and return the path of its video"""
+  tikz_and_style_pairs = [(tikz_content, style_content) for tikz_content in segment.tikz_contents]
+  extra_info = dict(enumerate(segment.extra_info))
+  render_quality = get_quality(quality)
+
+  if segment.kind == HOLD:
+    # Every frame of a hold is the same, so render it once and let ffmpeg repeat it
+    with scoped_config(media_dir, label_dir, quality):
+      config.write_to_movie = False
+      config.save_last_frame = True
+      scene = DiagramFrameScene(tikz_and_style_pairs, extra_info=extra_info, reserve_subtitle_space=reserve_subtitle_space)
+      scene.prepare()
+      with span('render'):
+        scene.render()
+      image_path = str(scene.renderer.file_writer.image_file_path)
+    output_path = os.path.join(os.path.dirname(image_path), 'hold.mp4')
+    return encode_still(image_path, output_path, render_quality.hold_time, render_quality.frame_rate)
+
+  with scoped_config(media_dir, label_dir, quality):
+    scene = DiagramSegmentScene(tikz_and_style_pairs, extra_info=extra_info, reserve_subtitle_space=reserve_subtitle_space,
+                                hold_time=render_quality.hold_time, transition_time=render_quality.transition_time)
+    scene.prepare()
+    with span('render'):
+      scene.render()
+    return str(scene.renderer.file_writer.movie_file_path)
+
+
+def render_animation_segmented(tikz_type, style_content, tikz_contents_list, extra_info, segment_cache: RenderCache,
+                               media_dir, label_dir=None, quality=DEFAULT_QUALITY):
+  """Render an animation one segment at a time and return the path of the joined video
+
+  Segments already in segment_cache are reused, so after editing one diagram only
+  its hold and the transitions either side of it are rendered again"""
+  if tikz_type != 'tikzit': raise Exception("Freetikz not ready yet")
+
+  segments = plan_segments(style_content, tikz_contents_list, extra_info, quality)
+  reserve_subtitle_space = has_subtitles(extra_info)
+
+  # Cached segments are pinned into the workspace, so eviction while the rest render can't remove them before the join
+  cached_paths = [segment_cache.pin(segment.key, os.path.join(media_dir, f"cached-{number}{segment_cache.suffix}"))
+                  for number, segment in enumerate(segments)]
+
+  # Labels of every diagram still to render are compiled together up front, rather than a few per segment
+  uncached_indices = sorted({index for segment, path in zip(segments, cached_paths) if path is None for index in segment.indices})
+  if uncached_indices:
+    with scoped_config(media_dir, label_dir, quality):
+      precompile_labels([(tikz_contents_list[index], style_content) for index in uncached_indices])
+
+  segment_paths = []
+  for number, (segment, segment_path) in enumerate(zip(segments, cached_paths)):
+    if segment_path is None:
+      # Each segment writes into its own directory, as Manim names files after the scene
+      segment_dir = os.path.join(media_dir, f"segment-{number}")
+      segment_path = render_segment(style_content, segment, reserve_subtitle_space, segment_dir, label_dir, quality)
+      segment_cache.put(segment.key, segment_path)
+    segment_paths.append(segment_path)
+
+  return join_segments(segment_paths, os.path.join(media_dir, 'animation.mp4'))
 
 
 
 if __name__ == '__main__':
   """Run Diagram animation from command line"""
   # args in format: -tikz_type -s style_file tikz_file tikz_file ...
+  # or: build MANIFEST_OR_DIRECTORY [-o OUTPUT] [-j N] [--quality Q] [--force] to render many sequences
   args = sys.argv[1:]
 
+  if args and args[0] == 'build':
+    from .BuildAnimations import main
+    sys.exit(main(args[1:]))
+
   tikz_type = args[0][1:]
   assert tikz_type in ['tikzit', 'freetikz'], "You must include a tikz type flag: -tikzit or -freetikz"
 
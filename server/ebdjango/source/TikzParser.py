@@ -28,6 +28,85 @@ TikzDiagram class instance - contains:
 
 """
 
+# Splits TikZ into tokens in one pass: commands, comments, whole bracketed groups with
+# nothing nested inside, single brackets & semicolons, and runs of any other text.
+# Every alternative is a single character or a run of one negated character class ended
+# by a character outside it, so matching never backtracks and is linear in the input.
+# A token's kind is given by its first character.
+TOKEN_PATTERN = re.compile(r"""
+  \\(?:[A-Za-z]+|.)?
+  |%[^\n]*
+  |\([^()\\%;]*\)
+  |\[[^\[\]\\%]*\]
+  |\{[^{}\\%]*\}
+  |[()\[\]{};]
+  |[^\\%()\[\]{};]+
+""", re.VERBOSE | re.DOTALL)
+
+CLOSING_BRACKETS = {'(': ')', '[': ']', '{': '}'}
+
+# Commands which always start a new statement, so a group is never read past them
+STATEMENT_COMMANDS = {'\\node', '\\draw', '\\tikzstyle', '\\begin', '\\end'}
+
+
+def tokenize(tikz: str) -> List[str]:
+  """Split TikZ code into tokens, dropping comments"""
+  return [token for token in TOKEN_PATTERN.findall(tikz) if token[0] != '%']
+
+
+def skip_whitespace(tokens: List[str], i: int) -> int:
+  while i < len(tokens) and tokens[i].isspace():
+    i += 1
+  return i
+
+
+def read_group(tokens: List[str], i: int, opener: str):
+  """Read a bracketed group starting at tokens[i]
+
+  Returns the text inside the brackets and the index after the group,
+  or None and the index to carry on from if there is no complete group"""
+  i = skip_whitespace(tokens, i)
+  if i >= len(tokens) or tokens[i][0] != opener:
+    return None, i
+  if len(tokens[i]) > 1:
+    return tokens[i][1:-1], i + 1
+  closer = CLOSING_BRACKETS[opener]
+  depth = 0
+  for j in range(i, len(tokens)):
+    token = tokens[j]
+    if token == opener:
+      depth += 1
+    elif token == closer:
+      depth -= 1
+      if depth == 0:
+        return ''.join(tokens[i + 1:j]), j + 1
+    elif token in STATEMENT_COMMANDS or (token == ';' and opener == '('):
+      return None, j
+  return None, len(tokens)
+
+
+def parse_options(options: str) -> List[Tuple[str, Union[str, None]]]:
+  """Split an option list like 'in=-180, bend left=30' into (key, value) pairs"""
+  pairs = []
+  for option in options.split(','):
+    key, equals, value = option.partition('=')
+    pairs.append((key.strip(), value.strip() if equals else None))
+  return pairs
+
+
+def parse_number(value: Union[str, None]) -> Union[float, None]:
+  if value is None: return None
+  try:
+    return float(value)
+  except ValueError:
+    return None
+
+
+def parse_coordinates(coordinates: str) -> Tuple[float, float]:
+  x, _, y = coordinates.rpartition(',')
+  return float(x), float(y)
+
+
 class Location():
   def __init__(self, location: str) -> None:
     self.type = None
@@ -40,8 +119,7 @@ class Location():
         return location[:-7]
       if ',' in location:
         self.type = 'coordinate'
-        coords_tuple = re.findall(r"(.+), (.+)", location)[0]
-        return float(coords_tuple[0]), float(coords_tuple[1])
+        return parse_coordinates(location)
       if '.' in location:
         self.type = 'compass'
         id, direction = location.split('.')
@@ -79,20 +157,109 @@ class TikzDiagram():
 
 class TikzParser():
 
+  @staticmethod
+  def parse_node(tokens: List[str], i: int):
+    """Parse '[style] (id) at (x, y) {label}' following a \\node command
+
+    Returns the node, or None if the statement is malformed, and the index to carry on from"""
+    style, i = read_group(tokens, i, '[')
+    if style is None: return None, i
+    id, i = read_group(tokens, i, '(')
+    if id is None: return None, i
+    i = skip_whitespace(tokens, i)
+    if i >= len(tokens) or tokens[i].strip() != 'at':
+      return None, i
+    position_str, i = read_group(tokens, i + 1, '(')
+    if position_str is None: return None, i
+    label, i = read_group(tokens, i, '{')
+    if label is None: return None, i
+
+    if style.startswith('style='): style = style[6:]
+    return TikzNode(style, id, parse_coordinates(position_str), label), i
+
+
+  @staticmethod
+  def parse_line(tokens: List[str], i: int):
+    """Parse everything up to ';' following a \\draw command
+
+    Returns the line, or None if the statement is unterminated, and the index to carry on from"""
+    start = i
+    options = []
+    endpoints = []
+    has_to = False
+    while i < len(tokens):
+      token = tokens[i]
+      first = token[0]
+      if token == ';': break
+      if first in CLOSING_BRACKETS:
+        group, i = read_group(tokens, i, first)
+        if group is None: return None, i
+        if first == '[': options += parse_options(group)
+        elif first == '(': endpoints.append(group)
+        continue
+      if token in STATEMENT_COMMANDS: return None, i
+      if first != '\\' and not has_to: has_to = 'to' in token.split()
+      i += 1
+    else:
+      return None, i
+
+    if len(endpoints) < 2 or not has_to:
+      raise Exception("Invalid line endpoints: ", '\\draw' + ''.join(tokens[start:i]) + ';')
+    start_loc = Location(endpoints[0])
+    end_loc = Location(endpoints[-1])
+
+    # Curve properties - the first value given for each is used
+    values = {}
+    bend_key = None
+    for key, value in options:
+      if value is None or key in values: continue
+      values[key] = value
+      if bend_key is None and key.startswith('bend '): bend_key = key
+    in_angle = parse_number(values.get('in'))
+    out_angle = parse_number(values.get('out'))
+    looseness = parse_number(values.get('looseness'))
+
+    # If property is bend left/right
+    #   - if left: correct out_angle      - if right: -angle is out_angle
+    #   - if left: 180-angle is in_angle  - if right: -180+angle is in_angle
+    bend_angle = parse_number(values[bend_key]) if bend_key else None
+    if bend_angle is not None:
+      bend_dir = bend_key[5:].strip()
+      if bend_dir == 'left':
+        out_angle = bend_angle
+        in_angle = 180 - bend_angle
+      elif bend_dir == 'right':
+        out_angle = -bend_angle
+        in_angle = -180 + bend_angle
+      else:
+        raise Exception("Bend direction must be left or right")
+
+    return TikzLine(start_loc, end_loc, in_angle, out_angle, looseness), i + 1
+
+
+  @staticmethod
+  def parse_statements(tikz) -> Tuple[List[TikzNode], List[TikzLine]]:
+    """Return all nodes and lines from TikZ code in a single pass"""
+    tokens = tokenize(tikz)
+    nodes = []
+    lines = []
+    i = 0
+    while i < len(tokens):
+      token = tokens[i]
+      i += 1
+      if token == '\\node':
+        node, i = TikzParser.parse_node(tokens, i)
+        if node: nodes.append(node)
+      elif token == '\\draw':
+        line, i = TikzParser.parse_line(tokens, i)
+        if line: lines.append(line)
+    return nodes, lines
+
+
   @staticmethod
   def parse_nodes(tikz) -> List[TikzNode]:
     """Return all nodes from TikZ code"""
-    node_pattern = r"\\node\s*\[(.+)\] \((.+)\) at \((.+)\) \{(.*)\}"
-    matches = re.findall(node_pattern, tikz)
-    nodes = []
-    for match in matches:
-      style, id, position_str, label, = match
-      if style.startswith('style='): style = style[6:]
-      position_tuple = re.findall(r"(.+), (.+)", position_str)[0]
-      position = (float(position_tuple[0]), float(position_tuple[1]))
-      node = TikzNode(style, id, position, label)
-      nodes.append(node)
-    return nodes
+    return TikzParser.parse_statements(tikz)[0]
   
 
   @staticmethod
@@ -100,84 +267,49 @@ class TikzParser():
       """Clean endpoint to remove '.center' or extract coordinates"""
       if location.endswith(".center"): return location[:-7]
       if ',' in location:
-        coords_tuple = re.findall(r"(.+), (.+)", location)[0]
-        return float(coords_tuple[0]), float(coords_tuple[1])
+        return parse_coordinates(location)
       return location
 
 
   @staticmethod
   def parse_lines(tikz) -> List[TikzLine]:
-    """Return all nodes from TikZ code"""
-    line_pattern = r"\\draw[^\\;]+;"
-    line_matches = re.findall(line_pattern, tikz)
-    
-    lines = []
-    for line_str in line_matches:
-      curve_props_pattern = r"\[(.+)\]"
-      curve_props_match = re.search(curve_props_pattern, line_str)
-      curve_props = curve_props_match.group() if curve_props_match else ''
-
-      # Curve properties
-      curve_prop_values = []
-      for match_word in ['in', 'out', 'looseness']:
-        search_string = r"(?<=" + match_word + r"=)\-?\d+(\.\d+)?"
-        matched_value = re.search(search_string, curve_props)
-        curve_prop_values.append(matched_value.group() if matched_value else None)
-
-      in_angle, out_angle, looseness = curve_prop_values
-      if in_angle: in_angle = float(in_angle)
-      if out_angle: out_angle = float(out_angle)
-      if looseness: looseness = float(looseness)
-
-      # Endpoints
-      endpoints_pattern = r"\((.+)\)\sto[^\\;\(]+\((.+)\);"
-      endpoints_match = re.search(endpoints_pattern, line_str)
-      if endpoints_match == None:
-        raise Exception("Invalid line endpoints: ", line_str)
-      start_loc_str, end_loc_str = endpoints_match.groups()
-      start_loc = Location(start_loc_str)
-      end_loc = Location(end_loc_str)
-
-      # If property is bend left/right
-      bend_pattern = r"(?<=bend )([a-z]+)=(-?\d+(\.\d+)?)"
-      bend_match = re.search(bend_pattern, curve_props)
-      #   - if left: correct out_angle      - if right: -angle is out_angle
-      #   - if left: 180-angle is in_angle  - if right: -180+angle is in_angle
-      if bend_match:
-        bend_dir, bend_angle = bend_match.group(1), float(bend_match.group(2))
-        if bend_dir == 'left':
-          out_angle = bend_angle
-          in_angle = 180 - bend_angle
-        elif bend_dir == 'right':
-          out_angle = -bend_angle
-          in_angle = -180 + bend_angle
-        else:
-          raise Exception("Bend direction must be left or right")
-
-      line = TikzLine(start_loc, end_loc, in_angle, out_angle, looseness)
-      lines.append(line)
-    
-    return lines
+    """Return all lines from TikZ code"""
+    return TikzParser.parse_statements(tikz)[1]
 
 
+  @staticmethod
   def parse_styles(tikz) -> Dict[str, Dict[str,str]]:
     """Parse all styles from a tikzstyles text"""
     styles = {'morphism': {'shape': 'morphism'}, 'dot': {'shape': 'dot'}}
-    style_pattern = r"(?<!% )\\tikzstyle\{(.+)\}=\[(.+)\]"
-    style_matches = re.findall(style_pattern, tikz)
-    for name, props_str in style_matches:
-      props_pattern = r"(\w[^,]*)=([^,]+)"
-      props_matches = re.findall(props_pattern, props_str)
-      styles[name] = dict(props_matches)
+    tokens = tokenize(tikz)
+    i = 0
+    while i < len(tokens):
+      token = tokens[i]
+      i += 1
+      if token != '\\tikzstyle': continue
+      name, i = read_group(tokens, i, '{')
+      if name is None: continue
+      i = skip_whitespace(tokens, i)
+      if i >= len(tokens) or tokens[i] != '=': continue
+      props_str, i = read_group(tokens, i + 1, '[')
+      if props_str is None: continue
+      props = {}
+      for prop in props_str.split(','):
+        key, equals, value = prop.rpartition('=')
+        key = key.lstrip()
+        if equals and key and value: props[key] = value
+      styles[name] = props
     return styles
 
 
   @staticmethod
   def parse_tikz_diagram(tikz, tikz_styles):
-    """Parse all nodes and lines from a diagram"""
-    nodes = TikzParser.parse_nodes(tikz)
-    lines = TikzParser.parse_lines(tikz)
-    styles = TikzParser.parse_styles(tikz_styles)
+    """Parse all nodes and lines from a diagram
+
+    tikz_styles is either a tikzstyles text or styles it has already been parsed into, so
+    diagrams sharing a style sheet can share one parse (see compile_style_sheet)"""
+    nodes, lines = TikzParser.parse_statements(tikz)
+    styles = tikz_styles if isinstance(tikz_styles, dict) else TikzParser.parse_styles(tikz_styles)
     return TikzDiagram(nodes, lines, styles)
   
 
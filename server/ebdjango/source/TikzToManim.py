@@ -1,11 +1,14 @@
+import collections
+import hashlib
+import threading
 from dataclasses import dataclass
 from typing import Dict, List, Tuple
 from .TikzParser import TikzLine, TikzNode, TikzParser, Location
 from manim.utils.color.core import ManimColor
-import math
-from shapely.geometry import LineString
+import numpy as np
 from manim import *
-from .Nodes import create_and_position_node
+from .Nodes import shape_anchor_offset
+from .PackedDiagram import PackedManimDiagram, StringTable
 
 """
 TikzToManim should convert a TikZ wrapper instance into an instance with values for Manim use
@@ -29,14 +32,16 @@ Lines:
 - end_id - remain the same
 - curve points - Manim coordinates of Bezier handle points
 
-
+Geometry is done with NumPy on whole diagrams at once: every TikZ position goes through one
+affine transform, and every line's start, handles & end are one N x 4 x 3 array, so a node's
+position & a line's curve points are rows of those arrays.
 """
 
 
 @dataclass
 class ManimInputNode():
   id: str
-  position: List[float]
+  position: np.ndarray
   label: str
   props: Dict[str, str]
 
@@ -45,7 +50,7 @@ class ManimInputNode():
 class ManimInputLine():
   start_id: str
   end_id: str
-  curve_points: List[List[float]]
+  curve_points: np.ndarray
 
 
 @dataclass
@@ -54,80 +59,32 @@ class ManimInputDiagram():
   lines: List[ManimInputLine]
 
 
-class TikzToManimConverter():
+MAX_CACHED_STYLE_SHEETS = 64
 
-  def __init__(self, tikz_diagram, manim_x_limits, manim_y_limits) -> None:
-    self.x_min, self.x_max, self.y_min, self.y_max = self.calculate_tikz_limits(tikz_diagram)
-    self.MANIM_X_LIMITS, self.MANIM_Y_LIMITS, self.scale_factor = self.find_manim_limits(manim_x_limits, manim_y_limits)
-    self.styles = tikz_diagram.styles
-    self.node_positions: Dict[str, List[float]] = {}
-    self.nodes = self.convert_nodes(tikz_diagram.nodes)
-    self.nodes_by_id = self.create_node_dict(self.nodes)
-    self.lines = self.convert_lines(tikz_diagram.lines)
-    print("------ STYLES -----")
-    print(tikz_diagram.styles)
-    print(self.styles)
-    print("------ NODES ------")
-    print(tikz_diagram.nodes)
-    print(self.nodes)
-    print("------ LINES ------")
-    print(tikz_diagram.lines)
-    print(self.lines)
+_style_sheets = collections.OrderedDict()
+# Guards _style_sheets, which views, cost estimates & label precompile threads share
+_style_sheets_lock = threading.Lock()
 
-  
-  def calculate_tikz_limits(self, tikz_diagram):
-    """Takes a TikzDiagram and returns the min & max x & y coordinates"""
-    x_coords = [node.position[0] for node in tikz_diagram.nodes]
-    y_coords = [node.position[1] for node in tikz_diagram.nodes]
-    return min(x_coords), max(x_coords), min(y_coords), max(y_coords)
-  
 
-  def scale_limits(self, scale_factor, tikz_limits, manim_limits):
-      # find midpoint of ranges
-      tikz_midpoint = sum(tikz_limits) / 2
-      manim_midpoint = sum(manim_limits) / 2
-      # scale limits on smaller range & add manim range midpoint
-      new_limits = [((limit - tikz_midpoint) * scale_factor) + manim_midpoint for limit in tikz_limits]
-      return new_limits
+class StyleSheet():
+  """TikZ styles converted to Manim props once, and shared by every diagram & node using them
 
+  Sizes stay in TikZ units here, since each diagram scales them differently"""
 
-  def find_manim_limits(self, manim_x_limits, manim_y_limits):
-    # find largest tikz axis related to manim axis - x range / manim x range & y range / manim y range
-    print(manim_y_limits, [self.y_min, self.y_max])
-    x_scale_factor = (manim_x_limits[1] - manim_x_limits[0]) / (self.x_max - self.x_min) if self.x_max - self.x_min != 0 else 0
-    y_scale_factor = (manim_y_limits[1] - manim_y_limits[0]) / (self.y_max - self.y_min) if self.y_max - self.y_min != 0 else 0
-    # take smallest as manim limits - scale other axis limits down (because small tikz range has large scale factor)
-    if y_scale_factor >= x_scale_factor:
-      new_x_limits = manim_x_limits
-      new_y_limits = self.scale_limits(x_scale_factor, [self.y_min, self.y_max], manim_y_limits)
-      new_scale_factor = x_scale_factor
-    else:
-      new_y_limits = manim_y_limits
-      new_x_limits = self.scale_limits(y_scale_factor, [self.x_min, self.x_max], manim_x_limits)
-      new_scale_factor = y_scale_factor
-
-    return new_x_limits, new_y_limits, new_scale_factor
+  SIZE_PROPS = ('width', 'height')
 
+  def __init__(self, styles: Dict[str, Dict[str, str]]) -> None:
+    self.styles = styles
+    self.props = {name: self.convert_properties(props) for name, props in styles.items()}
+    self.props['none'] = {'shape': 'none'}
 
-  def manim_coord_from_tikz_coord(self, tikz_position: Tuple[float]) -> List[float]:
-    """Calculate Manim equivalent of TikZ coordinate"""
-    # x_frax & y_frac are distance along axis as fraction of axis length
-    if self.x_max - self.x_min == 0:
-      x_frac = 0
-    else:
-      x_frac = (tikz_position[0] - self.x_min) / (self.x_max - self.x_min)
-    # scale fraction to manim axis length and move so axis covers 0
-    manim_x = x_frac * (self.MANIM_X_LIMITS[1] - self.MANIM_X_LIMITS[0]) + self.MANIM_X_LIMITS[0]
 
-    if self.y_max - self.y_min == 0:
-      y_frac = 0
-    else:
-      y_frac = (tikz_position[1] - self.y_min) / (self.y_max - self.y_min)
-    manim_y = y_frac * (self.MANIM_Y_LIMITS[1] - self.MANIM_Y_LIMITS[0]) + self.MANIM_Y_LIMITS[0]
-    return [manim_x, manim_y, 0]
-  
+  def props_for_style(self, style: str) -> Dict:
+    try:
+      return self.props[style]
+    except KeyError:
+      raise Exception("Unknown TikZ style:", style)
 
-  ######################### NODES ######################
 
   def convert_prop_name(self, prop: str):
     """Convert a TikZ property name to the corresponding Manim property
@@ -151,15 +108,10 @@ class TikzToManimConverter():
       return manim_color
     except:
       raise Exception("Unable to convert TikZ color:", color)
-    
-
-  def convert_size(self, size: float):
-    new_size = size * self.scale_factor
-    return new_size
 
 
   def convert_properties(self, props: Dict[str,str]) -> Dict[str,str]:
-    """Convert a dictionary of TikZ properties & values to Manim ones"""
+    """Convert a dictionary of TikZ properties & values to Manim ones, leaving sizes unscaled"""
     manim_props = {}
     for prop, value in props.items():
       manim_prop = self.convert_prop_name(prop)
@@ -173,8 +125,6 @@ class TikzToManimConverter():
           # Convert value to float if possible
           try:
             manim_value = float(value)
-            if manim_prop == 'width' or manim_prop == 'height':
-              manim_value = self.convert_size(manim_value)
           # Other strings
           except ValueError:
             manim_value = value
@@ -184,19 +134,134 @@ class TikzToManimConverter():
     return manim_props
 
 
-  def input_node_from_tikz_node(self, tikz_node: TikzNode) -> ManimInputNode:
-    """Convert all properties of a TikzNode"""
-    id = tikz_node.id
-    position = self.manim_coord_from_tikz_coord(tikz_node.position)
-    self.node_positions[id] = position
-    label = tikz_node.label
-    props = self.styles[tikz_node.style] if tikz_node.style != 'none' else {}
-    manim_props = self.convert_properties(props)
-    return ManimInputNode(id, position, label, manim_props)
+def compile_style_sheet(tikz_styles: str) -> StyleSheet:
+  """Parse & convert a style sheet, reusing the result for any style sheet with the same hash
+
+  This is the only cache of parsed styles: pass style_sheet.styles to TikzParser.parse_tikz_diagram
+  rather than the text, so each diagram doesn't parse the style sheet again"""
+  key = hashlib.sha256(tikz_styles.encode('utf-8')).hexdigest()
+  with _style_sheets_lock:
+    style_sheet = _style_sheets.get(key)
+    if style_sheet is not None:
+      _style_sheets.move_to_end(key)
+      return style_sheet
+
+  # Converted outside the lock - two threads converting the same style sheet get equal results
+  style_sheet = StyleSheet(TikzParser.parse_styles(tikz_styles))
+  with _style_sheets_lock:
+    _style_sheets[key] = style_sheet
+    if len(_style_sheets) > MAX_CACHED_STYLE_SHEETS:
+      _style_sheets.popitem(last=False)
+  return style_sheet
+
+
+class TikzToManimConverter():
+
+  def __init__(self, tikz_diagram, manim_x_limits, manim_y_limits, style_sheet: StyleSheet = None) -> None:
+    self.x_min, self.x_max, self.y_min, self.y_max = self.calculate_tikz_limits(tikz_diagram)
+    self.MANIM_X_LIMITS, self.MANIM_Y_LIMITS, self.scale_factor = self.find_manim_limits(manim_x_limits, manim_y_limits)
+    self.affine_transform = self.calculate_affine_transform()
+    self.styles = tikz_diagram.styles
+    self.style_sheet = style_sheet or StyleSheet(tikz_diagram.styles)
+    self.style_props: Dict[str, Dict] = {}
+    self.node_position_array = np.zeros((0, 3))
+    self.node_indices: Dict[str, int] = {}
+    self.node_styles: Dict[str, str] = {}
+    self.anchor_offsets: Dict[Tuple[str, str], np.ndarray] = {}
+    self.nodes = self.convert_nodes(tikz_diagram.nodes)
+    self.nodes_by_id = self.create_node_dict(self.nodes)
+    self.lines = self.convert_lines(tikz_diagram.lines)
+
   
+  def calculate_tikz_limits(self, tikz_diagram):
+    """Takes a TikzDiagram and returns the min & max x & y coordinates"""
+    x_coords = [node.position[0] for node in tikz_diagram.nodes]
+    y_coords = [node.position[1] for node in tikz_diagram.nodes]
+    return min(x_coords), max(x_coords), min(y_coords), max(y_coords)
+  
+
+  def scale_limits(self, scale_factor, tikz_limits, manim_limits):
+      # find midpoint of ranges
+      tikz_midpoint = sum(tikz_limits) / 2
+      manim_midpoint = sum(manim_limits) / 2
+      # scale limits on smaller range & add manim range midpoint
+      new_limits = [((limit - tikz_midpoint) * scale_factor) + manim_midpoint for limit in tikz_limits]
+      return new_limits
+
+
+  def find_manim_limits(self, manim_x_limits, manim_y_limits):
+    # find largest tikz axis related to manim axis - x range / manim x range & y range / manim y range
+    x_scale_factor = (manim_x_limits[1] - manim_x_limits[0]) / (self.x_max - self.x_min) if self.x_max - self.x_min != 0 else 0
+    y_scale_factor = (manim_y_limits[1] - manim_y_limits[0]) / (self.y_max - self.y_min) if self.y_max - self.y_min != 0 else 0
+    # take smallest as manim limits - scale other axis limits down (because small tikz range has large scale factor)
+    if y_scale_factor >= x_scale_factor:
+      new_x_limits = manim_x_limits
+      new_y_limits = self.scale_limits(x_scale_factor, [self.y_min, self.y_max], manim_y_limits)
+      new_scale_factor = x_scale_factor
+    else:
+      new_y_limits = manim_y_limits
+      new_x_limits = self.scale_limits(y_scale_factor, [self.x_min, self.x_max], manim_x_limits)
+      new_scale_factor = y_scale_factor
+
+    return new_x_limits, new_y_limits, new_scale_factor
+
+
+  def calculate_affine_transform(self):
+    """Origins, ranges & Manim ranges of the axes, taking TikZ x & y to Manim x & y in one operation"""
+    tikz_origins = np.array([self.x_min, self.y_min])
+    # an axis with no range has an infinite one instead, so every position is at its start
+    tikz_ranges = np.array([self.x_max - self.x_min, self.y_max - self.y_min], dtype=float)
+    tikz_ranges[tikz_ranges == 0] = np.inf
+    manim_origins = np.array([self.MANIM_X_LIMITS[0], self.MANIM_Y_LIMITS[0]])
+    manim_ranges = np.array([self.MANIM_X_LIMITS[1] - self.MANIM_X_LIMITS[0], self.MANIM_Y_LIMITS[1] - self.MANIM_Y_LIMITS[0]])
+    return tikz_origins, tikz_ranges, manim_origins, manim_ranges
+
+
+  def manim_coords_from_tikz_coords(self, tikz_positions) -> np.ndarray:
+    """Calculate Manim equivalents of a sequence of TikZ coordinates, as an N x 3 array"""
+    tikz_origins, tikz_ranges, manim_origins, manim_ranges = self.affine_transform
+    tikz_positions = np.asarray(tikz_positions, dtype=float).reshape(-1, 2)
+    manim_positions = np.zeros((len(tikz_positions), 3))
+    # distance along each axis as a fraction of its length, scaled to the Manim axis
+    manim_positions[:, :2] = (tikz_positions - tikz_origins) / tikz_ranges * manim_ranges + manim_origins
+    return manim_positions
+
+
+  def manim_coord_from_tikz_coord(self, tikz_position: Tuple[float]) -> List[float]:
+    """Calculate Manim equivalent of TikZ coordinate"""
+    manim_x, manim_y, _ = self.manim_coords_from_tikz_coords([tikz_position])[0]
+    return [float(manim_x), float(manim_y), 0]
+  
+
+  ######################### NODES ######################
+
+  def convert_size(self, size: float):
+    new_size = size * self.scale_factor
+    return new_size
+
+
+  def props_for_style(self, style: str) -> Dict:
+    """Manim props for a node style, scaled to this diagram and shared by every node using it"""
+    if style not in self.style_props:
+      props = self.style_sheet.props_for_style(style)
+      if any(size_prop in props for size_prop in StyleSheet.SIZE_PROPS):
+        props = dict(props)
+        for size_prop in StyleSheet.SIZE_PROPS:
+          if isinstance(props.get(size_prop), float):
+            props[size_prop] = self.convert_size(props[size_prop])
+      self.style_props[style] = props
+    return self.style_props[style]
+
 
   def convert_nodes(self, nodes: List[TikzNode]) -> List[ManimInputNode]:
-    return [self.input_node_from_tikz_node(node) for node in nodes]
+    """Convert all TikzNodes, transforming every position at once"""
+    self.node_position_array = self.manim_coords_from_tikz_coords([node.position for node in nodes])
+    manim_nodes = []
+    for index, (node, position) in enumerate(zip(nodes, self.node_position_array)):
+      self.node_indices[node.id] = index
+      self.node_styles[node.id] = node.style
+      manim_nodes.append(ManimInputNode(node.id, position, node.label, self.props_for_style(node.style)))
+    return manim_nodes
   
 
   def create_node_dict(self, nodes: List[ManimInputNode]):
@@ -205,13 +270,13 @@ class TikzToManimConverter():
   
   ##################### LINES ##########################
 
-  def point_using_dist_and_angle(self, point1: List[float], dist: float, angle: float) -> List[float]:
-    """Calculate coordinates of second point using distance and angle from first point"""
-    x1, y1, _ = point1
-    angle_radians = math.radians(angle)
-    x2 = x1 + dist * math.cos(angle_radians)
-    y2 = y1 + dist * math.sin(angle_radians)
-    return [x2, y2, 0]
+  def points_using_dists_and_angles(self, points: np.ndarray, dists: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """Calculate coordinates of second points using distances and angles (in degrees) from first points"""
+    angles_radians = np.radians(angles)
+    offsets = np.zeros_like(points)
+    offsets[:, 0] = dists * np.cos(angles_radians)
+    offsets[:, 1] = dists * np.sin(angles_radians)
+    return points + offsets
   
 
   def manim_dir_from_compass_dir_part(self, compass_dir: str):
@@ -228,61 +293,80 @@ class TikzToManimConverter():
     return sum(manim_dirs)
   
 
-  def edge_point_from_compass_dir(self, node_id: str, dir: str): 
-    node = self.nodes_by_id[node_id]
-
-    manim_node = create_and_position_node(node)
-
-    size = max(manim_node.width, manim_node.height)
-    manim_dir = self.manim_dir_from_full_compass_dir(dir)
-    line = [manim_node.get_center(), manim_node.get_center() + (manim_dir * size)]
-
-    edge_points = list(manim_node.shape.points)
-    edge_points.append(manim_node.shape.points[0])
-
-    for i in range(len(edge_points) - 1):
-      shape_edge_line = [edge_points[i], edge_points[i+1]]
-      line1 = LineString(line)
-      line2 = LineString(shape_edge_line)
-
-      if line1.intersects(line2):
-        intersection_point = line1.intersection(line2)
-        intersection_coords = [intersection_point.x, intersection_point.y, 0]
-        return intersection_coords
-      
-  
-  def calculate_angle_between_points(self, point1: List[float], point2: List[float]):
-    y = point2[1] - point1[1]
-    x = point2[0] - point1[0]
-    angle_rad = math.atan2(y, x)
-    angle_deg = math.degrees(angle_rad)
-    return angle_deg
+  def anchor_offset_from_compass_dir(self, node_id: str, dir: str) -> np.ndarray:
+    """Find the offset from a node's center to where a ray in a compass direction leaves the node's shape
+
+    Calculated from the shape's size, and memoized per style & direction, as every node
+    of a style has the same shape"""
+    key = (self.node_styles[node_id], dir)
+    if key not in self.anchor_offsets:
+      node = self.nodes_by_id[node_id]
+      manim_dir = self.manim_dir_from_full_compass_dir(dir)
+      offset = shape_anchor_offset(manim_dir, **node.props)
+      if offset is None:
+        raise Exception("Unable to find compass anchor:", f"{node_id}.{dir}")
+      self.anchor_offsets[key] = np.array([offset[0], offset[1], 0])
+    return self.anchor_offsets[key]
+
+
+  def calculate_angles_between_points(self, points1: np.ndarray, points2: np.ndarray) -> np.ndarray:
+    differences = points2 - points1
+    return np.degrees(np.arctan2(differences[:, 1], differences[:, 0]))
   
 
-  def calculate_handle_points(self, start_point: List[float], end_point: List[float], line: TikzLine) -> List[List[float]]:
-    """Calculate all handle points for TikZ line to be represented as a bezier curve"""
+  def calculate_curve_points(self, start_points: np.ndarray, end_points: np.ndarray, lines: List[TikzLine]) -> np.ndarray:
+    """Calculate all handle points for TikZ lines to be represented as bezier curves
 
-    if not line.looseness: line.looseness = 1
-    if line.in_angle == None or line.out_angle == None:
-      line.out_angle = self.calculate_angle_between_points(start_point, end_point)
-      line.in_angle = self.calculate_angle_between_points(end_point, start_point)
+    Returns an N x 4 x 3 array of each line's start, two handles & end"""
+    looseness = np.array([line.looseness or 1 for line in lines], dtype=float)
+    out_angles = np.array([np.nan if line.out_angle is None else line.out_angle for line in lines], dtype=float)
+    in_angles = np.array([np.nan if line.in_angle is None else line.in_angle for line in lines], dtype=float)
+    # Lines without both angles are straight, leaving & entering along the line between their ends
+    straight = np.isnan(out_angles) | np.isnan(in_angles)
+    out_angles = np.where(straight, self.calculate_angles_between_points(start_points, end_points), out_angles)
+    in_angles = np.where(straight, self.calculate_angles_between_points(end_points, start_points), in_angles)
 
     SCALING_CONST = 0.4
-    dist_between_points = math.dist(start_point, end_point)
+    dists_between_points = np.linalg.norm(end_points - start_points, axis=1)
     # Looseness of 1 means handle points are 2/5 of between-endpoint distance away from endpoint
-    handle_dist_from_ends = dist_between_points * SCALING_CONST * line.looseness
-    handle_point1 = self.point_using_dist_and_angle(start_point, handle_dist_from_ends, line.out_angle)
-    handle_point2 = self.point_using_dist_and_angle(end_point, handle_dist_from_ends, line.in_angle)
-    return [start_point, handle_point1, handle_point2, end_point]
+    handle_dists_from_ends = dists_between_points * SCALING_CONST * looseness
+    curve_points = np.empty((len(lines), 4, 3))
+    curve_points[:, 0] = start_points
+    curve_points[:, 1] = self.points_using_dists_and_angles(start_points, handle_dists_from_ends, out_angles)
+    curve_points[:, 2] = self.points_using_dists_and_angles(end_points, handle_dists_from_ends, in_angles)
+    curve_points[:, 3] = end_points
+    return curve_points
   
 
-  def manim_coord_from_tikz_location(self, loc: Location):
-    if loc.type == 'id':
-      return self.node_positions[loc.location]
-    if loc.type == 'coordinate':
-      return self.manim_coord_from_tikz_coord(loc.location)
-    if loc.type == 'compass':
-      return self.edge_point_from_compass_dir(loc.location['id'], loc.location['direction'])
+  def manim_coords_from_tikz_locations(self, locs: List[Location]) -> np.ndarray:
+    """Manim coordinates of line ends as an N x 3 array
+
+    Ends at nodes are gathered from the node position array, compass ends add their anchor
+    offsets, and plain coordinates are transformed together"""
+    node_rows, node_indices = [], []
+    compass_rows, compass_indices, compass_offsets = [], [], []
+    coordinate_rows, coordinates = [], []
+    for row, loc in enumerate(locs):
+      if loc.type == 'id':
+        node_rows.append(row)
+        node_indices.append(self.node_indices[loc.location])
+      elif loc.type == 'compass':
+        compass_rows.append(row)
+        compass_indices.append(self.node_indices[loc.location['id']])
+        compass_offsets.append(self.anchor_offset_from_compass_dir(loc.location['id'], loc.location['direction']))
+      elif loc.type == 'coordinate':
+        coordinate_rows.append(row)
+        coordinates.append(loc.location)
+      else:
+        raise Exception("Unknown TikZ location type:", loc.type)
+
+    coords = np.zeros((len(locs), 3))
+    coords[node_rows] = self.node_position_array[node_indices]
+    if compass_rows:
+      coords[compass_rows] = self.node_position_array[compass_indices] + np.array(compass_offsets)
+    if coordinate_rows:
+      coords[coordinate_rows] = self.manim_coords_from_tikz_coords(coordinates)
+    return coords
     
 
   def get_id_from_tikz_location(self, loc: Location):
@@ -294,20 +378,53 @@ class TikzToManimConverter():
       return f"{loc.location['id']}.{loc.location['direction']}"
   
 
-  def input_line_from_tikz_line(self, tikz_line: TikzLine) -> ManimInputLine:
-    start_loc = tikz_line.start_loc
-    end_loc = tikz_line.end_loc
-    # get position of points after conversion
-    start_point = self.get_id_from_tikz_location(start_loc)
-    end_point = self.get_id_from_tikz_location(end_loc)
-    start_coord = self.manim_coord_from_tikz_location(start_loc)
-    end_coord = self.manim_coord_from_tikz_location(end_loc)
-    curve_points = self.calculate_handle_points(start_coord, end_coord, tikz_line)
-    return ManimInputLine(str(start_point), str(end_point), curve_points)
+  def convert_lines(self, lines: List[TikzLine]) -> List[ManimInputLine]:
+    """Convert all TikzLines, calculating every line's curve points at once"""
+    start_coords = self.manim_coords_from_tikz_locations([line.start_loc for line in lines])
+    end_coords = self.manim_coords_from_tikz_locations([line.end_loc for line in lines])
+    self.curve_point_array = self.calculate_curve_points(start_coords, end_coords, lines)
+    return [ManimInputLine(str(self.get_id_from_tikz_location(line.start_loc)), str(self.get_id_from_tikz_location(line.end_loc)), points)
+            for line, points in zip(lines, self.curve_point_array)]
   
 
-  def convert_lines(self, lines: List[TikzLine]) -> List[ManimInputLine]:
-    return [self.input_line_from_tikz_line(line) for line in lines]
+  ##################### PACKING ##########################
+
+  def pack(self) -> PackedManimDiagram:
+    """The converted diagram as arrays, sharing this converter's position & curve point arrays"""
+    table = StringTable()
+    return PackedManimDiagram(
+      strings=table.strings,
+      scale_factor=float(self.scale_factor),
+      node_ids=np.array([table.intern(node.id) for node in self.nodes], dtype='<i4'),
+      node_styles=np.array([table.intern(self.node_styles[node.id]) for node in self.nodes], dtype='<i4'),
+      node_labels=np.array([table.intern(node.label) for node in self.nodes], dtype='<i4'),
+      node_positions=self.node_position_array,
+      line_ids=np.array([(table.intern(line.start_id), table.intern(line.end_id)) for line in self.lines], dtype='<i4').reshape(-1, 2),
+      curve_points=self.curve_point_array,
+    )
+
+
+  @classmethod
+  def from_packed(cls, packed: PackedManimDiagram, style_sheet: StyleSheet):
+    """A converter for a diagram converted before, with nodes & lines viewing the packed arrays
+
+    Only nodes, lines & props are restored, which is all a Diagram or keyframe export needs"""
+    converter = cls.__new__(cls)
+    converter.scale_factor = packed.scale_factor
+    converter.styles = style_sheet.styles
+    converter.style_sheet = style_sheet
+    converter.style_props = {}
+    strings = packed.strings
+    converter.node_position_array = packed.node_positions
+    converter.node_indices = {strings[id]: index for index, id in enumerate(packed.node_ids)}
+    converter.node_styles = {strings[id]: strings[style] for id, style in zip(packed.node_ids, packed.node_styles)}
+    converter.nodes = [ManimInputNode(strings[id], position, strings[label], converter.props_for_style(strings[style]))
+                       for id, style, label, position in zip(packed.node_ids, packed.node_styles, packed.node_labels, packed.node_positions)]
+    converter.nodes_by_id = converter.create_node_dict(converter.nodes)
+    converter.curve_point_array = packed.curve_points
+    converter.lines = [ManimInputLine(strings[start_id], strings[end_id], points)
+                       for (start_id, end_id), points in zip(packed.line_ids, packed.curve_points)]
+    return converter
 
 
 
@@ -335,7 +452,7 @@ if __name__ == '__main__':
   tikz_diagram = TikzParser.parse_tikz_diagram(test_tikz, test_styles)
   tikz_to_manim_converter = TikzToManimConverter(tikz_diagram, [6,6], [3,3])
   print(tikz_to_manim_converter.nodes)
-  print(tikz_to_manim_converter.point_using_dist_and_angle([0,0,0], math.sqrt(2), -135))
+  print(tikz_to_manim_converter.points_using_dists_and_angles(np.zeros((1, 3)), np.array([np.sqrt(2)]), np.array([-135])))
   print(tikz_to_manim_converter.lines)
 
 
@@ -0,0 +1,133 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+"""
+Timing measures how long each stage of a render takes
+
+Stages:
+- parse    - TikzParser reading a diagram
+- convert  - TikzToManimConverter laying a diagram out
+- build    - creating a diagram's mobjects
+- tex      - compiling a Tex label or Text subtitle which was not already cached
+- render   - Manim rasterising frames & piping them to ffmpeg
+- encode   - ffmpeg encoding held frames, joining segments and remuxing for streaming
+- deliver  - sending a finished file to the client
+
+Every span is added to a per-process histogram for the /metrics endpoint, and to the
+spans collected by the current request (if any) for its Server-Timing header.
+Render worker processes send their spans back with each result, so the pool's
+process records them too.
+
+This module must not import Manim.
+"""
+
+Span = Tuple[str, float]
+
+# Upper bounds of histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRIC_NAME = 'render_stage_seconds'
+
+_collected_spans: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar('collected_spans', default=None)
+
+
+class Histogram():
+
+  def __init__(self, buckets=BUCKETS) -> None:
+    self.buckets = tuple(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)
+    self.sum = 0.0
+    self.count = 0
+
+
+  def observe(self, seconds: float):
+    self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+    self.sum += seconds
+    self.count += 1
+
+
+  def cumulative_counts(self) -> List[int]:
+    cumulative = []
+    total = 0
+    for count in self.counts:
+      total += count
+      cumulative.append(total)
+    return cumulative
+
+
+_histograms: Dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+
+def observe(stage: str, seconds: float):
+  """Add a duration to a stage's histogram"""
+  with _lock:
+    if stage not in _histograms:
+      _histograms[stage] = Histogram()
+    _histograms[stage].observe(seconds)
+
+
+def observe_spans(spans: List[Span]):
+  for stage, seconds in spans:
+    observe(stage, seconds)
+
+
+def add_spans(spans: List[Span]):
+  """Add spans measured elsewhere, such as in a render worker, to the spans being collected"""
+  collected = _collected_spans.get()
+  if collected is not None:
+    collected.extend(spans)
+
+
+@contextmanager
+def span(stage: str):
+  """Time the enclosed block as one span of a stage"""
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    seconds = time.perf_counter() - start
+    observe(stage, seconds)
+    add_spans([(stage, seconds)])
+
+
+@contextmanager
+def collect_spans():
+  """Collect every span measured in the enclosed block, in this thread or context"""
+  spans: List[Span] = []
+  token = _collected_spans.set(spans)
+  try:
+    yield spans
+  finally:
+    _collected_spans.reset(token)
+
+
+def stage_totals(spans: List[Span]) -> Dict[str, float]:
+  totals: Dict[str, float] = {}
+  for stage, seconds in spans:
+    totals[stage] = totals.get(stage, 0) + seconds
+  return totals
+
+
+def server_timing(spans: List[Span]) -> str:
+  """A Server-Timing header value with the total milliseconds of each stage"""
+  return ', '.join(f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in stage_totals(spans).items())
+
+
+def prometheus_metrics() -> str:
+  """Every stage's histogram in the Prometheus text format"""
+  lines = [f'# HELP {METRIC_NAME} Time spent in each stage of rendering & delivering animations',
+           f'# TYPE {METRIC_NAME} histogram']
+  with _lock:
+    for stage in sorted(_histograms):
+      histogram = _histograms[stage]
+      bounds = [str(bound) for bound in histogram.buckets] + ['+Inf']
+      for bound, count in zip(bounds, histogram.cumulative_counts()):
+        lines.append(f'{METRIC_NAME}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+      lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {histogram.sum}')
+      lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {histogram.count}')
+  return '\n'.join(lines) + '\n'
@@ -0,0 +1,84 @@
+import collections
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+"""
+TransitionPlanner decides how the elements of one diagram become those of the next
+
+Nodes are matched by id. Lines are keyed by (start id, end id, k), where k counts
+earlier lines between the same two nodes, so parallel edges are all kept.
+
+Lines are matched in three passes:
+- lines with the same key in both diagrams transform into each other
+- each remaining old line transforms into the first remaining new line with the same start
+- then into the first remaining new line with the same end
+Anything left over fades out (old) or is created (new).
+
+Each pass looks lines up in an index by endpoint, so planning takes time linear in
+the number of lines. This module must not import Manim.
+"""
+
+LineKey = Tuple[str, str, int]
+
+
+@dataclass
+class TransitionPlan:
+  kept: List[Tuple[Hashable, Hashable]] = field(default_factory=list)
+  matched: List[Tuple[Hashable, Hashable]] = field(default_factory=list)
+  removed: List[Hashable] = field(default_factory=list)
+  added: List[Hashable] = field(default_factory=list)
+
+
+def line_keys(endpoint_pairs: Iterable[Tuple[str, str]]) -> List[LineKey]:
+  """Give each (start id, end id) pair a unique key, numbering repeated pairs from 0"""
+  counts: Dict[Tuple[str, str], int] = collections.defaultdict(int)
+  keys = []
+  for start_id, end_id in endpoint_pairs:
+    keys.append((start_id, end_id, counts[(start_id, end_id)]))
+    counts[(start_id, end_id)] += 1
+  return keys
+
+
+def plan_node_transitions(old_ids: Iterable[Hashable], new_ids: Iterable[Hashable]) -> TransitionPlan:
+  old_ids = list(old_ids)
+  new_ids = list(new_ids)
+  old_set = set(old_ids)
+  new_set = set(new_ids)
+  return TransitionPlan(
+    kept=[(id, id) for id in old_ids if id in new_set],
+    removed=[id for id in old_ids if id not in new_set],
+    added=[id for id in new_ids if id not in old_set],
+  )
+
+
+def plan_line_transitions(old_keys: Iterable[LineKey], new_keys: Iterable[LineKey]) -> TransitionPlan:
+  old_keys = list(old_keys)
+  new_keys = list(new_keys)
+  new_set = set(new_keys)
+  old_set = set(old_keys)
+  plan = TransitionPlan(kept=[(key, key) for key in old_keys if key in new_set])
+
+  unmatched_old = [key for key in old_keys if key not in new_set]
+  unmatched_new = [key for key in new_keys if key not in old_set]
+  taken = set()
+
+  for endpoint_index in [0, 1]:
+    # Remaining new lines by shared endpoint, in diagram order
+    index: Dict[str, collections.deque] = collections.defaultdict(collections.deque)
+    for key in unmatched_new:
+      if key not in taken: index[key[endpoint_index]].append(key)
+
+    still_unmatched = []
+    for old_key in unmatched_old:
+      candidates = index.get(old_key[endpoint_index])
+      if candidates:
+        new_key = candidates.popleft()
+        taken.add(new_key)
+        plan.matched.append((old_key, new_key))
+      else:
+        still_unmatched.append(old_key)
+    unmatched_old = still_unmatched
+
+  plan.removed = unmatched_old
+  plan.added = [key for key in unmatched_new if key not in taken]
+  return plan
@@ -0,0 +1,21 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+"""
+Each render gets a private workspace directory which is used as its Manim media_dir,
+so renders running at the same time never write to the same output files.
+"""
+
+
+@contextmanager
+def render_workspace(root=None):
+  """Create a private directory for one render and remove it afterwards"""
+  if root is not None:
+    os.makedirs(root, exist_ok=True)
+  path = tempfile.mkdtemp(prefix='render-', dir=root)
+  try:
+    yield path
+  finally:
+    shutil.rmtree(path, ignore_errors=True)
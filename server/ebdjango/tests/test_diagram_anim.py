@@ -0,0 +1,83 @@
+import importlib.util
+import shutil
+import unittest
+
+import numpy as np
+
+HAS_MANIM = importlib.util.find_spec('manim') is not None
+HAS_LATEX = shutil.which('latex') is not None
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]"""
+
+# Corner nodes with no style keep both diagrams at the same scale
+CORNERS = r"""
+    \node [style=none] (c1) at (-5, -5) {};
+    \node [style=none] (c2) at (5, 5) {};"""
+
+
+def diagram_with_wire_end_at(x, y):
+  # Node 0 is unchanged, while the wire from its north anchor moves with node 1
+  return r"""\begin{pgfonlayer}{nodelayer}
+    \node [style=white square] (0) at (0, 0) {$a$};
+    \node [style=white square] (1) at (%s, %s) {$b$};%s
+  \end{pgfonlayer}
+  \begin{pgfonlayer}{edgelayer}
+    \draw (0.north) to (1);
+  \end{pgfonlayer}""" % (x, y, CORNERS)
+
+
+@unittest.skipUnless(HAS_MANIM and HAS_LATEX, "needs Manim and LaTeX")
+class MovingMobjectsTest(unittest.TestCase):
+
+  def render_transition(self):
+    """Render the transition, returning the scene, its moving mobjects and a frame from its middle"""
+    from manim import config
+    from ebdjango.source.DiagramAnim import DiagramSegmentScene
+    from ebdjango.source.RunDiagramAnim import scoped_config
+    from ebdjango.source.Workspace import render_workspace
+
+    class RecordingScene(DiagramSegmentScene):
+      def get_moving_mobjects(self, *animations):
+        self.moving = super().get_moving_mobjects(*animations)
+        return self.moving
+
+      def update_to_time(self, t):
+        # The frame drawn for the previous time, which is on screen mid-transition
+        if t > 0 and not hasattr(self, 'frame'):
+          self.frame = self.renderer.get_frame().copy()
+        super().update_to_time(t)
+
+    tikz_and_style_pairs = [(diagram_with_wire_end_at(-4, 4), STYLES), (diagram_with_wire_end_at(-4, 2), STYLES)]
+    extra_info = {0: {'subtitle': ''}, 1: {'subtitle': ''}}
+    with render_workspace() as workspace, scoped_config(workspace, quality='low'):
+      config.write_to_movie = False
+      scene = RecordingScene(tikz_and_style_pairs, extra_info=extra_info)
+      scene.render()
+      frame_size = (config.frame_width, config.frame_height)
+    return scene, scene.moving, scene.frame, frame_size
+
+
+  def test_node_is_redrawn_with_its_label(self):
+    scene, moving, _, _ = self.render_transition()
+    node = scene.diagrams[1].node_ids['0']
+    moving_ids = {id(mobject) for mobject in moving}
+    # The moving wire overlaps the node's shape, so the label above the shape must be redrawn too
+    self.assertIn(id(node.shape), moving_ids)
+    for member in node.get_family():
+      if len(member.points):
+        self.assertIn(id(member), moving_ids)
+
+
+  def test_label_stays_visible_during_transition(self):
+    scene, _, frame, (frame_width, frame_height) = self.render_transition()
+    label = scene.diagrams[1].node_ids['0'][1]
+    pixel_height, pixel_width = frame.shape[:2]
+    (left, bottom, _), (right, top, _) = label.get_corner(np.array([-1, -1, 0])), label.get_corner(np.array([1, 1, 0]))
+    columns = slice(int((left + frame_width / 2) / frame_width * pixel_width),
+                    int(np.ceil((right + frame_width / 2) / frame_width * pixel_width)))
+    rows = slice(int((frame_height / 2 - top) / frame_height * pixel_height),
+                 int(np.ceil((frame_height / 2 - bottom) / frame_height * pixel_height)))
+    label_pixels = frame[rows, columns, :3]
+    # The label is black on a white square
+    self.assertTrue((label_pixels.max(axis=2) < 128).any())
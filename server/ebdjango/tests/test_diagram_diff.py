@@ -0,0 +1,88 @@
+import unittest
+from collections import namedtuple
+
+import numpy as np
+
+from ebdjango.source.DiagramDiff import POSITION_TOLERANCE, diff_lines, diff_nodes, same_position
+
+# Has the fields diff_nodes reads from a ManimInputNode
+Node = namedtuple('Node', ['position', 'label', 'props'])
+
+SQUARE = {'shape': 'rectangle', 'fill_color': 'white'}
+DOT = {'shape': 'circle', 'fill_color': 'red'}
+
+
+def curve(x):
+  return np.array([[x, 0, 0], [x, 1, 0], [x + 1, 1, 0], [x + 1, 0, 0]], dtype=float)
+
+
+class DiffNodesTest(unittest.TestCase):
+
+  def test_classifies_each_node(self):
+    nodes1 = {
+      'same': Node([0, 0, 0], 'a', SQUARE),
+      'moved': Node([1, 0, 0], 'b', SQUARE),
+      'relabelled': Node([2, 0, 0], 'c', SQUARE),
+      'restyled': Node([3, 0, 0], 'd', SQUARE),
+      'gone': Node([4, 0, 0], 'e', SQUARE),
+    }
+    nodes2 = {
+      'same': Node([0, 0, 0], 'a', SQUARE),
+      'moved': Node([1, 2, 0], 'b', SQUARE),
+      'relabelled': Node([2, 0, 0], 'x', SQUARE),
+      'restyled': Node([3, 5, 0], 'd', DOT),
+      'new': Node([5, 0, 0], 'f', SQUARE),
+    }
+    diff = diff_nodes(nodes1, nodes2)
+    self.assertEqual(diff.unchanged, [('same', 'same')])
+    self.assertEqual(diff.moved, [('moved', 'moved')])
+    # A restyled node may have moved too
+    self.assertEqual(diff.restyled, [('relabelled', 'relabelled'), ('restyled', 'restyled')])
+    self.assertEqual(diff.removed, ['gone'])
+    self.assertEqual(diff.added, ['new'])
+    self.assertEqual(diff.changed, [('moved', 'moved'), ('relabelled', 'relabelled'), ('restyled', 'restyled')])
+
+
+  def test_equal_props_are_the_same_style(self):
+    diff = diff_nodes({'a': Node([0, 0, 0], 'a', dict(SQUARE))}, {'a': Node([0, 0, 0], 'a', dict(SQUARE))})
+    self.assertEqual(diff.unchanged, [('a', 'a')])
+
+
+  def test_position_tolerance(self):
+    near = diff_nodes({'a': Node([0, 0, 0], 'a', SQUARE)}, {'a': Node([POSITION_TOLERANCE / 2, 0, 0], 'a', SQUARE)})
+    self.assertEqual(near.unchanged, [('a', 'a')])
+    far = diff_nodes({'a': Node([0, 0, 0], 'a', SQUARE)}, {'a': Node([POSITION_TOLERANCE * 2, 0, 0], 'a', SQUARE)})
+    self.assertEqual(far.moved, [('a', 'a')])
+
+
+class DiffLinesTest(unittest.TestCase):
+
+  def test_classifies_each_line(self):
+    lines1 = {('a', 'b', 0): curve(0), ('a', 'c', 0): curve(1), ('d', 'e', 0): curve(2)}
+    lines2 = {('a', 'b', 0): curve(0), ('a', 'c', 0): curve(1.5), ('f', 'g', 0): curve(3)}
+    diff = diff_lines(lines1, lines2)
+    self.assertEqual(diff.unchanged, [(('a', 'b', 0), ('a', 'b', 0))])
+    self.assertEqual(diff.moved, [(('a', 'c', 0), ('a', 'c', 0))])
+    # Lines have no style, so are never restyled
+    self.assertEqual(diff.restyled, [])
+    self.assertEqual(diff.removed, [('d', 'e', 0)])
+    self.assertEqual(diff.added, [('f', 'g', 0)])
+
+
+  def test_line_matched_to_another_pair(self):
+    # A line matched by a shared endpoint is unchanged if its curve is the same
+    diff = diff_lines({('a', 'b', 0): curve(0)}, {('a', 'c', 0): curve(0)})
+    self.assertEqual(diff.unchanged, [(('a', 'b', 0), ('a', 'c', 0))])
+    diff = diff_lines({('a', 'b', 0): curve(0)}, {('a', 'c', 0): curve(1)})
+    self.assertEqual(diff.moved, [(('a', 'b', 0), ('a', 'c', 0))])
+
+
+class SamePositionTest(unittest.TestCase):
+
+  def test_within_tolerance(self):
+    self.assertTrue(same_position(curve(0), curve(0) + POSITION_TOLERANCE / 2))
+    self.assertFalse(same_position(curve(0), curve(0) + POSITION_TOLERANCE * 2))
+
+
+  def test_different_shapes_differ(self):
+    self.assertFalse(same_position(curve(0), curve(0)[:3]))
@@ -0,0 +1,40 @@
+import importlib.util
+import unittest
+
+HAS_MANIM = importlib.util.find_spec('manim') is not None
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]
+\tikzstyle{red dot}=[fill=red, draw=black, shape=circle]"""
+
+
+def diagram(moved_x, style):
+  return r"""\begin{pgfonlayer}{nodelayer}
+    \node [style=white square] (0) at (0, 0) {$a$};
+    \node [style=white square] (1) at (%s, 2) {$b$};
+    \node [style=%s] (2) at (2, -2) {};
+    \node [style=none] (c1) at (-5, -5) {};
+    \node [style=none] (c2) at (5, 5) {};
+  \end{pgfonlayer}
+  \begin{pgfonlayer}{edgelayer}
+    \draw (0) to (c1);
+    \draw (0) to (1);
+  \end{pgfonlayer}""" % (moved_x, style)
+
+
+@unittest.skipUnless(HAS_MANIM, "needs Manim")
+class ExportTransitionTest(unittest.TestCase):
+
+  def test_classifies_like_the_renderer(self):
+    from ebdjango.source.Keyframes import export_keyframes
+
+    extra_info = {0: {'subtitle': 'same'}, 1: {'subtitle': 'same'}}
+    document = export_keyframes(STYLES, [diagram(-2, 'white square'), diagram(-1, 'red dot')], extra_info)
+    transition = document['transitions'][0]
+    # The corners keep both diagrams at one scale, so node 0 and the line to a corner stay put,
+    # while node 1 and its line move and node 2 is restyled
+    self.assertEqual(sorted(transition['nodes']['unchanged']), [[0, 0], [3, 3], [4, 4]])
+    self.assertEqual(sorted(transition['nodes']['morph']), [[1, 1], [2, 2]])
+    self.assertEqual(transition['lines']['unchanged'], [[0, 0]])
+    self.assertEqual(transition['lines']['morph'], [[1, 1]])
+    self.assertTrue(transition['subtitle_unchanged'])
@@ -0,0 +1,90 @@
+import importlib.util
+import pickle
+import unittest
+
+import numpy as np
+
+from ebdjango.source.PackedDiagram import PackedManimDiagram, PackedTikzDiagram
+from ebdjango.source.TikzParser import TikzParser
+
+HAS_MANIM = importlib.util.find_spec('manim') is not None
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]
+\tikzstyle{red dot}=[fill=red, draw=black, shape=circle]"""
+
+# Ids containing '.', compass anchors, '.center' ends and coordinate ends
+TIKZ = r"""\begin{pgfonlayer}{nodelayer}
+    \node [style=white square] (n.1) at (-1.5, 0) {$a$};
+    \node [style=red dot] (2) at (1.25, -0.75) {};
+    \node [style=none] (m0) at (0, 1) {m0};
+  \end{pgfonlayer}
+  \begin{pgfonlayer}{edgelayer}
+    \draw (n.1.center) to (2.north east);
+    \draw [in=90, out=-60, looseness=1.25] (2) to (8.25, 2);
+    \draw (-1.5, 0.5) to (n.1.center);
+    \draw [bend left=30] (m0.south west) to (2.center);
+  \end{pgfonlayer}"""
+
+
+def location_tuple(location):
+  return (location.type, location.location)
+
+
+class PackedTikzDiagramTest(unittest.TestCase):
+
+  def setUp(self):
+    self.diagram = TikzParser.parse_tikz_diagram(TIKZ, STYLES)
+
+
+  def assertSameDiagram(self, diagram, packed):
+    unpacked = packed.to_tikz_diagram()
+    self.assertEqual(unpacked.styles, diagram.styles)
+    self.assertEqual([(node.id, node.style, node.label, tuple(node.position)) for node in unpacked.nodes],
+                     [(node.id, node.style, node.label, tuple(node.position)) for node in diagram.nodes])
+    self.assertEqual([(location_tuple(line.start_loc), location_tuple(line.end_loc), line.in_angle, line.out_angle, line.looseness)
+                      for line in unpacked.lines],
+                     [(location_tuple(line.start_loc), location_tuple(line.end_loc), line.in_angle, line.out_angle, line.looseness)
+                      for line in diagram.lines])
+
+
+  def test_binary_round_trip(self):
+    packed = PackedTikzDiagram.from_tikz_diagram(self.diagram)
+    self.assertSameDiagram(self.diagram, PackedTikzDiagram.from_bytes(packed.to_bytes()))
+
+
+  def test_pickle_round_trip(self):
+    packed = PackedTikzDiagram.from_tikz_diagram(self.diagram)
+    self.assertSameDiagram(self.diagram, pickle.loads(pickle.dumps(packed)))
+
+
+  def test_loading_shares_the_buffer(self):
+    buffer = bytearray(PackedTikzDiagram.from_tikz_diagram(self.diagram).to_bytes())
+    packed = PackedTikzDiagram.from_bytes(buffer)
+    self.assertTrue(np.shares_memory(packed.node_positions, np.frombuffer(buffer, dtype=np.uint8)))
+
+
+  def test_rejects_other_kinds(self):
+    data = PackedTikzDiagram.from_tikz_diagram(self.diagram).to_bytes()
+    with self.assertRaises(Exception):
+      PackedManimDiagram.from_bytes(data)
+
+
+@unittest.skipUnless(HAS_MANIM, "needs Manim")
+class PackedManimDiagramTest(unittest.TestCase):
+
+  def test_converter_round_trip(self):
+    from ebdjango.source.TikzToManim import TikzToManimConverter, compile_style_sheet
+
+    style_sheet = compile_style_sheet(STYLES)
+    diagram = TikzParser.parse_tikz_diagram(TIKZ, style_sheet.styles)
+    converter = TikzToManimConverter(diagram, [-6, 6], [-3, 3], style_sheet)
+    restored = TikzToManimConverter.from_packed(PackedManimDiagram.from_bytes(converter.pack().to_bytes()), style_sheet)
+
+    self.assertEqual(restored.scale_factor, converter.scale_factor)
+    self.assertEqual([(node.id, node.label, node.props) for node in restored.nodes],
+                     [(node.id, node.label, node.props) for node in converter.nodes])
+    np.testing.assert_array_equal(restored.node_position_array, converter.node_position_array)
+    self.assertEqual([(line.start_id, line.end_id) for line in restored.lines],
+                     [(line.start_id, line.end_id) for line in converter.lines])
+    np.testing.assert_array_equal(restored.curve_point_array, converter.curve_point_array)
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ebdjango.source.RenderCache import RenderCache, request_key
+
+
+class RenderCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.sources = os.path.join(self.directory, 'sources')
+    os.makedirs(self.sources)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+
+  def cache(self, max_bytes=10 ** 6, max_age=3600) -> RenderCache:
+    return RenderCache(os.path.join(self.directory, 'cache'), max_bytes, max_age)
+
+
+  def source(self, name: str, size: int) -> str:
+    path = os.path.join(self.sources, name)
+    with open(path, 'wb') as source_file:
+      source_file.write(b'x' * size)
+    return path
+
+
+  def age(self, cache: RenderCache, key: str, seconds: float):
+    """Make an entry look last used seconds ago"""
+    then = time.time() - seconds
+    os.utime(cache.path_for_key(key), (then, then))
+
+
+  def test_put_and_get(self):
+    cache = self.cache()
+    key = request_key('styles', ['tikz'], {0: {'subtitle': ''}})
+    cached_path = cache.put(key, self.source('video', 10))
+    self.assertEqual(cache.get(key), cached_path)
+    with open(cached_path, 'rb') as cached_file:
+      self.assertEqual(cached_file.read(), b'x' * 10)
+
+
+  def test_counts_hits_and_misses(self):
+    cache = self.cache()
+    cache.put('aa01', self.source('video', 10))
+    cache.get('aa01')
+    cache.get('aa01')
+    cache.get('bb02')
+    self.assertEqual((cache.hits, cache.misses), (2, 1))
+    # Checking without using an entry counts as neither
+    self.assertTrue(cache.contains('aa01'))
+    self.assertFalse(cache.contains('bb02'))
+    self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'entries': 1, 'bytes': 10})
+
+
+  def test_expired_entry_is_a_miss(self):
+    cache = self.cache(max_age=60)
+    cache.put('aa01', self.source('video', 10))
+    self.age(cache, 'aa01', 120)
+    self.assertFalse(cache.contains('aa01'))
+    self.assertIsNone(cache.get('aa01'))
+    self.assertEqual(cache.misses, 1)
+    self.assertFalse(os.path.exists(cache.path_for_key('aa01')))
+
+
+  def test_evicts_expired_entries(self):
+    cache = self.cache(max_age=60)
+    cache.put('aa01', self.source('old', 10))
+    self.age(cache, 'aa01', 120)
+    cache.put('bb02', self.source('new', 10))
+    self.assertFalse(os.path.exists(cache.path_for_key('aa01')))
+    self.assertTrue(os.path.exists(cache.path_for_key('bb02')))
+
+
+  def test_evicts_least_recently_used_over_max_bytes(self):
+    cache = self.cache(max_bytes=25)
+    for number, key in enumerate(['aa01', 'bb02']):
+      cache.put(key, self.source(key, 10))
+      self.age(cache, key, 100 - number)
+    # Using the older entry makes the other one least recently used
+    cache.get('aa01')
+    cache.put('cc03', self.source('cc03', 10))
+    self.assertTrue(os.path.exists(cache.path_for_key('aa01')))
+    self.assertFalse(os.path.exists(cache.path_for_key('bb02')))
+    self.assertTrue(os.path.exists(cache.path_for_key('cc03')))
+    self.assertEqual(cache.stats()['bytes'], 20)
+
+
+  def test_pinned_entry_survives_eviction(self):
+    cache = self.cache(max_bytes=15)
+    cache.put('aa01', self.source('aa01', 10))
+    pinned_path = cache.pin('aa01', os.path.join(self.directory, 'pinned'))
+    self.age(cache, 'aa01', 100)
+    cache.put('bb02', self.source('bb02', 10))
+    self.assertIsNone(cache.get('aa01'))
+    self.assertEqual(os.path.getsize(pinned_path), 10)
+    self.assertIsNone(cache.pin('aa01', os.path.join(self.directory, 'pinned again')))
+
+
+  def test_request_key_ignores_dictionary_order(self):
+    extra_info = {0: {'subtitle': 'a', 'hold': 1}, 1: {'subtitle': 'b'}}
+    reordered = {1: {'subtitle': 'b'}, 0: {'hold': 1, 'subtitle': 'a'}}
+    self.assertEqual(request_key('styles', ['x', 'y'], extra_info), request_key('styles', ['x', 'y'], reordered))
+    self.assertNotEqual(request_key('styles', ['x', 'y'], extra_info), request_key('styles', ['y', 'x'], extra_info))
+    self.assertNotEqual(request_key('styles', ['x', 'y'], extra_info), request_key('styles', ['x', 'y'], extra_info, 'high'))
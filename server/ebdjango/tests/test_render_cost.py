@@ -0,0 +1,61 @@
+import unittest
+
+from ebdjango.source.RenderCost import InvalidDiagramError, RenderLimits, RequestTooCostlyError, estimate_cost
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]"""
+
+INVALID = r"""\begin{pgfonlayer}{nodelayer}
+    \node [style=white square] (0) at (a, b) {};
+  \end{pgfonlayer}"""
+
+
+def diagram_with_nodes(count):
+  nodes = ''.join(f"\n    \\node [style=white square] ({i}) at ({i}, 0) {{${i}$}};" for i in range(count))
+  return r"""\begin{pgfonlayer}{nodelayer}%s
+  \end{pgfonlayer}""" % nodes
+
+
+def extra_info_for(tikz_contents_list):
+  return {index: {'subtitle': ''} for index in range(len(tikz_contents_list))}
+
+
+class EstimateCostTest(unittest.TestCase):
+
+  def estimate(self, tikz_contents_list, limits=None):
+    return estimate_cost(STYLES, tikz_contents_list, extra_info_for(tikz_contents_list), limits=limits)
+
+
+  def test_counts_nodes_and_labels(self):
+    cost = self.estimate([diagram_with_nodes(3), diagram_with_nodes(4)])
+    self.assertEqual((cost.diagrams, cost.nodes, cost.labels), (2, 7, 4))
+
+
+  def test_invalid_diagram(self):
+    with self.assertRaises(InvalidDiagramError):
+      self.estimate([diagram_with_nodes(1), INVALID])
+
+
+  def test_too_many_diagrams_are_refused_before_parsing(self):
+    with self.assertRaises(RequestTooCostlyError) as context:
+      self.estimate([INVALID] * 3, RenderLimits(max_diagrams=2))
+    self.assertIsNone(context.exception.cost)
+    self.assertEqual(context.exception.exceeded, {'diagrams': (3, 2)})
+
+
+  def test_too_many_bytes_are_refused_before_parsing(self):
+    with self.assertRaises(RequestTooCostlyError) as context:
+      self.estimate([INVALID], RenderLimits(max_input_bytes=10))
+    self.assertIn('input_bytes', context.exception.exceeded)
+
+
+  def test_parsing_stops_once_over_max_nodes(self):
+    # The invalid diagram after the limit is passed is never parsed
+    with self.assertRaises(RequestTooCostlyError) as context:
+      self.estimate([diagram_with_nodes(3), diagram_with_nodes(3), INVALID], RenderLimits(max_nodes=5))
+    self.assertEqual(context.exception.exceeded, {'nodes': (6, 5)})
+
+
+  def test_within_limits(self):
+    limits = RenderLimits(max_diagrams=2, max_nodes=7, max_input_bytes=10000)
+    self.assertEqual(self.estimate([diagram_with_nodes(3), diagram_with_nodes(4)], limits).nodes, 7)
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import Future
+
+from ebdjango.source.RenderCache import RenderCache
+from ebdjango.source.RenderJobs import FAILED, QUEUED, RUNNING, JobStore, RenderJobQueue
+
+STYLES = r"""
+\tikzstyle{white square}=[fill=white, draw=black, shape=rectangle]"""
+
+
+def diagram_at(x):
+  return r"""\begin{pgfonlayer}{nodelayer}
+    \node [style=white square] (0) at (%s, 0) {$a$};
+  \end{pgfonlayer}""" % x
+
+
+class QueuedPool():
+  """Holds submitted tasks until the test runs them, like a pool whose workers are all busy"""
+
+  def __init__(self) -> None:
+    self.tasks = []
+
+  def submit_for(self, client, cost, fn, *args, **kwargs) -> Future:
+    future = Future()
+    self.tasks.append((future, fn, args, kwargs))
+    return future
+
+
+class JobStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.job_store = JobStore(f"{self.directory}/jobs")
+
+  def tearDown(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+
+  def test_concurrent_writes_are_not_lost(self):
+    self.job_store.write('job', status=QUEUED)
+
+    def write_fields(writer):
+      for number in range(20):
+        self.job_store.write('job', **{f"field-{writer}-{number}": number})
+
+    writers = [threading.Thread(target=write_fields, args=(writer,)) for writer in range(8)]
+    for writer in writers: writer.start()
+    for writer in writers: writer.join()
+    job = self.job_store.read('job')
+    self.assertEqual(len([name for name in job if name.startswith('field-')]), 8 * 20)
+
+
+  def test_task_starting_late_leaves_failed_job(self):
+    self.job_store.write('job', status=QUEUED)
+    self.assertTrue(self.job_store.start('job'))
+    self.assertEqual(self.job_store.read('job')['status'], RUNNING)
+    self.job_store.write('job', status=FAILED)
+    self.assertFalse(self.job_store.start('job'))
+    self.assertEqual(self.job_store.read('job')['status'], FAILED)
+
+
+class ParallelJobTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.job_store = JobStore(f"{self.directory}/jobs")
+    self.pool = QueuedPool()
+    self.queue = RenderJobQueue(self.job_store, RenderCache(f"{self.directory}/renders", 10 ** 9, 3600),
+                                RenderCache(f"{self.directory}/segments", 10 ** 9, 3600), f"{self.directory}/workspaces",
+                                f"{self.directory}/labels", self.pool, max_queued=10)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+
+  def test_failed_segment_fails_the_job(self):
+    tikz_contents_list = [diagram_at(0), diagram_at(1), diagram_at(2)]
+    job = self.queue.submit(STYLES, tikz_contents_list, {index: {'subtitle': ''} for index in range(3)})
+    self.assertEqual(job['status'], QUEUED)
+    self.assertEqual(len(self.pool.tasks), 5)
+
+    first_future = self.pool.tasks[0][0]
+    first_future.set_running_or_notify_cancel()
+    first_future.set_exception(Exception("Segment failed"))
+
+    # Tasks still waiting for a worker are skipped, as the pool does for cancelled tasks
+    for future, fn, args, kwargs in self.pool.tasks[1:]:
+      self.assertFalse(future.set_running_or_notify_cancel())
+    job = self.job_store.read(job['id'])
+    self.assertEqual(job['status'], FAILED)
+    self.assertEqual(job['error'], "Segment failed")
+    # Nothing is left to read the segments pinned for the join
+    self.assertEqual(os.listdir(f"{self.directory}/workspaces"), [])
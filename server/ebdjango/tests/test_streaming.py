@@ -0,0 +1,107 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from django.test import RequestFactory
+
+from ebdjango.source.RenderSegments import hls_playlist
+from ebdjango.views import file_response, parse_range, read_range
+
+
+class ParseRangeTest(unittest.TestCase):
+
+  def test_whole_file(self):
+    for header in ['', 'bytes=-', 'items=0-10', 'bytes=0-1,4-5', 'bytes=a-b']:
+      self.assertIsNone(parse_range(header, 100), header)
+
+
+  def test_ranges(self):
+    self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+    self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+    # Ends past the file are cut short, and suffix ranges are the last bytes
+    self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+    self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+    self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+
+
+  def test_unsatisfiable(self):
+    for header in ['bytes=100-', 'bytes=100-200', 'bytes=10-5']:
+      with self.assertRaises(ValueError):
+        parse_range(header, 100)
+
+
+  def test_read_range(self):
+    data = bytes(range(256)) * 1024
+    source = io.BytesIO(data)
+    self.assertEqual(b''.join(read_range(source, 1000, 100000)), data[1000:101000])
+    self.assertTrue(source.closed)
+
+
+class FileResponseTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'video.mp4')
+    self.data = bytes(range(256)) * 4
+    with open(self.path, 'wb') as video_file:
+      video_file.write(self.data)
+    self.factory = RequestFactory()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+
+  def respond(self, **headers):
+    response = file_response(self.factory.get('/', **headers), self.path, 'video/mp4')
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    response.close()
+    return response, body
+
+
+  def test_whole_file(self):
+    response, body = self.respond()
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response['Accept-Ranges'], 'bytes')
+    self.assertEqual(body, self.data)
+
+
+  def test_partial_content(self):
+    response, body = self.respond(HTTP_RANGE='bytes=10-19')
+    self.assertEqual(response.status_code, 206)
+    self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+    self.assertEqual(response['Content-Length'], '10')
+    self.assertEqual(body, self.data[10:20])
+
+
+  def test_range_not_satisfiable(self):
+    response, _ = self.respond(HTTP_RANGE=f'bytes={len(self.data)}-')
+    self.assertEqual(response.status_code, 416)
+    self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+
+class HlsPlaylistTest(unittest.TestCase):
+
+  def test_partial_playlist(self):
+    playlist = hls_playlist([1, 0.5, 1], 2, lambda number: f'{number}.ts', complete=False)
+    self.assertEqual(playlist.splitlines(), [
+      '#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-TARGETDURATION:1', '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:EVENT',
+      '#EXTINF:1.000,', '0.ts',
+      '#EXT-X-DISCONTINUITY', '#EXTINF:0.500,', '1.ts',
+    ])
+
+
+  def test_complete_playlist(self):
+    playlist = hls_playlist([1.5, 1], 2, lambda number: f'{number}.ts', complete=True)
+    lines = playlist.splitlines()
+    # The target duration covers the longest segment, rounded up
+    self.assertIn('#EXT-X-TARGETDURATION:2', lines)
+    self.assertEqual(lines[-1], '#EXT-X-ENDLIST')
+    self.assertEqual([line for line in lines if line.endswith('.ts')], ['0.ts', '1.ts'])
+
+
+  def test_nothing_ready(self):
+    playlist = hls_playlist([1, 1], 0, lambda number: f'{number}.ts', complete=False)
+    self.assertNotIn('#EXTINF', playlist)
+    self.assertNotIn('#EXT-X-ENDLIST', playlist)
@@ -0,0 +1,89 @@
+import unittest
+
+from ebdjango.source.TransitionPlanner import line_keys, plan_line_transitions, plan_node_transitions
+
+
+class LineKeysTest(unittest.TestCase):
+
+  def test_numbers_parallel_edges(self):
+    self.assertEqual(line_keys([('a', 'b'), ('a', 'c'), ('a', 'b'), ('a', 'b')]),
+                     [('a', 'b', 0), ('a', 'c', 0), ('a', 'b', 1), ('a', 'b', 2)])
+
+
+  def test_reversed_edge_is_a_different_pair(self):
+    self.assertEqual(line_keys([('a', 'b'), ('b', 'a')]), [('a', 'b', 0), ('b', 'a', 0)])
+
+
+class PlanLineTransitionsTest(unittest.TestCase):
+
+  def test_parallel_edges_are_all_kept(self):
+    keys = line_keys([('a', 'b'), ('a', 'b'), ('a', 'b')])
+    plan = plan_line_transitions(keys, keys)
+    self.assertEqual(plan.kept, [(key, key) for key in keys])
+    self.assertEqual((plan.matched, plan.removed, plan.added), ([], [], []))
+
+
+  def test_removed_parallel_edge(self):
+    # The last of the parallel edges goes, whichever one it was drawn as
+    plan = plan_line_transitions(line_keys([('a', 'b'), ('a', 'b')]), line_keys([('a', 'b')]))
+    self.assertEqual(plan.kept, [(('a', 'b', 0), ('a', 'b', 0))])
+    self.assertEqual(plan.removed, [('a', 'b', 1)])
+    self.assertEqual(plan.added, [])
+
+
+  def test_added_parallel_edge(self):
+    plan = plan_line_transitions(line_keys([('a', 'b')]), line_keys([('a', 'b'), ('a', 'b')]))
+    self.assertEqual(plan.kept, [(('a', 'b', 0), ('a', 'b', 0))])
+    self.assertEqual(plan.added, [('a', 'b', 1)])
+    self.assertEqual(plan.removed, [])
+
+
+  def test_matches_by_start_before_end(self):
+    # a-b can become a-c (same start) or c-b (same end); the start wins
+    plan = plan_line_transitions([('a', 'b', 0)], [('c', 'b', 0), ('a', 'c', 0)])
+    self.assertEqual(plan.matched, [(('a', 'b', 0), ('a', 'c', 0))])
+    self.assertEqual(plan.added, [('c', 'b', 0)])
+
+
+  def test_matches_by_end(self):
+    plan = plan_line_transitions([('a', 'b', 0)], [('c', 'b', 0)])
+    self.assertEqual(plan.matched, [(('a', 'b', 0), ('c', 'b', 0))])
+    self.assertEqual((plan.removed, plan.added), ([], []))
+
+
+  def test_new_line_is_matched_once(self):
+    # Both old lines start at a, but only the first takes the one new line starting there
+    plan = plan_line_transitions([('a', 'b', 0), ('a', 'c', 0)], [('a', 'd', 0)])
+    self.assertEqual(plan.matched, [(('a', 'b', 0), ('a', 'd', 0))])
+    self.assertEqual(plan.removed, [('a', 'c', 0)])
+    self.assertEqual(plan.added, [])
+
+
+  def test_reversed_edge_fades_out_and_is_created(self):
+    # Neither endpoint is in the same place, so the old line doesn't transform into the new one
+    plan = plan_line_transitions([('a', 'b', 0)], [('b', 'a', 0)])
+    self.assertEqual((plan.kept, plan.matched), ([], []))
+    self.assertEqual(plan.removed, [('a', 'b', 0)])
+    self.assertEqual(plan.added, [('b', 'a', 0)])
+
+
+  def test_reversed_edge_matches_a_line_sharing_an_endpoint(self):
+    plan = plan_line_transitions([('a', 'b', 0)], [('b', 'a', 0), ('a', 'c', 0)])
+    self.assertEqual(plan.matched, [(('a', 'b', 0), ('a', 'c', 0))])
+    self.assertEqual(plan.added, [('b', 'a', 0)])
+
+
+  def test_added_and_removed_lines(self):
+    plan = plan_line_transitions([('a', 'b', 0), ('c', 'd', 0)], [('a', 'b', 0), ('e', 'f', 0)])
+    self.assertEqual(plan.kept, [(('a', 'b', 0), ('a', 'b', 0))])
+    self.assertEqual(plan.removed, [('c', 'd', 0)])
+    self.assertEqual(plan.added, [('e', 'f', 0)])
+
+
+class PlanNodeTransitionsTest(unittest.TestCase):
+
+  def test_nodes_match_by_id(self):
+    plan = plan_node_transitions(['a', 'b', 'c'], ['c', 'd', 'a'])
+    self.assertEqual(plan.kept, [('a', 'a'), ('c', 'c')])
+    self.assertEqual(plan.removed, ['b'])
+    self.assertEqual(plan.added, ['d'])
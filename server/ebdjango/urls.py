@@ -21,5 +21,14 @@ from ebdjango import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('test/', views.test),
-    path('health-check/', views.health_check)
+    path('keyframes/', views.keyframes),
+    path('jobs/', views.submit_job),
+    path('batches/', views.submit_batch),
+    path('batches/<uuid:batch_id>/', views.batch_status, name='batch-status'),
+    path('jobs/<uuid:job_id>/', views.job_status, name='job-status'),
+    path('jobs/<uuid:job_id>/result/', views.job_result, name='job-result'),
+    path('jobs/<uuid:job_id>/playlist.m3u8', views.job_playlist, name='job-playlist'),
+    path('jobs/<uuid:job_id>/segments/<int:number>.ts', views.job_segment, name='job-segment'),
+    path('health-check/', views.health_check),
+    path('metrics/', views.metrics)
 ]
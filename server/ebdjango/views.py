@@ -1,10 +1,222 @@
 from rest_framework.decorators import api_view
-from wsgiref.util import FileWrapper
-from django.http import HttpResponse, JsonResponse
-from .source.RunDiagramAnim import render_animation
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from .source.RenderCache import RenderCache, request_key
+from .source.RenderCost import InvalidDiagramError, RenderLimits, RequestTooCostlyError
+from .source.RenderJobs import (DONE, FAILED, BatchTooLargeError, JobStore, QueueFullError, RenderBatches, RenderJobQueue,
+                                render_in_parallel)
+from .source.RenderQuality import DEFAULT_QUALITY, UnknownQualityError, get_quality
+from .source.RenderSegments import hls_playlist, transport_stream
+from .source.RenderWorkers import RenderWorkerPool
+from .source.Timing import add_spans, collect_spans, observe, prometheus_metrics, server_timing
+from .source.Workspace import render_workspace
+import functools
 import logging
+import os
+import re
+import time
+
+# Finished animations keyed by request, so repeated requests skip Manim entirely
+render_cache = RenderCache(settings.RENDER_CACHE_DIR, settings.RENDER_CACHE_MAX_BYTES, settings.RENDER_CACHE_MAX_AGE)
+
+# Each hold and transition, so an edited animation only re-renders the segments which changed
+segment_cache = RenderCache(settings.RENDER_SEGMENT_CACHE_DIR, settings.RENDER_SEGMENT_CACHE_MAX_BYTES,
+                            settings.RENDER_SEGMENT_CACHE_MAX_AGE)
+
+# The same segments remuxed to MPEG-TS for HLS streaming, made on first request
+stream_cache = RenderCache(settings.RENDER_SEGMENT_CACHE_DIR, settings.RENDER_STREAM_CACHE_MAX_BYTES,
+                           settings.RENDER_SEGMENT_CACHE_MAX_AGE, suffix='.ts')
+
+# Asynchronous renders run on a pool of warm worker processes, separate from the web workers
+render_workers = RenderWorkerPool(settings.RENDER_WORKERS, max_jobs=settings.RENDER_WORKER_MAX_JOBS,
+                                  max_memory=settings.RENDER_WORKER_MAX_MEMORY)
+render_jobs = RenderJobQueue(JobStore(settings.RENDER_JOBS_DIR), render_cache, segment_cache, settings.RENDER_WORKSPACE_ROOT,
+                             settings.LABEL_CACHE_DIR, render_workers, max_queued=settings.RENDER_QUEUE_LIMIT,
+                             parallel=settings.RENDER_PARALLEL,
+                             limits=RenderLimits(max_diagrams=settings.RENDER_MAX_DIAGRAMS, max_nodes=settings.RENDER_MAX_NODES,
+                                                 max_frames=settings.RENDER_MAX_FRAMES, max_labels=settings.RENDER_MAX_LABELS,
+                                                 max_cost=settings.RENDER_MAX_COST,
+                                                 max_input_bytes=settings.RENDER_MAX_INPUT_BYTES))
+render_batches = RenderBatches(JobStore(settings.RENDER_BATCHES_DIR), render_jobs, max_sequences=settings.RENDER_BATCH_LIMIT)
+
+
+def parse_render_request(data):
+    """Split request data into styles, TikZ inputs, extra info for each diagram, and quality tier
+
+    Raises UnknownQualityError if the request asks for a quality tier which does not exist"""
+    styles = data['stylesInput']
+    tikz_inputs = [diagram['tikz'] for diagram in data['diagrams'].values()]
+    extra_info = {int(id): {key: value for key, value in diagram.items() if key != 'tikz'} for id, diagram in data['diagrams'].items()}
+    quality = get_quality(data.get('quality', DEFAULT_QUALITY)).name
+    return styles, tikz_inputs, extra_info, quality
+
+
+def client_id(request):
+    """Who a request is from, for sharing the render workers fairly
+
+    X-Forwarded-For is only believed from a proxy in TRUSTED_PROXIES, as anyone else can send
+    it. Each proxy appends the address it saw, so the last entry not added by a trusted proxy
+    is the client, and the entries before it may be forged"""
+    address = request.META.get('REMOTE_ADDR')
+    if address not in settings.TRUSTED_PROXIES:
+        return address
+    forwarded_for = [entry.strip() for entry in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if entry.strip()]
+    while forwarded_for and address in settings.TRUSTED_PROXIES:
+        address = forwarded_for.pop()
+    return address
+
+
+def too_costly_response(error):
+    body = {"error": str(error), "limits": {name: limit for name, (_, limit) in error.exceeded.items()}}
+    # Requests refused before they were all parsed have no estimate
+    if error.cost is not None:
+        body["estimate"] = error.cost.summary()
+    return JsonResponse(body, status=413)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(range_header, size):
+    """Return the (start, end) byte positions of a single-range Range header, end inclusive
+
+    Returns None to send the whole file, or raises ValueError if the range can't be satisfied"""
+    match = RANGE_PATTERN.match(range_header.strip())
+    # Missing, malformed and multi-part ranges are answered with the whole file
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range - the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(range_header)
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk: break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+class TimedDelivery:
+    """Records how long a response takes from being created until the server has sent it"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delivery_start = time.perf_counter()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            observe('deliver', time.perf_counter() - self.delivery_start)
+
+
+class TimedFileResponse(TimedDelivery, FileResponse):
+    pass
+
+
+class TimedStreamingResponse(TimedDelivery, StreamingHttpResponse):
+    pass
+
+
+def with_server_timing(view):
+    """Add a Server-Timing header with the time spent in each stage while handling the request"""
+    @functools.wraps(view)
+    def timed_view(request, *args, **kwargs):
+        with collect_spans() as spans:
+            response = view(request, *args, **kwargs)
+        if spans:
+            response['Server-Timing'] = server_timing(spans)
+        return response
+    return timed_view
+
+
+def file_response(request, path, content_type):
+    """Stream a file, honouring Range requests with 206 Partial Content so players can seek"""
+    size = os.path.getsize(path)
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = TimedFileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = TimedStreamingResponse(read_range(open(path, 'rb'), start, end - start + 1), status=206,
+                                          content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def video_response(request, video_path):
+    response = file_response(request, video_path, 'video/mp4')
+    response['Content-Disposition'] = 'attachment; filename=animation.mp4'
+    return response
+
+
+def job_body(job):
+    body = {key: job[key] for key in ['id', 'status', 'quality', 'cost'] if key in job}
+    if 'error' in job:
+        body['error'] = job['error']
+    body['status_url'] = reverse('job-status', args=[job['id']])
+    if 'segments' in job:
+        body['playlist_url'] = reverse('job-playlist', args=[job['id']])
+    if job['status'] == DONE:
+        body['result_url'] = reverse('job-result', args=[job['id']])
+    return body
+
+
+def job_response(job, status=200):
+    return JsonResponse(job_body(job), status=status)
+
+
+def batch_response(batch, status=200):
+    body = {key: batch[key] for key in ['id', 'status', 'quality', 'counts'] if key in batch}
+    body['status_url'] = reverse('batch-status', args=[batch['id']])
+    body['jobs'] = [{'name': entry['name'], **job_body(entry['job'])} for entry in batch['jobs']]
+    return JsonResponse(body, status=status)
+
+
+def render_and_cache(key, styles, tikz_inputs, extra_info, quality, client=None, cost=None):
+    """Render an animation while the request waits, returning its path in the render cache"""
+    if settings.RENDER_PARALLEL:
+        # Segments are spread over the worker pool, and this thread just waits for them
+        future = render_in_parallel(render_workers, key, render_cache, segment_cache, settings.RENDER_WORKSPACE_ROOT,
+                                    settings.LABEL_CACHE_DIR, styles, tikz_inputs, extra_info, quality, client=client, cost=cost)
+        video_path = future.result()
+        add_spans(future.spans)
+        return video_path
+
+    # Imported here so cache hits never pay for importing Manim
+    from .source.RunDiagramAnim import render_animation_segmented
+    with render_workspace(settings.RENDER_WORKSPACE_ROOT) as workspace:
+        output_path = render_animation_segmented('tikzit', styles, tikz_inputs, extra_info, segment_cache,
+                                                 media_dir=workspace, label_dir=settings.LABEL_CACHE_DIR, quality=quality)
+        return render_cache.put(key, output_path)
+
 
 @api_view(['POST'])
+@with_server_timing
 def test(request):
     # try:
     #     logging.basicConfig(filename="/opt/python/python_log.log",
@@ -21,23 +233,184 @@ def test(request):
         # except Exception as error:
         #     return JsonResponse({"status": "OK", "error": str(error)}, status=200)
         
-        styles = request.data['stylesInput']
-        tikz_inputs = [diagram['tikz'] for diagram in request.data['diagrams'].values()]
-        extra_info = {int(id): {key: value for key, value in diagram.items() if key != 'tikz'} for id, diagram in request.data['diagrams'].items()}
         try:
-            render_animation('tikzit', styles, tikz_inputs, extra_info)
-        except Exception as error:
-            print("Error:", error)
-            return JsonResponse({"error": str(error)}, status=500)
-            
-        file = FileWrapper(open('./media/videos/480p15/DiagramScene.mp4', 'rb'))
-        response = HttpResponse(file, content_type='video/mp4')
-        response['Content-Disposition'] = 'attachment; filename=animation.mp4'
-        print("Ready to return response")
+            styles, tikz_inputs, extra_info, quality = parse_render_request(request.data)
+        except UnknownQualityError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        key = request_key(styles, tikz_inputs, extra_info, quality)
+        video_path = render_cache.get(key)
+        cache_status = 'hit' if video_path else 'miss'
+        if video_path is None:
+            try:
+                cost = render_jobs.estimate(styles, tikz_inputs, extra_info, quality)
+            except RequestTooCostlyError as error:
+                return too_costly_response(error)
+            except InvalidDiagramError as error:
+                return JsonResponse({"error": str(error)}, status=400)
+            try:
+                # Renders which requests wait on share the job queue's bound, so they can't pile up without limit
+                with render_jobs.reserve():
+                    video_path = render_and_cache(key, styles, tikz_inputs, extra_info, quality, client_id(request), cost)
+            except QueueFullError as error:
+                response = JsonResponse({"error": str(error)}, status=503)
+                response['Retry-After'] = '10'
+                return response
+            except Exception as error:
+                print("Error:", error)
+                return JsonResponse({"error": str(error)}, status=500)
+
+        response = video_response(request, video_path)
+        response['X-Render-Cache'] = cache_status
         return response
     
 
+@api_view(['POST'])
+def submit_job(request):
+    """Queue a render and return its job id straight away"""
+    try:
+        styles, tikz_inputs, extra_info, quality = parse_render_request(request.data)
+    except UnknownQualityError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    try:
+        job = render_jobs.submit(styles, tikz_inputs, extra_info, quality, client=client_id(request))
+    except RequestTooCostlyError as error:
+        return too_costly_response(error)
+    except InvalidDiagramError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    except QueueFullError as error:
+        response = JsonResponse({"error": str(error)}, status=503)
+        response['Retry-After'] = '10'
+        return response
+    return job_response(job, status=202)
+
+
+@api_view(['POST'])
+def submit_batch(request):
+    """Queue many sequences which share one style sheet, returning the batch manifest straight away
+
+    Each sequence is a {"name", "diagrams"} object, with diagrams as in a single render request"""
+    data = request.data
+    try:
+        styles = data['stylesInput']
+        quality = get_quality(data.get('quality', DEFAULT_QUALITY)).name
+        sequences = []
+        for number, sequence in enumerate(data['sequences']):
+            _, tikz_inputs, extra_info, _ = parse_render_request({'stylesInput': styles, 'diagrams': sequence['diagrams']})
+            sequences.append((str(sequence.get('name', number)), tikz_inputs, extra_info))
+        batch = render_batches.submit(styles, sequences, quality, client=client_id(request))
+    except (UnknownQualityError, BatchTooLargeError, InvalidDiagramError) as error:
+        return JsonResponse({"error": str(error)}, status=400)
+    except RequestTooCostlyError as error:
+        return too_costly_response(error)
+    except (KeyError, TypeError, ValueError) as error:
+        return JsonResponse({"error": f"Malformed batch: {error}"}, status=400)
+    return batch_response(render_batches.status(batch['id']), status=202)
+
+
+@api_view(['GET'])
+def batch_status(request, batch_id):
+    """The batch manifest, with each job's result as soon as it is done"""
+    batch = render_batches.status(str(batch_id))
+    if batch is None:
+        return JsonResponse({"error": "Unknown batch"}, status=404)
+    return batch_response(batch)
+
+
+@api_view(['GET'])
+def job_status(request, job_id):
+    job = render_jobs.status(str(job_id))
+    if job is None:
+        return JsonResponse({"error": "Unknown job"}, status=404)
+    return job_response(job)
+
+
+@api_view(['GET'])
+@with_server_timing
+def job_result(request, job_id):
+    job = render_jobs.status(str(job_id))
+    if job is None:
+        return JsonResponse({"error": "Unknown job"}, status=404)
+    if job['status'] != DONE:
+        return JsonResponse({"error": "Job is not finished", "status": job['status']}, status=409)
+    video_path = render_jobs.result_path(str(job_id))
+    if video_path is None:
+        return JsonResponse({"error": "Result has expired from the cache"}, status=410)
+    return video_response(request, video_path)
+
+
+@api_view(['GET'])
+def job_playlist(request, job_id):
+    """HLS playlist of a job's finished segments, so playback can start before the whole job is done"""
+    job = render_jobs.status(str(job_id))
+    if job is None or 'segments' not in job:
+        return JsonResponse({"error": "Unknown job"}, status=404)
+    durations = [duration for _, duration in job['segments']]
+    ready_count = render_jobs.ready_segments(job)
+    complete = ready_count == len(durations) or job['status'] == FAILED
+    playlist = hls_playlist(durations, ready_count, lambda number: reverse('job-segment', args=[job['id'], number]), complete)
+    response = HttpResponse(playlist, content_type='application/vnd.apple.mpegurl')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+@api_view(['GET'])
+@with_server_timing
+def job_segment(request, job_id, number):
+    """One finished segment of a job as MPEG-TS"""
+    job = render_jobs.status(str(job_id))
+    if job is None:
+        return JsonResponse({"error": "Unknown job"}, status=404)
+    segment_path = render_jobs.segment_path(job, number)
+    if segment_path is None:
+        return JsonResponse({"error": "Segment is not ready"}, status=404)
+
+    segment_key = job['segments'][number][0]
+    stream_path = stream_cache.get(segment_key)
+    if stream_path is None:
+        with render_workspace(settings.RENDER_WORKSPACE_ROOT) as workspace:
+            try:
+                output_path = transport_stream(segment_path, os.path.join(workspace, 'segment.ts'))
+            except Exception as error:
+                print("Error:", error)
+                return JsonResponse({"error": str(error)}, status=500)
+            stream_path = stream_cache.put(segment_key, output_path)
+    return file_response(request, stream_path, 'video/mp2t')
+
+
+@api_view(['POST'])
+@with_server_timing
+def keyframes(request):
+    """Return an animation as keyframes for the browser to play, without rendering any video"""
+    try:
+        styles, tikz_inputs, extra_info, quality = parse_render_request(request.data)
+    except UnknownQualityError as error:
+        return JsonResponse({"error": str(error)}, status=400)
+
+    # Imported here so the other endpoints never pay for importing Manim
+    from .source.Keyframes import export_keyframes
+    try:
+        document = export_keyframes(styles, tikz_inputs, extra_info, quality,
+                                    diagram_dir=os.path.join(settings.LABEL_CACHE_DIR, 'diagrams'))
+    except Exception as error:
+        print("Error:", error)
+        return JsonResponse({"error": str(error)}, status=500)
+    return JsonResponse(document)
+
+
 @api_view(['GET'])
 def health_check(request):
     return JsonResponse({"status": "OK"}, status=200)
+
+
+@api_view(['GET'])
+def metrics(request):
+    """Stage timings and cache hit rates of this process, in the Prometheus text format"""
+    lines = []
+    for metric, help_text in [('hits', 'Requests served from a cache'), ('misses', 'Requests not found in a cache')]:
+        lines += [f'# HELP render_cache_{metric}_total {help_text}', f'# TYPE render_cache_{metric}_total counter']
+        for cache_name, cache in [('render', render_cache), ('segment', segment_cache), ('stream', stream_cache)]:
+            lines.append(f'render_cache_{metric}_total{{cache="{cache_name}"}} {getattr(cache, metric)}')
+    body = prometheus_metrics() + '\n'.join(lines) + '\n'
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
         
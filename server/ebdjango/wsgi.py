@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ebdjango.settings')
 
 application = get_wsgi_application()
+
+# Warm the render workers now rather than on the first render request.
+# Each web process has its own pool, so settings.RENDER_WORKERS is per web process
+from ebdjango.views import render_jobs
+render_jobs.start()